@@ -0,0 +1,226 @@
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional
+
+# Longest a request may wait for an upstream call before it is turned away
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT_MS", "2000")) / 1000
+
+
+class Overloaded(Exception):
+    """An upstream call could not be admitted within the deadline (answered with 429)."""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"{upstream} is overloaded, retry in {retry_after:.1f}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Calls/minute bucket that hands out reservations: callers learn how long
+    to wait before they take a token, and the level may go negative so later
+    callers wait behind earlier ones. Not thread-safe on its own.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self._last = time.monotonic()
+
+    def wait_time(self, now: float) -> float:
+        self.level = min(self.capacity, self.level + (now - self._last) * self.rate)
+        self._last = now
+        return max(0.0, (1.0 - self.level) / self.rate)
+
+    def take(self):
+        self.level -= 1.0
+
+
+class _Waiter:
+    __slots__ = ("event", "granted")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class Admission:
+    """
+    Admission control in front of one upstream (embeddings, chat, Convex).
+
+    At most max_concurrency calls run at once, at most tenant_concurrency of
+    them for one tenant, optionally rate limited globally and per tenant.
+    Callers that cannot start right away queue per tenant, and freed slots
+    go to tenants in round-robin order, so a burst from one tenant waits
+    behind its own calls rather than everyone's. A caller whose expected
+    wait (queue length times recent call duration, or the rate limit)
+    exceeds max_wait is rejected at once with Overloaded, and so is one
+    still queued when max_wait runs out.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 16,
+        tenant_concurrency: int = 4,
+        rpm: Optional[float] = None,
+        tenant_rpm: Optional[float] = None,
+        max_wait: float = ADMISSION_MAX_WAIT,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.tenant_concurrency = tenant_concurrency
+        self.tenant_rpm = tenant_rpm
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._active = 0
+        self._tenant_active: Dict[str, int] = {}
+        # Tenants with queued callers, in round-robin order
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._waiting = 0
+        self._bucket = TokenBucket(rpm) if rpm else None
+        self._tenant_buckets: Dict[str, TokenBucket] = {}
+        # Moving average of how long a call holds its slot
+        self._service = 0.5
+        self._queue_times: Deque[float] = deque(maxlen=1024)
+        self.admitted = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str, max_concurrency: int, tenant_concurrency: int) -> "Admission":
+        """Limits from <prefix>_CONCURRENCY, _TENANT_CONCURRENCY, _RPM and _TENANT_RPM (0 = unlimited)."""
+        def env(key: str, default: float) -> float:
+            return float(os.getenv(f"{prefix}_{key}", str(default)))
+
+        return cls(
+            name,
+            max_concurrency=int(env("CONCURRENCY", max_concurrency)),
+            tenant_concurrency=int(env("TENANT_CONCURRENCY", tenant_concurrency)),
+            rpm=env("RPM", 0) or None,
+            tenant_rpm=env("TENANT_RPM", 0) or None,
+        )
+
+    def _buckets(self, tenant: str):
+        if self._bucket:
+            yield self._bucket
+        if self.tenant_rpm:
+            bucket = self._tenant_buckets.get(tenant)
+            if bucket is None:
+                bucket = self._tenant_buckets[tenant] = TokenBucket(self.tenant_rpm)
+            yield bucket
+
+    def _rate_wait(self, tenant: str) -> float:
+        now = time.monotonic()
+        return max((b.wait_time(now) for b in self._buckets(tenant)), default=0.0)
+
+    def _expected_wait(self, tenant: str) -> float:
+        """Rough wait for a new caller: its place in the global and its tenant's queue."""
+        ahead = len(self._queues.get(tenant, ())) + 1
+        return self._service * max((self._waiting + 1) / self.max_concurrency, ahead / self.tenant_concurrency)
+
+    def _reject(self, retry_after: float):
+        self.rejected += 1
+        raise Overloaded(self.name, retry_after)
+
+    def _grant(self, tenant: str):
+        self._active += 1
+        self._tenant_active[tenant] = self._tenant_active.get(tenant, 0) + 1
+
+    def _dispatch(self):
+        """Hand free slots to queued callers, one tenant at a time in turn."""
+        while self._active < self.max_concurrency:
+            tenant = next(
+                (t for t in self._queues if self._tenant_active.get(t, 0) < self.tenant_concurrency), None
+            )
+            if tenant is None:
+                return
+            q = self._queues.pop(tenant)
+            waiter = q.popleft()
+            if q:
+                # Back of the round
+                self._queues[tenant] = q
+            self._waiting -= 1
+            self._grant(tenant)
+            waiter.granted = True
+            waiter.event.set()
+
+    @contextmanager
+    def slot(self, tenant: str, reject: bool = True) -> Iterator[None]:
+        """
+        Hold a slot for one upstream call. With reject=False (background
+        work such as ingestion) the caller waits as long as it takes instead
+        of being turned away.
+        """
+        start = time.monotonic()
+        waiter = None
+        with self._lock:
+            rate_wait = self._rate_wait(tenant)
+            if reject and rate_wait > self.max_wait:
+                self._reject(rate_wait)
+            if (
+                self._active < self.max_concurrency
+                and self._tenant_active.get(tenant, 0) < self.tenant_concurrency
+                and tenant not in self._queues
+            ):
+                self._grant(tenant)
+            else:
+                expected = self._expected_wait(tenant)
+                if reject and expected > self.max_wait:
+                    self._reject(expected)
+                waiter = _Waiter()
+                self._queues.setdefault(tenant, deque()).append(waiter)
+                self._waiting += 1
+
+        if waiter is not None:
+            waiter.event.wait(self.max_wait if reject else None)
+            with self._lock:
+                if not waiter.granted:
+                    q = self._queues[tenant]
+                    q.remove(waiter)
+                    if not q:
+                        del self._queues[tenant]
+                    self._waiting -= 1
+                    self._reject(self._expected_wait(tenant))
+
+        started = time.monotonic()
+        try:
+            with self._lock:
+                rate_wait = self._rate_wait(tenant)
+                for bucket in self._buckets(tenant):
+                    bucket.take()
+            if rate_wait:
+                time.sleep(rate_wait)
+            started = time.monotonic()
+            with self._lock:
+                self.admitted += 1
+                self._queue_times.append(started - start)
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._tenant_active[tenant] -= 1
+                if not self._tenant_active[tenant]:
+                    del self._tenant_active[tenant]
+                self._service = 0.9 * self._service + 0.1 * (time.monotonic() - started)
+                self._dispatch()
+
+    def stats(self) -> dict:
+        with self._lock:
+            times = sorted(self._queue_times)
+            waiting = {tenant: len(q) for tenant, q in self._queues.items()}
+            active = dict(self._tenant_active)
+
+        def pct(p: float) -> float:
+            return times[min(len(times) - 1, int(p * len(times)))] * 1000.0 if times else 0.0
+
+        return {
+            "active": active,
+            "waiting": waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "queueMs": {"p50": pct(0.5), "p99": pct(0.99), "max": times[-1] * 1000.0 if times else 0.0},
+        }
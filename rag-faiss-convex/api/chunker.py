@@ -0,0 +1,174 @@
+import os
+import re
+from bisect import bisect_left, bisect_right
+from collections import deque
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from api.tokens import HAS_TIKTOKEN, TOKEN_ENCODING, count_tokens_many
+
+# Defaults sized like the old 1200/200-character chunks (~4 characters per token)
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "300"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))
+
+# Changes whenever the same text would be chunked differently
+CHUNKER_ID = (
+    f"v1:{CHUNK_MAX_TOKENS}:{CHUNK_OVERLAP_TOKENS}:"
+    f"{TOKEN_ENCODING if HAS_TIKTOKEN else 'estimate'}"
+)
+
+SEGMENT_SEPARATOR = "\n\n"
+
+_PARA_BREAK_RE = re.compile(r"\n[^\S\n]*\n\s*")
+# Sentence ends: terminal punctuation before whitespace, or a line break
+# (Slack exports and spreadsheet row blocks are one line per message/row)
+_SENTENCE_RE = re.compile(r"\S.*?(?:[.!?]+(?=\s)|(?=\n)|\Z)", re.S)
+_ASTRAL_RE = re.compile("[\U00010000-\U0010FFFF]")
+
+Span = Tuple[int, int]
+
+
+def sentence_spans(text: str, start: int = 0, end: Optional[int] = None) -> List[Span]:
+    """Offsets of the sentences (and lines) of text[start:end], without surrounding whitespace."""
+    return [m.span() for m in _SENTENCE_RE.finditer(text, start, len(text) if end is None else end)]
+
+
+def _paragraph_spans(text: str, base: int) -> Iterator[Span]:
+    """Offsets of the non-blank paragraphs of text, stripped of surrounding whitespace."""
+    pos = 0
+    for m in _PARA_BREAK_RE.finditer(text):
+        yield from _strip_span(text, pos, m.start(), base)
+        pos = m.end()
+    yield from _strip_span(text, pos, len(text), base)
+
+
+def _strip_span(text: str, start: int, end: int, base: int) -> Iterator[Span]:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    if start < end:
+        yield base + start, base + end
+
+
+def _hard_split(text: str, start: int, end: int, tokens: int, max_tokens: int) -> Iterator[Span]:
+    """Cut a run with no sentence boundary into pieces of about max_tokens, at whitespace if possible."""
+    width = max(1, (end - start) * max_tokens // tokens)
+    while end - start > width:
+        cut = text.rfind(" ", start + width // 2, start + width)
+        cut = cut if cut > start else start + width
+        yield from _strip_span(text, start, cut, 0)
+        start = cut
+    yield from _strip_span(text, start, end, 0)
+
+
+def _units(text: str, base: int, max_tokens: int) -> List[Tuple[int, int, int]]:
+    """
+    (start, end, tokens) of the units chunks are built from: paragraphs, or the
+    sentences (and lines) of paragraphs that exceed max_tokens on their own.
+    """
+    spans = list(_paragraph_spans(text, 0))
+    counts = count_tokens_many([text[s:e] for s, e in spans])
+    units = []
+    for (s, e), n in zip(spans, counts):
+        if n <= max_tokens:
+            units.append((base + s, base + e, n))
+            continue
+        sentences = sentence_spans(text, s, e)
+        for (ss, se), sn in zip(sentences, count_tokens_many([text[a:b] for a, b in sentences])):
+            pieces = [(ss, se)] if sn <= max_tokens else list(_hard_split(text, ss, se, sn, max_tokens))
+            ptokens = [sn] if len(pieces) == 1 else count_tokens_many([text[a:b] for a, b in pieces])
+            units.extend((base + a, base + b, pn) for (a, b), pn in zip(pieces, ptokens))
+    return units
+
+
+def iter_chunks(
+    segments: Iterable[str],
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> Iterator[Tuple[int, int, str]]:
+    """
+    Yield (start, end, text) chunks of at most max_tokens from a stream of
+    text segments (pages, slides, row blocks).
+
+    Offsets index into SEGMENT_SEPARATOR.join(segments), and text is exactly
+    that slice. Chunks are built from whole paragraphs where they fit and
+    from sentences where a paragraph alone is too long; consecutive chunks
+    share up to overlap_tokens of trailing paragraphs/sentences. Only the
+    current segment and the text of the open chunk are held in memory.
+    """
+    held = deque()  # units of the open chunk
+    held_tokens = 0
+    buf, buf_base = "", 0  # text from the first held unit to the end of the current segment
+    offset = 0
+
+    for i, segment in enumerate(segments):
+        if i:
+            offset += len(SEGMENT_SEPARATOR)
+        # Keep only the text the open chunk still refers to
+        if held:
+            buf = buf[held[0][0] - buf_base:] + SEGMENT_SEPARATOR + segment
+            buf_base = held[0][0]
+        else:
+            buf, buf_base = segment, offset
+
+        for unit in _units(segment, offset, max_tokens):
+            # +1 token for the paragraph break joining units
+            if held and held_tokens + unit[2] + 1 > max_tokens:
+                start, end = held[0][0], held[-1][1]
+                yield start, end, buf[start - buf_base:end - buf_base]
+                while held and (held_tokens > overlap_tokens or held_tokens + unit[2] + 1 > max_tokens):
+                    held_tokens -= held.popleft()[2] + 1
+            held.append(unit)
+            held_tokens += unit[2] + 1
+        offset += len(segment)
+
+    if held:
+        start, end = held[0][0], held[-1][1]
+        yield start, end, buf[start - buf_base:end - buf_base]
+
+
+def chunk_spans(
+    text: str,
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> List[Span]:
+    """(start, end) offsets of the chunks of text; text[start:end] is the chunk."""
+    return [(s, e) for s, e, _ in iter_chunks([text], max_tokens, overlap_tokens)]
+
+
+def chunk_text(
+    text: str,
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> List[str]:
+    return [t for _, _, t in iter_chunks([text], max_tokens, overlap_tokens)]
+
+
+def utf16_spans(text: str, spans: List[Span]) -> List[Span]:
+    """
+    Convert code-point offsets into text to UTF-16 code-unit offsets, which is
+    what JavaScript's String.slice (Convex, the frontend) indexes by.
+    """
+    if text.isascii():
+        return spans
+    astral = [m.start() for m in _ASTRAL_RE.finditer(text)]
+    if not astral:
+        return spans
+    # Each character outside the BMP before an offset is one extra code unit
+    return [(s + bisect_left(astral, s), e + bisect_left(astral, e)) for s, e in spans]
+
+
+def codepoint_offsets(text: str, offsets: List[int]) -> List[int]:
+    """The inverse of utf16_spans: UTF-16 code-unit offsets into text as code-point offsets."""
+    if text.isascii():
+        return offsets
+    astral = [m.start() for m in _ASTRAL_RE.finditer(text)]
+    if not astral:
+        return offsets
+    # UTF-16 offset just past each character outside the BMP
+    ends = [a + i + 2 for i, a in enumerate(astral)]
+    return [u - bisect_right(ends, u) for u in offsets]
+
+
+def utf16_length(text: str) -> int:
+    return len(text) if text.isascii() else len(text) + len(_ASTRAL_RE.findall(text))
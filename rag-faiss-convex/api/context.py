@@ -0,0 +1,136 @@
+import os
+import math
+import re
+from typing import Dict, List, Set, Tuple
+
+from api.chunker import sentence_spans
+from api.tokens import count_tokens, count_tokens_many
+
+# Most tokens of retrieved chunk text put into the chat prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Chunks longer than this are trimmed to their sentences that best match the
+# question; also enables trimming the last chunk to fit the budget (0 disables)
+CONTEXT_CHUNK_TOKENS = int(os.getenv("CONTEXT_CHUNK_TOKENS", "400"))
+
+# Not worth trimming a chunk into less room than this
+_MIN_TRIMMED_TOKENS = 32
+# Shortest overlap between adjacent chunks that is detected and removed
+_MIN_OVERLAP_CHARS = 32
+_ELISION = " ... "
+_WORD_RE = re.compile(r"\w+")
+
+
+def _terms(text: str) -> Set[str]:
+    return set(_WORD_RE.findall(text.lower()))
+
+
+def _overlap(head: str, tail: str) -> int:
+    """Length of the longest suffix of head that is also a prefix of tail."""
+    probe = tail[:_MIN_OVERLAP_CHARS]
+    if len(probe) < _MIN_OVERLAP_CHARS:
+        return 0
+    pos = head.find(probe)
+    while pos != -1:
+        if tail.startswith(head[pos:]):
+            return len(head) - pos
+        pos = head.find(probe, pos + 1)
+    return 0
+
+
+def trim_to_query(text: str, query_terms: Set[str], idf: Dict[str, float], max_tokens: int) -> str:
+    """
+    The sentences of text that share the most (idf-weighted) words with the
+    question, up to max_tokens, in their original order. Gaps between kept
+    sentences are marked with an ellipsis.
+    """
+    spans = sentence_spans(text)
+    counts = count_tokens_many([text[s:e] for s, e in spans])
+    scores = [sum(idf.get(w, 0.0) for w in _terms(text[s:e]) & query_terms) for s, e in spans]
+
+    keep, used = [], 0
+    for i in sorted(range(len(spans)), key=lambda i: (-scores[i], i)):
+        if used + counts[i] <= max_tokens:
+            keep.append(i)
+            used += counts[i]
+    keep.sort()
+
+    out = []
+    for pos, i in enumerate(keep):
+        if pos:
+            prev = keep[pos - 1]
+            out.append(text[spans[prev][1]:spans[i][0]] if prev == i - 1 else _ELISION)
+        out.append(text[spans[i][0]:spans[i][1]])
+    return "".join(out)
+
+
+def build_context(
+    question: str,
+    chunks: List[dict],
+    budget: int = CONTEXT_TOKEN_BUDGET,
+    chunk_tokens: int = CONTEXT_CHUNK_TOKENS,
+) -> Tuple[str, dict]:
+    """
+    Pack chunks (best first) into the CONTEXT block of the chat prompt, up to
+    `budget` tokens. Text a chunk shares with an adjacent chunk of the same
+    document (chunkIndex +/- 1) already in the context is left out, chunks
+    longer than chunk_tokens are trimmed to the sentences that best match
+    the question, and a chunk that does not fit what is left of the budget
+    is trimmed to fit or skipped. Returns the context and its stats.
+    """
+    query_terms = _terms(question)
+    # Words rare among the retrieved chunks count for more when trimming
+    df: Dict[str, int] = {}
+    for c in chunks:
+        for w in _terms(c["text"]) & query_terms:
+            df[w] = df.get(w, 0) + 1
+    idf = {w: math.log(1.0 + len(chunks) / n) for w, n in df.items()}
+
+    placed: Dict[Tuple[str, int], str] = {}
+    blocks: List[str] = []
+    used = 0
+    stats = {"chunks": 0, "trimmed": 0, "dropped": 0, "overlapChars": 0}
+    for c in chunks:
+        text = c["text"]
+        before = placed.get((c["docId"], c["chunkIndex"] - 1))
+        if before is not None:
+            cut = _overlap(before, text)
+            text = text[cut:].lstrip()
+            stats["overlapChars"] += cut
+        after = placed.get((c["docId"], c["chunkIndex"] + 1))
+        if after is not None:
+            cut = _overlap(text, after)
+            text = text[:len(text) - cut].rstrip()
+            stats["overlapChars"] += cut
+        if not text:
+            # Entirely covered by its neighbours
+            continue
+
+        header = f"[source={c['sourceKey']}]\n"
+        # +1 for the blank line between blocks
+        overhead = count_tokens(header) + 1
+        tokens = count_tokens(text)
+        room = budget - used - overhead
+        limit = min(chunk_tokens, room) if chunk_tokens > 0 else room
+        if tokens > limit:
+            trimmed = ""
+            if chunk_tokens > 0 and limit >= _MIN_TRIMMED_TOKENS:
+                trimmed = trim_to_query(text, query_terms, idf, limit)
+            if not trimmed:
+                stats["dropped"] += 1
+                continue
+            text = trimmed
+            tokens = count_tokens(text)
+            stats["trimmed"] += 1
+
+        placed[(c["docId"], c["chunkIndex"])] = text
+        blocks.append(header + text)
+        used += overhead + tokens
+        stats["chunks"] += 1
+
+    stats["contextTokens"] = used
+    return "\n\n".join(blocks), stats
+
+
+def prompt_tokens(messages: List[dict]) -> int:
+    """Approximate prompt tokens of a chat request (a few tokens of framing per message)."""
+    return sum(count_tokens(m["content"]) + 3 for m in messages) + 3
@@ -0,0 +1,154 @@
+import json
+import hashlib
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from api.upstream_errors import FATAL, INPUT, classify
+
+MutationFn = Callable[[str, dict], Any]
+
+
+def document_ingest_key(tenant_id: str, doc: dict) -> str:
+    """Content key for documents written without one (same source, title, text and chunks => same key)."""
+    h = hashlib.sha256()
+    chunks = json.dumps(doc["chunks"], sort_keys=True)
+    for part in (tenant_id, doc["sourceKey"], doc["title"], doc["rawText"], chunks):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:32]
+
+
+def _row_bytes(doc: dict) -> int:
+    # Request size, plus the chunk text Convex slices out of rawText and stores
+    sliced = sum(c["end"] - c["start"] for c in doc["chunks"] if "text" not in c and "end" in c)
+    return len(json.dumps(doc)) + 2 * sliced
+
+
+class ConvexBulkWriter:
+    """
+    Writes documents and their chunks with as few Convex mutations as possible.
+
+    Documents are packed into ingest:addDocuments calls capped by document
+    count, rows written (documents + chunks) and payload bytes, so a run costs
+    one round trip per batch instead of two per document. Every document
+    carries an ingestKey, and addDocuments returns the existing document for a
+    key it has already written, so a batch whose response was lost can be
+    retried without creating duplicates. Outages and rate limits are retried
+    with backoff, and auth errors are raised right away. A batch Convex
+    rejects for its content (400/413/422) is split in half and both halves
+    are written, so the rest of a batch is still written when one document is
+    bad (the first error is raised afterwards; re-running the batch returns
+    the ids of the documents that made it). At most max_attempts mutations
+    are made for one packed batch, retries and splits included.
+    """
+
+    def __init__(
+        self,
+        mutation: MutationFn,
+        max_docs: int = 256,
+        max_rows: int = 4000,
+        max_bytes: int = 4_000_000,
+        retries: int = 3,
+        backoff: float = 1.0,
+        max_attempts: int = 32,
+    ):
+        self.mutation = mutation
+        self.max_docs = max_docs
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.retries = retries
+        self.backoff = backoff
+        self.max_attempts = max_attempts
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "documents": 0, "chunks": 0, "retries": 0, "splits": 0}
+
+    def prepare(self, tenant_id: str, documents: List[dict]) -> List[dict]:
+        """Fill in missing ingestKeys (in place) so every write is idempotent."""
+        for doc in documents:
+            if not doc.get("ingestKey"):
+                doc["ingestKey"] = document_ingest_key(tenant_id, doc)
+        return documents
+
+    def pack(self, documents: List[dict]) -> List[List[int]]:
+        """Group document positions into batches within the count, row and byte limits."""
+        batches, cur, rows, size = [], [], 0, 0
+        for pos, doc in enumerate(documents):
+            n, b = 1 + len(doc["chunks"]), _row_bytes(doc)
+            if cur and (len(cur) >= self.max_docs or rows + n > self.max_rows or size + b > self.max_bytes):
+                batches.append(cur)
+                cur, rows, size = [], 0, 0
+            cur.append(pos)
+            rows += n
+            size += b
+        if cur:
+            batches.append(cur)
+        return batches
+
+    def _call(self, tenant_id: str, docs: List[dict]) -> List[dict]:
+        out = self.mutation("ingest:addDocuments", {"tenantId": tenant_id, "documents": docs})
+        if len(out) != len(docs):
+            raise RuntimeError(f"addDocuments returned {len(out)} results for {len(docs)} documents")
+        with self._stats_lock:
+            self.stats["requests"] += 1
+            self.stats["documents"] += len(docs)
+            self.stats["chunks"] += sum(len(d["chunks"]) for d in docs)
+        return out
+
+    def write_batch(self, tenant_id: str, docs: List[dict], budget: Optional[List[int]] = None) -> List[dict]:
+        """Write one packed batch; returns [{docId, chunkIds}] in input order."""
+        # budget: calls left for the packed batch this is (part of)
+        self.prepare(tenant_id, docs)
+        if budget is None:
+            budget = [self.max_attempts]
+        for attempt in range(self.retries + 1):
+            budget[0] -= 1
+            try:
+                return self._call(tenant_id, docs)
+            except Exception as e:
+                kind = classify(e)
+                if kind == INPUT and len(docs) > 1 and budget[0] > 1:
+                    break
+                if kind in (FATAL, INPUT) or attempt == self.retries or budget[0] <= 0:
+                    raise
+                with self._stats_lock:
+                    self.stats["retries"] += 1
+                time.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+
+        # Isolate the rejected document: write each half on its own
+        with self._stats_lock:
+            self.stats["splits"] += 1
+        mid = len(docs) // 2
+        out: List[dict] = []
+        error: Optional[Exception] = None
+        for half in (docs[:mid], docs[mid:]):
+            if budget[0] <= 0:
+                error = error or RuntimeError(f"addDocuments gave up after {self.max_attempts} calls")
+                continue
+            try:
+                out.extend(self.write_batch(tenant_id, half, budget))
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+        return out
+
+    def add_documents(self, tenant_id: str, documents: List[dict]) -> List[dict]:
+        """
+        Write documents ({sourceKey, title, rawText, chunks, ...}); returns
+        [{docId, chunkIds}] in the same order, chunkIds in chunkIndex order.
+        """
+        self.prepare(tenant_id, documents)
+        out: List[Optional[Dict]] = [None] * len(documents)
+        for batch in self.pack(documents):
+            for pos, written in zip(batch, self.write_batch(tenant_id, [documents[p] for p in batch])):
+                out[pos] = written
+        return out
+
+    def summary(self) -> str:
+        s = self.stats
+        return (
+            f"convex bulk writes: requests={s['requests']} documents={s['documents']} "
+            f"chunks={s['chunks']} retries={s['retries']} splits={s['splits']}"
+        )
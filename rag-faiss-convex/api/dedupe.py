@@ -0,0 +1,120 @@
+import os
+import re
+import zlib
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# Cosine similarity at or above which two chunk vectors are treated as the
+# same content: not indexed twice within a source, collapsed in results (0 disables)
+DEDUPE_COSINE = float(os.getenv("DEDUPE_COSINE", "0.98"))
+# Estimated Jaccard similarity of word shingles at or above which a chunk
+# reuses another chunk's embedding instead of being embedded. Lossy: a chunk
+# that differs in a few words gets the other's vector, so off unless set (0)
+DEDUPE_JACCARD = float(os.getenv("DEDUPE_JACCARD", "0"))
+
+SHINGLE_WORDS = 3
+NUM_PERM = 64
+LSH_BANDS = 16  # 4 rows per band: pairs above ~0.6 Jaccard almost always share a bucket
+
+_WORD_RE = re.compile(r"\w+")
+_rng = np.random.RandomState(1)
+# Multiply-shift hashing: ((a * x + b) mod 2**64) >> 32 with odd a
+_PERM_A = _rng.randint(0, 1 << 62, size=NUM_PERM, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+_PERM_B = _rng.randint(0, 1 << 62, size=NUM_PERM, dtype=np.int64).astype(np.uint64)
+_SHINGLE_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    """64-bit hashes of the word shingles of text (repeats are harmless for MinHash)."""
+    words = _WORD_RE.findall(text.lower()) or [""]
+    w = np.fromiter((zlib.crc32(x.encode("utf-8")) for x in words), dtype=np.uint64, count=len(words))
+    n = max(1, len(w) - SHINGLE_WORDS + 1)
+    h = w[:n].copy()
+    with np.errstate(over="ignore"):
+        for k in range(1, min(SHINGLE_WORDS, len(w))):
+            h = h * _SHINGLE_MIX + w[k:k + n]
+        # splitmix64 finalizer: crc32 is linear, so similar words give related values
+        h ^= h >> np.uint64(30)
+        h *= np.uint64(0xBF58476D1CE4E5B9)
+        h ^= h >> np.uint64(27)
+        h *= np.uint64(0x94D049BB133111EB)
+        h ^= h >> np.uint64(31)
+    return h
+
+
+def minhash_signatures(texts: Sequence[str]) -> np.ndarray:
+    """(len(texts), NUM_PERM) MinHash signatures of the texts' word shingles."""
+    if not texts:
+        return np.empty((0, NUM_PERM), dtype=np.uint64)
+    hashes = [_shingle_hashes(text) for text in texts]
+    starts = np.cumsum([0] + [len(h) for h in hashes[:-1]])
+    flat = np.concatenate(hashes)
+    out = np.empty((len(texts), NUM_PERM), dtype=np.uint64)
+    # All shingles of all texts at once, a slice of permutations at a time
+    with np.errstate(over="ignore"):
+        for p in range(0, NUM_PERM, 16):
+            permuted = (_PERM_A[p:p + 16, None] * flat[None, :] + _PERM_B[p:p + 16, None]) >> np.uint64(32)
+            out[:, p:p + 16] = np.minimum.reduceat(permuted, starts, axis=1).T
+    return out
+
+
+def text_duplicates(texts: Sequence[str], threshold: float = DEDUPE_JACCARD) -> List[int]:
+    """
+    For each text, the position of the earlier text it near-duplicates, or its
+    own position. Candidates come from LSH buckets over the signature bands
+    and are confirmed on the estimated Jaccard similarity; a text is only
+    matched against representatives, so groups never chain.
+    """
+    sigs = minhash_signatures(texts)
+    rows = NUM_PERM // LSH_BANDS
+    buckets: Dict[Tuple[int, bytes], List[int]] = {}
+    rep = list(range(len(texts)))
+    for i in range(len(texts)):
+        keys = [(b, sigs[i, b * rows:(b + 1) * rows].tobytes()) for b in range(LSH_BANDS)]
+        candidates = {j for key in keys for j in buckets.get(key, ())}
+        if candidates:
+            cand = sorted(candidates)
+            similarity = (sigs[cand] == sigs[i]).mean(axis=1)
+            best = int(np.argmax(similarity))
+            if similarity[best] >= threshold:
+                rep[i] = cand[best]
+                continue
+        for key in keys:
+            buckets.setdefault(key, []).append(i)
+    return rep
+
+
+def vector_duplicates(xb: np.ndarray, threshold: float = DEDUPE_COSINE, block: int = 1024) -> List[int]:
+    """
+    Like text_duplicates for normalized vectors: the position of the earlier
+    vector each one is within `threshold` cosine of, or its own position.
+    Similarities are computed a block of rows at a time.
+    """
+    rep = list(range(len(xb)))
+    for start in range(0, len(xb), block):
+        sims = xb[start:start + block] @ xb[:start + block].T
+        for r in range(sims.shape[0]):
+            i = start + r
+            earlier = np.flatnonzero(sims[r, :i] >= threshold)
+            # Match the earliest representative so groups never chain
+            for j in earlier:
+                if rep[j] == j:
+                    rep[i] = int(j)
+                    break
+    return rep
+
+
+def collapse(vectors: np.ndarray, threshold: float = DEDUPE_COSINE) -> List[int]:
+    """
+    Positions to keep so only the best-scoring hit of each near-duplicate
+    cluster remains. vectors are the hits' normalized vectors, best hit first.
+    """
+    if len(vectors) < 2:
+        return list(range(len(vectors)))
+    sims = vectors @ vectors.T
+    kept: List[int] = []
+    for i in range(len(vectors)):
+        if not kept or sims[i, kept].max() < threshold:
+            kept.append(i)
+    return kept
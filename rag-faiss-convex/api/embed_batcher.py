@@ -0,0 +1,224 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from api.dedupe import text_duplicates
+from api.embed_cache import EmbeddingCache
+from api.tokens import count_tokens_many
+from api.upstream_errors import FATAL, INPUT, classify
+
+EmbedFn = Callable[[List[str]], Sequence[Sequence[float]]]
+
+
+class RateLimiter:
+    """Token buckets for requests/minute and tokens/minute (either may be None)."""
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self._lock = threading.Lock()
+        self._req_level = float(requests_per_minute or 0)
+        self._tok_level = float(tokens_per_minute or 0)
+        self._last = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self._last
+        self._last = now
+        if self.rpm:
+            self._req_level = min(self.rpm, self._req_level + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self._tok_level = min(self.tpm, self._tok_level + elapsed * self.tpm / 60.0)
+
+    def acquire(self, tokens: int):
+        # A single request larger than the whole bucket can never fit: cap it
+        if self.tpm:
+            tokens = min(tokens, self.tpm)
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                wait = 0.0
+                if self.rpm and self._req_level < 1:
+                    wait = max(wait, (1 - self._req_level) * 60.0 / self.rpm)
+                if self.tpm and self._tok_level < tokens:
+                    wait = max(wait, (tokens - self._tok_level) * 60.0 / self.tpm)
+                if wait == 0.0:
+                    if self.rpm:
+                        self._req_level -= 1
+                    if self.tpm:
+                        self._tok_level -= tokens
+                    return
+            time.sleep(wait)
+
+
+class EmbeddingBatcher:
+    """
+    Packs chunks from many documents into embedding requests.
+
+    Requests are capped by item count and estimated tokens, run on a shared
+    thread pool (so `concurrency` bounds in-flight requests across all
+    callers) and throttled by an optional RateLimiter. Transient failures
+    (rate limits, 5xx, connection errors) are retried with backoff. A request
+    whose input is rejected (400, input too long) is split in half to isolate
+    the bad text, and what the other texts got is still cached before the
+    error is raised. Auth, permission and quota errors are raised at once. At
+    most max_attempts calls are made for one packed request, retries and
+    splits included.
+    With a cache, texts embedded before (or repeated within a call) are
+    served locally and only the misses are sent. With near_duplicates (a
+    MinHash Jaccard threshold), texts that nearly repeat another text of the
+    same call reuse its vector instead of being sent.
+    """
+
+    def __init__(
+        self,
+        embed_fn: EmbedFn,
+        max_items: int = 512,
+        max_tokens: int = 100_000,
+        concurrency: int = 4,
+        rate_limiter: Optional[RateLimiter] = None,
+        retries: int = 3,
+        backoff: float = 1.0,
+        max_attempts: int = 32,
+        cache: Optional[EmbeddingCache] = None,
+        near_duplicates: Optional[float] = None,
+    ):
+        self.embed_fn = embed_fn
+        self.max_items = max_items
+        self.max_tokens = max_tokens
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.retries = retries
+        self.backoff = backoff
+        self.max_attempts = max_attempts
+        self.cache = cache
+        self.near_duplicates = near_duplicates
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed")
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "items": 0, "tokens": 0, "retries": 0, "splits": 0, "near_duplicates": 0}
+
+    def pack(self, token_counts: List[int]) -> List[List[int]]:
+        """Group item positions into requests within the item and token limits."""
+        batches, cur, cur_tokens = [], [], 0
+        for pos, n in enumerate(token_counts):
+            if cur and (len(cur) >= self.max_items or cur_tokens + n > self.max_tokens):
+                batches.append(cur)
+                cur, cur_tokens = [], 0
+            cur.append(pos)
+            cur_tokens += n
+        if cur:
+            batches.append(cur)
+        return batches
+
+    def _call(self, texts: List[str], tokens: int) -> List[Sequence[float]]:
+        self.rate_limiter.acquire(tokens)
+        vectors = self.embed_fn(texts)
+        if len(vectors) != len(texts):
+            raise RuntimeError(f"embedding count mismatch: sent {len(texts)}, got {len(vectors)}")
+        with self._stats_lock:
+            self.stats["requests"] += 1
+            self.stats["items"] += len(texts)
+            self.stats["tokens"] += tokens
+        return vectors
+
+    def _run(self, texts: List[str], counts: List[int], budget: Optional[List[int]] = None) -> List[Sequence[float]]:
+        # budget: calls left for the packed request this is (part of)
+        if budget is None:
+            budget = [self.max_attempts]
+        tokens = sum(counts)
+        for attempt in range(self.retries + 1):
+            budget[0] -= 1
+            try:
+                return self._call(texts, tokens)
+            except Exception as e:
+                kind = classify(e)
+                if kind == INPUT and len(texts) > 1 and budget[0] > 1:
+                    break
+                if kind in (FATAL, INPUT) or attempt == self.retries or budget[0] <= 0:
+                    raise
+                with self._stats_lock:
+                    self.stats["retries"] += 1
+                time.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+
+        # Isolate the rejected input: embed each half on its own
+        with self._stats_lock:
+            self.stats["splits"] += 1
+        mid = len(texts) // 2
+        halves = [(texts[:mid], counts[:mid]), (texts[mid:], counts[mid:])]
+        vectors: List[Optional[List[Sequence[float]]]] = []
+        error: Optional[Exception] = None
+        for part, part_counts in halves:
+            if budget[0] <= 0:
+                # Out of attempts for this request: give up on this half
+                error = error or RuntimeError(f"embedding gave up after {self.max_attempts} calls")
+                vectors.append(None)
+                continue
+            try:
+                vectors.append(self._run(part, part_counts, budget))
+            except Exception as e:
+                if classify(e) != INPUT:
+                    raise
+                error = error or e
+                vectors.append(None)
+        if error is not None:
+            # Keep what the other half got, so a re-run only sends the rest
+            if self.cache:
+                for (part, _), got in zip(halves, vectors):
+                    if got is not None:
+                        self.cache.put_many(part, got)
+            raise error
+        # Halves may be arrays: join them as sequences of rows
+        return [*vectors[0], *vectors[1]]
+
+    def embed(self, texts: List[str]) -> List[Sequence[float]]:
+        return self.embed_documents([texts])[0]
+
+    def embed_documents(self, docs: List[List[str]]) -> List[List[Sequence[float]]]:
+        """Embed the chunks of many documents; returns vectors grouped per document."""
+        flat: List[str] = []
+        owners: List[Tuple[int, int]] = []
+        for d, pieces in enumerate(docs):
+            for i, text in enumerate(pieces):
+                flat.append(text)
+                owners.append((d, i))
+
+        out: List[List[Optional[Sequence[float]]]] = [[None] * len(pieces) for pieces in docs]
+        if not flat:
+            return out
+
+        found = self.cache.get_many(flat) if self.cache else [None] * len(flat)
+        # Each distinct missing text is embedded once, wherever it repeats
+        missing: Dict[str, List[int]] = {}
+        for pos, vec in enumerate(found):
+            if vec is None:
+                missing.setdefault(flat[pos], []).append(pos)
+            else:
+                d, i = owners[pos]
+                out[d][i] = vec
+        if not missing:
+            return out
+
+        texts = list(missing)
+        if self.near_duplicates and len(texts) > 1:
+            reps = text_duplicates(texts, self.near_duplicates)
+            for i, rep in enumerate(reps):
+                if rep != i:
+                    missing[texts[rep]].extend(missing.pop(texts[i]))
+            texts = [t for i, t in enumerate(texts) if reps[i] == i]
+            with self._stats_lock:
+                self.stats["near_duplicates"] += len(reps) - len(texts)
+        counts = count_tokens_many(texts)
+        futures = [
+            (batch, self._pool.submit(self._run, [texts[p] for p in batch], [counts[p] for p in batch]))
+            for batch in self.pack(counts)
+        ]
+        for batch, fut in futures:
+            vectors = fut.result()
+            if self.cache:
+                self.cache.put_many([texts[p] for p in batch], vectors)
+            for p, vec in zip(batch, vectors):
+                for pos in missing[texts[p]]:
+                    d, i = owners[pos]
+                    out[d][i] = vec
+        return out
@@ -0,0 +1,346 @@
+import os
+import re
+import glob
+import time
+import fcntl
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Hashable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+HEADER_BYTES = 40  # sha256 digest (32) + last access time (4) + padding (4)
+
+# Index file: magic, data file inode, records covered, entries; then the
+# entries' sorted keys and their record numbers, as two uint64 arrays
+INDEX_MAGIC = b"EMBIDX1\0"
+INDEX_HEADER_BYTES = 32
+# Records appended since the index was written are looked up in a dict;
+# past this many the index is rewritten
+INDEX_TAIL_RECORDS = 4096
+
+
+def _record_dtype(dim: int) -> np.dtype:
+    return np.dtype([
+        ("digest", "V32"),
+        ("atime", "<u4"),
+        ("pad", "<u4"),
+        ("vec", "<f4", (dim,)),
+    ])
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+def _digest_keys(digests: bytes) -> np.ndarray:
+    """Index keys of concatenated 32-byte digests: their first 8 bytes as uint64."""
+    return np.frombuffer(digests, dtype="<u8").reshape(-1, 4)[:, 0]
+
+
+class EmbeddingCache:
+    """
+    Content-addressed on-disk cache of embeddings.
+
+    One append-only file per (model, dimension) holds fixed-size records of
+    sha256(text) + access time + float32 vector. Next to it, a sorted index
+    of digest prefix -> record number is memory-mapped too, so opening the
+    cache reads no records and a lookup is a binary search plus a slice of
+    the map (the full digest is compared, so a stale or colliding entry is a
+    miss, never a wrong vector). Records appended after the index was written
+    are kept in a small dict until the index is rewritten. When the file
+    grows past max_bytes it is compacted to the most recently used records.
+
+    Processes sharing the cache serialize appends, index writes and
+    compaction on a separate lock file: the data file itself is replaced on
+    compaction, so a lock on it would not exclude a writer holding the old one.
+    """
+
+    def __init__(self, cache_dir: str, model: str, dim: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir
+        self.model = model
+        self.max_bytes = max_bytes
+        self._slug = re.sub(r"[^A-Za-z0-9_.-]", "_", model)
+        self._lock = threading.Lock()
+        self._lockf = None
+        self._mm: Optional[np.memmap] = None
+        self._count = 0
+        self._ino = None
+        # Sorted keys and record numbers covering the first _indexed records
+        self._keys: Optional[np.memmap] = None
+        self._recs: Optional[np.memmap] = None
+        self._indexed = 0
+        # digest -> record number for records past _indexed
+        self._tail: Dict[bytes, int] = {}
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+        if dim is None:
+            # Reuse whatever dimension this model was cached with before
+            existing = sorted(glob.glob(os.path.join(cache_dir, f"{self._slug}.d*.emb")))
+            if existing:
+                dim = int(existing[-1].rsplit(".d", 1)[1][:-4])
+        self.dim = dim
+        if dim is not None:
+            self._open()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.cache_dir, f"{self._slug}.d{self.dim}.emb")
+
+    @property
+    def index_path(self) -> str:
+        return f"{self.path[:-4]}.idx"
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Exclusive across processes sharing the cache file."""
+        if self._lockf is None:
+            self._lockf = open(f"{self.path[:-4]}.lock", "ab")
+        fcntl.flock(self._lockf, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lockf, fcntl.LOCK_UN)
+
+    def _open(self):
+        self._dtype = _record_dtype(self.dim)
+        with self._file_lock():
+            self._load()
+
+    def _load(self):
+        """(Re)read the data file and its index; the caller holds the file lock."""
+        if not os.path.exists(self.path):
+            open(self.path, "ab").close()
+        size = os.path.getsize(self.path)
+        count = size // self._dtype.itemsize
+        if count * self._dtype.itemsize != size:
+            # Partial trailing record from an interrupted append
+            with open(self.path, "r+b") as f:
+                f.truncate(count * self._dtype.itemsize)
+        self._count = count
+        self._ino = os.stat(self.path).st_ino
+        self._remap()
+        self._load_index()
+        self._tail = {}
+        self._scan_tail(self._indexed)
+        if len(self._tail) > INDEX_TAIL_RECORDS:
+            self._update_index()
+
+    def _refresh(self):
+        """Catch up with appends and compactions by other processes; the caller holds the file lock."""
+        st = os.stat(self.path)
+        if st.st_ino != self._ino or st.st_size % self._dtype.itemsize or st.st_size < self._count * self._dtype.itemsize:
+            self._load()
+            return
+        count = st.st_size // self._dtype.itemsize
+        if count != self._count:
+            start, self._count = self._count, count
+            self._remap()
+            self._scan_tail(start)
+
+    def _remap(self):
+        self._mm = None
+        if self._count:
+            self._mm = np.memmap(self.path, dtype=self._dtype, mode="r+", shape=(self._count,))
+
+    def _load_index(self):
+        self._keys = self._recs = None
+        self._indexed = 0
+        try:
+            with open(self.index_path, "rb") as f:
+                header = f.read(INDEX_HEADER_BYTES)
+                size = os.fstat(f.fileno()).st_size
+        except FileNotFoundError:
+            return
+        if len(header) < INDEX_HEADER_BYTES or header[:8] != INDEX_MAGIC:
+            return
+        ino, covered, n = (int(x) for x in np.frombuffer(header[8:], dtype="<u8"))
+        # Written for another data file (compaction interrupted between the
+        # two renames) or torn: rebuilt from the records instead
+        if ino != self._ino or covered > self._count or size != INDEX_HEADER_BYTES + 16 * n:
+            return
+        self._indexed = covered
+        if n:
+            self._keys = np.memmap(self.index_path, dtype="<u8", mode="r", offset=INDEX_HEADER_BYTES, shape=(n,))
+            self._recs = np.memmap(self.index_path, dtype="<u8", mode="r", offset=INDEX_HEADER_BYTES + 8 * n, shape=(n,))
+
+    def _scan_tail(self, start: int):
+        if start >= self._count:
+            return
+        digests = self._mm["digest"][start:].tobytes()
+        for i in range(self._count - start):
+            self._tail.setdefault(digests[i * 32:(i + 1) * 32], start + i)
+
+    def _write_index(self, keys: np.ndarray, recs: np.ndarray, covered: int, ino: int):
+        order = np.argsort(keys, kind="stable")
+        tmp = f"{self.index_path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(INDEX_MAGIC)
+            f.write(np.array([ino, covered, len(keys)], dtype="<u8").tobytes())
+            f.write(keys[order].astype("<u8").tobytes())
+            f.write(recs[order].astype("<u8").tobytes())
+        os.replace(tmp, self.index_path)
+
+    def _update_index(self):
+        """Merge the tail into the index file; the caller holds the file lock."""
+        keys = _digest_keys(self._mm["digest"][self._indexed:].tobytes()) if self._count else np.empty(0, "<u8")
+        recs = np.arange(self._indexed, self._count, dtype="<u8")
+        if self._keys is not None:
+            keys = np.concatenate([self._keys, keys])
+            recs = np.concatenate([self._recs, recs])
+        self._write_index(keys, recs, self._count, self._ino)
+        self._load_index()
+        self._tail = {}
+
+    def _lookup(self, digests: Sequence[bytes]) -> List[Optional[int]]:
+        """Record numbers of the given digests (None where not cached)."""
+        out = [self._tail.get(d) for d in digests]
+        if self._keys is None:
+            return out
+        keys = _digest_keys(b"".join(digests))
+        for i, pos in enumerate(np.searchsorted(self._keys, keys)):
+            while out[i] is None and pos < len(self._keys) and self._keys[pos] == keys[i]:
+                rec = int(self._recs[pos])
+                if self._mm["digest"][rec].tobytes() == digests[i]:
+                    out[i] = rec
+                pos += 1
+        return out
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        out: List[Optional[np.ndarray]] = [None] * len(texts)
+        if self.dim is None:
+            self.misses += len(texts)
+            return out
+        now = int(time.time())
+        with self._lock:
+            for i, rec in enumerate(self._lookup([text_digest(t) for t in texts])):
+                if rec is None:
+                    self.misses += 1
+                    continue
+                out[i] = np.array(self._mm["vec"][rec])
+                self._mm["atime"][rec] = now
+                self.hits += 1
+        return out
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        if not texts:
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = len(vectors[0])
+                self._open()
+            with self._file_lock():
+                # Another process may have appended or compacted since: line up first
+                self._refresh()
+                digests = [text_digest(t) for t in texts]
+                rows = np.zeros(len(texts), dtype=self._dtype)
+                keep = []
+                seen = set()
+                for i, (digest, rec, vec) in enumerate(zip(digests, self._lookup(digests), vectors)):
+                    if rec is not None or digest in seen or len(vec) != self.dim:
+                        continue
+                    seen.add(digest)
+                    rows[i]["digest"] = digest
+                    rows[i]["atime"] = int(time.time())
+                    rows[i]["vec"] = vec
+                    keep.append(i)
+                if not keep:
+                    return
+                rows = rows[keep]
+                with open(self.path, "ab") as f:
+                    f.write(rows.tobytes())
+                start = self._count
+                self._count += len(rows)
+                self._remap()
+                self._scan_tail(start)
+                if len(self._tail) > INDEX_TAIL_RECORDS:
+                    self._update_index()
+                if self.max_bytes and self._count * self._dtype.itemsize > self.max_bytes:
+                    self._compact()
+
+    def _compact(self, target: float = 0.8):
+        """Keep the most recently used records that fit in target * max_bytes; the caller holds the file lock."""
+        keep_n = int(self.max_bytes * target) // self._dtype.itemsize
+        order = np.argsort(-self._mm["atime"].astype(np.int64), kind="stable")[:keep_n]
+        kept = np.array(self._mm[np.sort(order)])
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(kept.tobytes())
+        # The index names the new file's inode, so whichever rename an
+        # interruption falls between, the pair is never taken as matching
+        self._write_index(
+            _digest_keys(kept["digest"].tobytes()), np.arange(len(kept), dtype="<u8"),
+            len(kept), os.stat(tmp).st_ino,
+        )
+        os.replace(tmp, self.path)
+        self._load()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def summary(self) -> str:
+        size_mb = self._count * self._dtype.itemsize / 1e6 if self.dim else 0.0
+        return (
+            f"embedding cache: hits={self.hits} misses={self.misses} "
+            f"hit_rate={self.hit_rate:.1%} entries={self._count} size={size_mb:.1f}MB"
+        )
+
+
+class LRUCache:
+    """
+    Small in-memory LRU, e.g. for query embeddings keyed by (model, text).
+    Optionally also bounded by the total size given to put() and by age.
+    """
+
+    def __init__(self, max_items: int, max_bytes: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (value, nbytes, stored at)
+        self._items: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[2] > self.ttl:
+                self._pop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value, nbytes: int = 0):
+        if self.max_items <= 0 or (self.max_bytes is not None and nbytes > self.max_bytes):
+            return
+        with self._lock:
+            if key in self._items:
+                self._pop(key)
+            self._items[key] = (value, nbytes, time.monotonic())
+            self._bytes += nbytes
+            while len(self._items) > self.max_items or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._pop(next(iter(self._items)))
+
+    def _pop(self, key: Hashable):
+        self._bytes -= self._items.pop(key)[1]
+
+
+def cache_from_env(model: str) -> Optional[EmbeddingCache]:
+    """EMBED_CACHE_DIR (empty disables) and EMBED_CACHE_MAX_MB configure the cache."""
+    cache_dir = os.getenv("EMBED_CACHE_DIR", "embed_cache")
+    if not cache_dir:
+        return None
+    max_mb = float(os.getenv("EMBED_CACHE_MAX_MB", "2048"))
+    return EmbeddingCache(cache_dir, model, max_bytes=int(max_mb * 1e6) if max_mb else None)
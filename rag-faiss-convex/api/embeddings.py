@@ -0,0 +1,341 @@
+import os
+import re
+import queue
+import binascii
+import hashlib
+import threading
+import time
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from importlib.util import find_spec
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# Embedding models are named by a spec, "<backend>:<name>":
+#   text-embedding-3-small       an OpenAI(-compatible) API model (no prefix)
+#   hashing:384                  deterministic feature hashing into 384 dims
+#   onnx:/models/minilm          a local ONNX model (model.onnx and tokenizer.json)
+#   sentence-transformers:all-MiniLM-L6-v2
+BACKENDS = ("openai", "hashing", "onnx", "sentence-transformers")
+
+# Local model backends are optional; their packages are only imported in the
+# worker processes
+HAS_ONNX = find_spec("onnxruntime") is not None and find_spec("tokenizers") is not None
+HAS_SENTENCE_TRANSFORMERS = find_spec("sentence_transformers") is not None
+
+# Worker processes per local model, texts per call into a worker, how long a
+# call waits for concurrent calls to batch with, and longest input in tokens
+LOCAL_EMBED_WORKERS = int(os.getenv("LOCAL_EMBED_WORKERS", "2"))
+LOCAL_EMBED_BATCH = int(os.getenv("LOCAL_EMBED_BATCH", "64"))
+LOCAL_EMBED_WAIT = float(os.getenv("LOCAL_EMBED_WAIT_MS", "5")) / 1000
+LOCAL_EMBED_MAX_TOKENS = 512
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def parse_spec(spec: str) -> Tuple[str, str]:
+    """(backend, name) of a model spec."""
+    backend, sep, name = spec.partition(":")
+    if sep and backend in BACKENDS:
+        return backend, name
+    return "openai", spec
+
+
+def canonical_spec(spec: str) -> str:
+    """The spec recorded for indexes: OpenAI models keep their bare name."""
+    backend, name = parse_spec(spec)
+    return name if backend == "openai" else f"{backend}:{name}"
+
+
+def _parse_tenant_models(value: str) -> Dict[str, str]:
+    models = {}
+    for item in value.split(","):
+        tenant, sep, spec = item.partition("=")
+        if sep and tenant.strip() and spec.strip():
+            models[tenant.strip()] = canonical_spec(spec.strip())
+    return models
+
+
+# Per-tenant embedding models, e.g. "acme=onnx:/models/minilm,globex=hashing:384";
+# other tenants use EMBED_MODEL
+TENANT_EMBED_MODELS = _parse_tenant_models(os.getenv("TENANT_EMBED_MODELS", ""))
+
+
+def tenant_model(tenant_id: str, default: str) -> str:
+    """The model spec a tenant's indexes are built with (TENANT_EMBED_MODELS, else default)."""
+    return TENANT_EMBED_MODELS.get(tenant_id, canonical_spec(default))
+
+
+def decode_embeddings(items: Sequence[Union[str, Sequence[float]]]) -> np.ndarray:
+    """
+    Embeddings returned with encoding_format="base64" (little-endian float32)
+    as one writable (n, dim) float32 matrix. Every row is decoded straight
+    into a single buffer, with no Python float per component. Servers that
+    ignore encoding_format and send float lists are handled too.
+    """
+    if not len(items):
+        return np.empty((0, 0), dtype=np.float32)
+    if not isinstance(items[0], str):
+        return np.array(items, dtype=np.float32)
+    buf = bytearray()
+    for item in items:
+        buf += binascii.a2b_base64(item)
+    # A no-op view on little-endian hosts
+    return np.frombuffer(buf, dtype="<f4").reshape(len(items), -1).astype(np.float32, copy=False)
+
+
+def create_embeddings(client, model: str, texts: List[str]) -> np.ndarray:
+    """Embed texts with an OpenAI-compatible client: an (n, dim) float32 matrix."""
+    # Asking for base64 explicitly makes the SDK hand back the payload as is
+    # instead of decoding it into lists of floats
+    out = client.embeddings.create(model=model, input=texts, encoding_format="base64")
+    return decode_embeddings([d.embedding for d in out.data])
+
+
+def hashing_embed(texts: List[str], dim: int) -> np.ndarray:
+    """Signed feature hashing of each text's words and word pairs, L2-normalized."""
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = _WORD_RE.findall(text.lower())
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            out[row, h % dim] += 1.0 if h >> 63 else -1.0
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    np.divide(out, norms, out=out, where=norms > 0)
+    return out
+
+
+class EmbeddingProvider:
+    """Embeds texts with one model into (n, dim) float32 matrices."""
+
+    # Calls a remote, rate-limited API (admission control and rate limits apply)
+    remote = False
+
+    def __init__(self, spec: str):
+        self.spec = spec
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class OpenAIProvider(EmbeddingProvider):
+    remote = True
+
+    def __init__(self, spec: str, client, model: str):
+        super().__init__(spec)
+        self.client = client
+        self.model = model
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return create_embeddings(self.client, self.model, texts)
+
+
+class HashingProvider(EmbeddingProvider):
+    """
+    No model and no network: identical texts always get identical vectors,
+    and texts sharing words score higher. For tests and offline development;
+    it matches words, not meaning.
+    """
+
+    def __init__(self, spec: str, dim: int):
+        super().__init__(spec)
+        self.dim = dim
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return hashing_embed(texts, self.dim)
+
+
+# The model loaded in a worker process (see _init_worker)
+_worker_embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None
+
+
+def _load_onnx(path: str, threads: int) -> Callable[[List[str]], np.ndarray]:
+    """An exported sentence-transformers model: mean pooling over the last hidden state."""
+    import onnxruntime as ort
+    from tokenizers import Tokenizer
+
+    model_path = path if path.endswith(".onnx") else os.path.join(path, "model.onnx")
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads
+    session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+    inputs = {i.name for i in session.get_inputs()}
+    tokenizer = Tokenizer.from_file(os.path.join(os.path.dirname(model_path), "tokenizer.json"))
+    tokenizer.enable_truncation(max_length=LOCAL_EMBED_MAX_TOKENS)
+    tokenizer.enable_padding()
+
+    def embed(texts: List[str]) -> np.ndarray:
+        encoded = tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask, "token_type_ids": np.zeros_like(ids)}
+        hidden = session.run(None, {k: v for k, v in feeds.items() if k in inputs})[0]
+        if hidden.ndim == 2:
+            # Exported with pooling included
+            return hidden.astype(np.float32)
+        weights = mask[..., None].astype(np.float32)
+        return ((hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)).astype(np.float32)
+
+    return embed
+
+
+def _load_sentence_transformer(name: str, threads: int) -> Callable[[List[str]], np.ndarray]:
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    model = SentenceTransformer(name, device="cpu")
+    return lambda texts: model.encode(texts, batch_size=len(texts), convert_to_numpy=True).astype(np.float32)
+
+
+def _init_worker(backend: str, name: str, threads: int):
+    global _worker_embed_fn
+    loader = _load_onnx if backend == "onnx" else _load_sentence_transformer
+    _worker_embed_fn = loader(name, threads)
+
+
+def _worker_embed(texts: List[str]) -> np.ndarray:
+    return _worker_embed_fn(texts)
+
+
+class LocalModelProvider(EmbeddingProvider):
+    """
+    A local CPU model (ONNX or sentence-transformers) run in a pool of worker
+    processes, each loading the model once. Concurrent calls are batched:
+    texts of calls arriving within `wait` of each other go to the workers
+    together, split into calls of at most `batch` texts that run in parallel.
+    The pool and its dispatch thread start with the first embed, so a
+    provider that is only looked up (e.g. for its spec) costs nothing.
+    """
+
+    def __init__(
+        self,
+        spec: str,
+        backend: str,
+        name: str,
+        workers: int = LOCAL_EMBED_WORKERS,
+        batch: int = LOCAL_EMBED_BATCH,
+        wait: float = LOCAL_EMBED_WAIT,
+    ):
+        super().__init__(spec)
+        self.backend = backend
+        self.name = name
+        self.workers = workers
+        self.batch = batch
+        self.wait = wait
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._queue: "queue.Queue[Tuple[List[str], Future]]" = queue.Queue()
+        self._start_lock = threading.Lock()
+
+    def _start(self):
+        with self._start_lock:
+            if self._pool is not None:
+                return
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            # Spawned, not forked: the API process runs threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.backend, self.name, threads),
+            )
+            threading.Thread(target=self._dispatch, name=f"embed-{self.backend}", daemon=True).start()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        if self._pool is None:
+            self._start()
+        future: Future = Future()
+        self._queue.put((texts, future))
+        return future.result()
+
+    def _dispatch(self):
+        while True:
+            pending = [self._queue.get()]
+            n = len(pending[0][0])
+            deadline = time.monotonic() + self.wait
+            while n < self.batch:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                pending.append(item)
+                n += len(item[0])
+
+            texts = [t for call, _ in pending for t in call]
+            try:
+                parts = [
+                    self._pool.submit(_worker_embed, texts[i:i + self.batch])
+                    for i in range(0, len(texts), self.batch)
+                ]
+            except Exception as e:
+                # e.g. a worker died and the pool is broken
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            # Results are handed back from the pool's callbacks, so the next
+            # round is collected while this one runs
+            left = [len(parts)]
+            lock = threading.Lock()
+
+            def done(_, pending=pending, parts=parts, left=left, lock=lock):
+                with lock:
+                    left[0] -= 1
+                    if left[0]:
+                        return
+                self._deliver(pending, parts)
+
+            for part in parts:
+                part.add_done_callback(done)
+
+    @staticmethod
+    def _deliver(pending: List[Tuple[List[str], Future]], parts: List[Future]):
+        try:
+            out = np.concatenate([part.result() for part in parts])
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+        pos = 0
+        for call, future in pending:
+            future.set_result(out[pos:pos + len(call)])
+            pos += len(call)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_providers: Dict[str, EmbeddingProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def _make_provider(spec: str, client) -> EmbeddingProvider:
+    backend, name = parse_spec(spec)
+    if backend == "openai":
+        if client is None:
+            raise ValueError(f"{spec} needs an OpenAI client")
+        return OpenAIProvider(spec, client, name)
+    if backend == "hashing":
+        if not name.isdigit() or not int(name):
+            raise ValueError(f"hashing needs a dimension, e.g. hashing:384 (got {spec})")
+        return HashingProvider(spec, int(name))
+    if backend == "onnx" and not HAS_ONNX:
+        raise ValueError(f"{spec} needs the onnxruntime and tokenizers packages")
+    if backend == "sentence-transformers" and not HAS_SENTENCE_TRANSFORMERS:
+        raise ValueError(f"{spec} needs the sentence-transformers package")
+    return LocalModelProvider(spec, backend, name)
+
+
+def get_provider(spec: str, client=None) -> EmbeddingProvider:
+    """The shared provider for a model spec; client is used for OpenAI models."""
+    spec = canonical_spec(spec)
+    with _providers_lock:
+        provider = _providers.get(spec)
+        if provider is None:
+            provider = _providers[spec] = _make_provider(spec, client)
+        return provider
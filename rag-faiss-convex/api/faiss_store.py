@@ -1,77 +1,631 @@
-import os, json, threading
-from typing import List, Tuple, Dict
+import os, json, heapq, shutil, threading
+from typing import List, Optional, Sequence, Tuple, Dict, Union
 import numpy as np
 import faiss
 
-def _normalize(v: np.ndarray) -> np.ndarray:
-    norm = np.linalg.norm(v, axis=1, keepdims=True) + 1e-12
-    return v / norm
+from api.dedupe import DEDUPE_COSINE, collapse as collapse_positions, vector_duplicates
+from api.source_summary import SOURCE_PRUNING, SourceSummary
+
+# Per-tenant pointer to the index generation being served (see active_generation)
+GENERATION_FILE = "current.json"
+_INDEX_SUFFIXES = (".index", ".ids.json", ".aliases.json", ".summary.npz", ".current")
+
+def _normalize(v) -> np.ndarray:
+    """
+    v as a C-contiguous float32 matrix of unit rows. A writable float32
+    matrix (such as decoded embeddings) is normalized in place, not copied.
+    """
+    xb = np.ascontiguousarray(v, dtype=np.float32)
+    if not xb.flags.writeable:
+        xb = xb.copy()
+    faiss.normalize_L2(xb)
+    return xb
+
+
+def _split_vectors(hits: List[tuple], dim: int, collapse: Optional[float]):
+    """(hits, vectors) from gathered hits, collapsing near-duplicates if asked."""
+    if not hits:
+        return [], np.empty((0, dim), dtype=np.float32)
+    vectors = np.stack([h[3] for h in hits])
+    if collapse:
+        kept = collapse_positions(vectors, collapse)
+        hits, vectors = [hits[i] for i in kept], vectors[kept]
+    return [h[:3] for h in hits], vectors
+
 
 class FaissPerSourceStore:
-    def __init__(self, base_dir="faiss_data"):
+    def __init__(
+        self,
+        base_dir="faiss_data",
+        dedupe_threshold: Optional[float] = DEDUPE_COSINE or None,
+        pruning: bool = SOURCE_PRUNING,
+    ):
         self.base_dir = base_dir
-        self._lock = threading.Lock()
-        self._cache: Dict[Tuple[str, str], Tuple[faiss.Index, List[str]]] = {}
+        # Cosine at or above which an added vector is treated as a duplicate (None: index everything)
+        self.dedupe_threshold = dedupe_threshold
+        # Keep source summaries and skip sources with them (see SourceSummary)
+        self.pruning = pruning
+        # Re-entrant: locked methods resolve the active generation (which locks too)
+        self._lock = threading.RLock()
+        # Cache entries are keyed by (tenant, index directory, source)
+        self._cache: Dict[Tuple[str, str, str], Tuple[faiss.Index, List[str]]] = {}
+        # What each cached entry was loaded from (see _published), so versions
+        # published by another process (an ingest daemon) are picked up
+        self._stamps: Dict[Tuple[str, str, str], Optional[tuple]] = {}
+        self._versions: Dict[Tuple[str, str, str], int] = {}
+        # Chunk ids not indexed because they duplicate an indexed vector: {indexed id: [alias ids]}
+        self._aliases: Dict[Tuple[str, str, str], Dict[str, List[str]]] = {}
+        # Lookups kept in step with ids and aliases: {chunk id: position} and {alias: indexed id}
+        self._positions: Dict[Tuple[str, str, str], Dict[str, int]] = {}
+        self._alias_of: Dict[Tuple[str, str, str], Dict[str, str]] = {}
+        # Centroid summaries used to skip sources that cannot contribute to a search
+        self._summaries: Dict[Tuple[str, str, str], Optional[SourceSummary]] = {}
+        self.search_stats = {"searches": 0, "sources_searched": 0, "sources_skipped": 0}
+        self._generations: Dict[str, Tuple[Optional[tuple], dict]] = {}
 
-    def _paths(self, tenant: str, source: str):
-        d = os.path.join(self.base_dir, tenant)
-        os.makedirs(d, exist_ok=True)
+    def tenant_dir(self, tenant: str) -> str:
+        return os.path.join(self.base_dir, tenant)
+
+    def generation_dir(self, tenant: str, generation: str) -> str:
+        """Directory holding a generation's indexes ("" is the tenant dir itself)."""
+        d = self.tenant_dir(tenant)
+        return os.path.join(d, "generations", generation) if generation else d
+
+    def active_generation(self, tenant: str) -> dict:
+        """
+        {generation, model, dim} of the indexes served for a tenant, from
+        faiss_data/<tenant>/current.json (written by scripts/rebuild_index.py).
+        Tenants never rebuilt use generation "" (indexes directly in the tenant
+        dir) and model None (the configured EMBED_MODEL).
+        """
+        path = os.path.join(self.tenant_dir(tenant), GENERATION_FILE)
+        with self._lock:
+            try:
+                st = os.stat(path)
+                stamp = (st.st_ino, st.st_mtime_ns)
+            except FileNotFoundError:
+                stamp = None
+            cached = self._generations.get(tenant)
+            if cached and cached[0] == stamp:
+                return cached[1]
+
+            info = {"generation": "", "model": None, "dim": None}
+            if stamp is not None:
+                with open(path, "r") as f:
+                    info.update(json.load(f))
+            self._generations[tenant] = (stamp, info)
+            # Indexes of the generation that was swapped out are no longer needed
+            active_dir = self.generation_dir(tenant, info["generation"])
+            for key in [k for k in self._cache if k[0] == tenant and k[1] != active_dir]:
+                self._cache.pop(key, None)
+                self._stamps.pop(key, None)
+                self._versions.pop(key, None)
+                self._aliases.pop(key, None)
+                self._positions.pop(key, None)
+                self._alias_of.pop(key, None)
+                self._summaries.pop(key, None)
+            return info
+
+    def require_model(self, tenant: str, model: str):
+        """
+        Refuse to add vectors from a different embedding model (or backend)
+        than the tenant's indexes. The first model to write indexes that
+        have none recorded is recorded for them, so a later configuration
+        change cannot mix models in one index.
+        """
+        with self._lock:
+            info = self.active_generation(tenant)
+            active = info["model"]
+            if active is None:
+                self.swap_generation(tenant, info["generation"], model, info["dim"])
+                return
+        if active != model:
+            raise ValueError(
+                f"tenant {tenant} indexes use {active}, not {model}; configure {active} for the "
+                f"tenant (EMBED_MODEL / TENANT_EMBED_MODELS) or rebuild with scripts/rebuild_index.py"
+            )
+
+    def swap_generation(self, tenant: str, generation: str, model: str, dim: Optional[int]):
+        """Atomically make a fully written generation the one that is served."""
+        os.makedirs(self.tenant_dir(tenant), exist_ok=True)
+        path = os.path.join(self.tenant_dir(tenant), GENERATION_FILE)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"generation": generation, "model": model, "dim": dim}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def prune_generations(self, tenant: str, keep: int = 1) -> List[str]:
+        """
+        Delete all but the active generation and the `keep` newest others
+        (queries pinned to a generation just swapped out can still finish).
+        Returns the generations removed ("" for indexes in the tenant dir).
+        """
+        active = self.active_generation(tenant)["generation"]
+        root = os.path.join(self.tenant_dir(tenant), "generations")
+        names = sorted(os.listdir(root)) if os.path.isdir(root) else []
+        # Generation names sort by creation time; the tenant-dir layout is the oldest
+        others = [g for g in [""] + names if g != active]
+        removed = others[:max(0, len(others) - keep)]
+        for generation in removed:
+            if generation:
+                shutil.rmtree(os.path.join(root, generation), ignore_errors=True)
+                continue
+            d = self.tenant_dir(tenant)
+            for name in os.listdir(d):
+                if name.endswith(_INDEX_SUFFIXES):
+                    os.remove(os.path.join(d, name))
+        return removed
+
+    def _dir(self, tenant: str, generation: Optional[dict] = None) -> str:
+        info = generation or self.active_generation(tenant)
+        return self.generation_dir(tenant, info["generation"])
+
+    def _paths(self, d: str, source: str):
+        """Unversioned files written before versioned publishing (read-only fallback)."""
         return (
             os.path.join(d, f"{source}.index"),
             os.path.join(d, f"{source}.ids.json"),
         )
 
-    def _load(self, tenant: str, source: str, dim: int):
-        key = (tenant, source)
-        if key in self._cache:
-            return self._cache[key]
+    def _version_paths(self, d: str, source: str, version: int):
+        return (
+            os.path.join(d, f"{source}.v{version}.index"),
+            os.path.join(d, f"{source}.v{version}.ids.json"),
+        )
+
+    def _aliases_path(self, d: str, source: str, version: int) -> str:
+        return os.path.join(d, f"{source}.v{version}.aliases.json")
+
+    def _summary_path(self, d: str, source: str, version: int) -> str:
+        return os.path.join(d, f"{source}.v{version}.summary.npz")
 
-        index_path, ids_path = self._paths(tenant, source)
+    def _pointer_path(self, d: str, source: str) -> str:
+        return os.path.join(d, f"{source}.current")
 
-        if os.path.exists(index_path) and os.path.exists(ids_path):
+    def _published(self, d: str, source: str) -> Optional[tuple]:
+        """
+        Stamp of what is currently published for a source: the stat of its
+        <source>.current pointer, or of the legacy index/ids files. None if
+        nothing is on disk.
+        """
+        try:
+            st = os.stat(self._pointer_path(d, source))
+            return ("current", st.st_ino, st.st_mtime_ns)
+        except FileNotFoundError:
+            pass
+        index_path, ids_path = self._paths(d, source)
+        try:
+            a, b = os.stat(index_path), os.stat(ids_path)
+        except FileNotFoundError:
+            return None
+        return ("legacy", a.st_ino, a.st_mtime_ns, b.st_ino, b.st_mtime_ns)
+
+    def _read_version(self, d: str, source: str) -> int:
+        try:
+            with open(self._pointer_path(d, source), "r") as f:
+                return int(f.read().strip())
+        except FileNotFoundError:
+            return 0
+
+    def _load(self, tenant: str, source: str, dim: int, generation: Optional[dict] = None):
+        d = self._dir(tenant, generation)
+        key = (tenant, d, source)
+        stamp = self._published(d, source)
+        if key in self._cache and (stamp is None or stamp == self._stamps.get(key)):
+            return self._cache[key]
+
+        aliases: Dict[str, List[str]] = {}
+        summary = None
+        if stamp is None:
+            index = faiss.IndexFlatIP(dim)  # cosine via normalized vectors
+            ids, version = [], 0
+        else:
+            version = self._read_version(d, source) if stamp[0] == "current" else 0
+            index_path, ids_path = (
+                self._version_paths(d, source, version) if version else self._paths(d, source)
+            )
             index = faiss.read_index(index_path)
             with open(ids_path, "r") as f:
                 ids = json.load(f)
-        else:
-            index = faiss.IndexFlatIP(dim)  # cosine via normalized vectors
-            ids = []
+            if version and os.path.exists(self._aliases_path(d, source, version)):
+                with open(self._aliases_path(d, source, version), "r") as f:
+                    aliases = json.load(f)
+            # Indexes written before summaries existed (or with pruning off) get
+            # one on their next write with pruning on
+            if self.pruning and version and os.path.exists(self._summary_path(d, source, version)):
+                summary = SourceSummary.load(self._summary_path(d, source, version))
 
         self._cache[key] = (index, ids)
+        self._stamps[key] = stamp
+        self._versions[key] = version
+        self._aliases[key] = aliases
+        self._summaries[key] = summary
+        self._reindex(key)
         return index, ids
 
-    def add(self, tenant: str, source: str, vectors: List[List[float]], chunk_ids: List[str]):
-        xb = np.array(vectors, dtype=np.float32)
+    def _reindex(self, key: Tuple[str, str, str]):
+        """Rebuild the position and alias lookups of a cached entry from its ids and aliases."""
+        self._positions[key] = {cid: pos for pos, cid in enumerate(self._cache[key][1])}
+        self._alias_of[key] = {a: c for c, al in self._aliases.get(key, {}).items() for a in al}
+
+    def _load_existing(self, tenant: str, source: str):
+        """Like _load, but returns None instead of creating an empty index."""
+        d = self._dir(tenant)
+        if (tenant, d, source) not in self._cache and self._published(d, source) is None:
+            return None
+        return self._load(tenant, source, dim=0)
+
+    def _write_version(
+        self,
+        d: str,
+        source: str,
+        index: faiss.Index,
+        ids: List[str],
+        version: int,
+        aliases: Optional[Dict[str, List[str]]] = None,
+        summary: Optional[SourceSummary] = None,
+    ):
+        """
+        Write <source>.v<N>.index/.ids.json (and .aliases.json, .summary.npz), then
+        atomically repoint <source>.current at N. Readers in other processes
+        see either the old or the new version, never a mix.
+        """
+        os.makedirs(d, exist_ok=True)
+        index_path, ids_path = self._version_paths(d, source, version)
+        faiss.write_index(index, index_path)
+        with open(ids_path, "w") as f:
+            json.dump(ids, f)
+        if aliases:
+            with open(self._aliases_path(d, source, version), "w") as f:
+                json.dump(aliases, f)
+        if summary is not None:
+            summary.save(self._summary_path(d, source, version))
+        pointer = self._pointer_path(d, source)
+        with open(f"{pointer}.tmp", "w") as f:
+            f.write(str(version))
+        os.replace(f"{pointer}.tmp", pointer)
+
+    def _save(self, tenant: str, source: str, index: faiss.Index, ids: List[str]):
+        """Publish a new version of a source index in the active generation."""
+        d = self._dir(tenant)
+        key = (tenant, d, source)
+        version = max(self._versions.get(key, 0), self._read_version(d, source)) + 1
+        summary = self._summaries.get(key)
+        if self.pruning and (summary is None or summary.stale(index.ntotal)):
+            summary = self._summaries[key] = SourceSummary.fit(index)
+        self._write_version(d, source, index, ids, version, self._aliases.get(key), summary)
+        self._versions[key] = version
+        self._stamps[key] = self._published(d, source)
+        self._prune(d, source, keep_from=version - 2)
+
+    def write_generation_index(self, tenant: str, generation: str, source: str, index: faiss.Index, ids: List[str]):
+        """Write a source index into a generation that is not served yet (see swap_generation)."""
+        self._write_version(
+            self.generation_dir(tenant, generation), source, index, ids, version=1,
+            summary=SourceSummary.fit(index) if self.pruning else None,
+        )
+
+    def _prune(self, d: str, source: str, keep_from: int):
+        # Keep the last couple of versions for readers that are mid-load
+        prefix = f"{source}.v"
+        for name in os.listdir(d):
+            if not name.startswith(prefix):
+                continue
+            num = name[len(prefix):].split(".", 1)[0]
+            if num.isdigit() and int(num) < keep_from:
+                os.remove(os.path.join(d, name))
+        for legacy in self._paths(d, source):
+            if os.path.exists(legacy):
+                os.remove(legacy)
+
+    def add(self, tenant: str, source: str, vectors: Union[np.ndarray, Sequence[Sequence[float]]],
+            chunk_ids: List[str]) -> int:
+        """
+        Index chunk vectors. A float32 matrix is used (and normalized) in
+        place; anything else is copied into one first. With a dedupe_threshold, a vector that near-
+        duplicates one already in the source (or earlier in the same call) is
+        not indexed again; its chunk id becomes an alias of the indexed one.
+        Returns how many chunks were aliased.
+        """
+        xb = _normalize(vectors)
         dim = xb.shape[1]
-        xb = _normalize(xb)
 
         with self._lock:
             index, ids = self._load(tenant, source, dim)
+            key = (tenant, self._dir(tenant), source)
             if index.d != dim:
                 raise ValueError(f"dim mismatch: index.d={index.d}, new={dim}")
 
-            index.add(xb)
-            ids.extend(chunk_ids)
+            keep = list(range(len(chunk_ids)))
+            if self.dedupe_threshold:
+                canonical: List[Optional[str]] = [None] * len(chunk_ids)
+                if index.ntotal:
+                    D, I = index.search(xb, 1)
+                    for i in np.flatnonzero(D[:, 0] >= self.dedupe_threshold).tolist():
+                        if 0 <= I[i, 0] < len(ids):
+                            canonical[i] = ids[I[i, 0]]
+                fresh = [i for i, c in enumerate(canonical) if c is None]
+                for r, rep in enumerate(vector_duplicates(xb[fresh], self.dedupe_threshold)):
+                    if rep != r:
+                        canonical[fresh[r]] = chunk_ids[fresh[rep]]
+                aliases = self._aliases.setdefault(key, {})
+                for i, c in enumerate(canonical):
+                    if c is not None:
+                        aliases.setdefault(c, []).append(chunk_ids[i])
+                        self._alias_of[key][chunk_ids[i]] = c
+                keep = [i for i, c in enumerate(canonical) if c is None]
 
-            index_path, ids_path = self._paths(tenant, source)
-            faiss.write_index(index, index_path)
-            with open(ids_path, "w") as f:
-                json.dump(ids, f)
+            index.add(xb[keep])
+            positions = self._positions[key]
+            for i in keep:
+                positions[chunk_ids[i]] = len(ids)
+                ids.append(chunk_ids[i])
+            summary = self._summaries.get(key)
+            if summary is not None:
+                summary.update(xb[keep])
+            self._save(tenant, source, index, ids)
+            return len(chunk_ids) - len(keep)
 
-    def search(self, tenant: str, sources: List[str], qvec: List[float], top_k_per_source: int = 8):
-        q = np.array([qvec], dtype=np.float32)
-        q = _normalize(q)
+    def remove(self, tenant: str, source: str, chunk_ids: List[str]) -> int:
+        """Drop the vectors (or aliases) of chunk_ids from a source index. Returns how many were removed."""
+        with self._lock:
+            loaded = self._load_existing(tenant, source)
+            if loaded is None:
+                return 0
+            index, ids = loaded
+            key = (tenant, self._dir(tenant), source)
+            aliases = self._aliases.setdefault(key, {})
+            alias_of, positions = self._alias_of[key], self._positions[key]
+            drop = set(chunk_ids)
+            removed = 0
+            for canonical in {alias_of[a] for a in drop if a in alias_of}:
+                kept = [a for a in aliases[canonical] if a not in drop]
+                removed += len(aliases[canonical]) - len(kept)
+                if kept:
+                    aliases[canonical] = kept
+                else:
+                    del aliases[canonical]
+            # A dropped vector that still has aliases stays indexed under the first of them
+            for cid in drop:
+                if cid in positions and cid in aliases:
+                    heir, *rest = aliases.pop(cid)
+                    ids[positions[cid]] = heir
+                    if rest:
+                        aliases[heir] = rest
+                    removed += 1
+            gone = sorted(positions[cid] for cid in drop if cid in positions and ids[positions[cid]] == cid)
+            if not gone and not removed:
+                return 0
+            if gone:
+                # IndexFlat compacts in place and keeps the remaining order
+                index.remove_ids(np.array(gone, dtype=np.int64))
+                ids[:] = [cid for cid in ids if cid not in drop]
+            self._reindex(key)
+            self._save(tenant, source, index, ids)
+            return removed + len(gone)
+
+    def contains(self, tenant: str, source: str, chunk_ids: List[str]) -> set:
+        """The subset of chunk_ids that already have vectors (or are aliases) in a source index."""
+        with self._lock:
+            loaded = self._load_existing(tenant, source)
+            if loaded is None:
+                return set()
+            key = (tenant, self._dir(tenant), source)
+            positions, alias_of = self._positions[key], self._alias_of[key]
+            return {cid for cid in chunk_ids if cid in positions or cid in alias_of}
 
-        scored: List[Tuple[str, float, str]] = []
+    def reconstruct(self, tenant: str, source: str, chunk_ids: List[str]) -> Dict[str, np.ndarray]:
+        """Stored (normalized) vectors for the chunk_ids present in a source index (aliases included)."""
         with self._lock:
-            for source in sources:
-                index, ids = self._load(tenant, source, dim=q.shape[1])
-                if index.ntotal == 0:
+            loaded = self._load_existing(tenant, source)
+            if loaded is None:
+                return {}
+            index = loaded[0]
+            key = (tenant, self._dir(tenant), source)
+            positions, alias_of = self._positions[key], self._alias_of[key]
+            out = {}
+            for cid in set(chunk_ids):
+                pos = positions.get(alias_of.get(cid, cid))
+                if pos is not None and pos < index.ntotal:
+                    out[cid] = index.reconstruct(pos)
+            return out
+
+    def _gather(
+        self,
+        tenant: str,
+        sources: List[str],
+        q: np.ndarray,
+        top_k_per_source: int,
+        generation: Optional[dict],
+        limit: Optional[int],
+        with_vectors: bool,
+    ) -> List[tuple]:
+        """
+        (chunk_id, score, source, vector or None) hits, best first.
+
+        With a limit (and pruning on), only the best `limit` hits overall are
+        wanted: sources are searched in order of their summary's score bound, each for only
+        as many hits as could still make the cut, and sources whose bound
+        cannot beat the current limit-th score are skipped. Because the
+        bounds are true upper bounds, the result is the same as searching
+        every source and keeping the top `limit`.
+        """
+        d = self._dir(tenant, generation)
+        targets = []
+        for source in sources:
+            index, ids = self._load(tenant, source, dim=q.shape[1], generation=generation)
+            if index.ntotal == 0 or index.d != q.shape[1]:
+                continue
+            summary = self._summaries.get((tenant, d, source)) if limit else None
+            bounds = summary.centroid_bounds(q[0]) if summary is not None else None
+            bound = float(bounds.max()) if bounds is not None else float("inf")
+            targets.append((bound, source, index, ids, summary, bounds))
+        targets.sort(key=lambda t: t[0], reverse=True)
+
+        self.search_stats["searches"] += 1
+        hits: List[tuple] = []
+        best: List[float] = []  # min-heap of the best `limit` scores so far
+        for pos, (bound, source, index, ids, summary, bounds) in enumerate(targets):
+            k = top_k_per_source
+            if limit and len(best) >= limit:
+                kth = best[0]
+                if bound <= kth:
+                    # Sorted by bound: no remaining source can contribute
+                    self.search_stats["sources_skipped"] += len(targets) - pos
+                    break
+                if summary is not None:
+                    k = min(k, summary.count_above(bounds, kth))
+                if k == 0:
+                    self.search_stats["sources_skipped"] += 1
                     continue
+            self.search_stats["sources_searched"] += 1
+            if with_vectors:
+                D, I, R = index.search_and_reconstruct(q, k)
+            else:
+                D, I = index.search(q, k)
+            for rank, (score, idx) in enumerate(zip(D[0].tolist(), I[0].tolist())):
+                # Guard against index/ids mismatch (e.g., from crash during write)
+                if idx >= 0 and idx < len(ids):
+                    hits.append((ids[idx], float(score), source, R[0, rank] if with_vectors else None))
+                    if limit:
+                        if len(best) < limit:
+                            heapq.heappush(best, score)
+                        elif score > best[0]:
+                            heapq.heapreplace(best, score)
+
+        hits.sort(key=lambda h: h[1], reverse=True)
+        return hits[:limit] if limit else hits
+
+    def search(
+        self,
+        tenant: str,
+        sources: List[str],
+        qvec: List[float],
+        top_k_per_source: int = 8,
+        generation: Optional[dict] = None,
+        collapse: Optional[float] = None,
+        limit: Optional[int] = None,
+    ):
+        """
+        Search the given sources. Pass the active_generation() the query was
+        embedded for, so a generation swapped in meanwhile (with a different
+        model) is not searched with it. With collapse, only the best hit of
+        each group of hits within that cosine of each other is kept (copies
+        of a document across sources, re-ingested versions). With limit, at
+        most that many hits are returned (counted after collapsing) and
+        sources that cannot contribute are not searched (see _gather).
+        """
+        if collapse:
+            return self.search_with_vectors(
+                tenant, sources, qvec, top_k_per_source, generation, collapse, limit
+            )[0]
+
+        q = _normalize(np.array([qvec], dtype=np.float32))
+        with self._lock:
+            hits = self._gather(tenant, sources, q, top_k_per_source, generation, limit, with_vectors=False)
+        return [h[:3] for h in hits]
+
+    def search_with_vectors(
+        self,
+        tenant: str,
+        sources: List[str],
+        qvec: List[float],
+        top_k_per_source: int = 8,
+        generation: Optional[dict] = None,
+        collapse: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> Tuple[List[Tuple[str, float, str]], np.ndarray]:
+        """Like search, plus the hits' stored (normalized) vectors, row for row."""
+        q = _normalize(np.array([qvec], dtype=np.float32))
+        want = limit
+        while True:
+            with self._lock:
+                hits = self._gather(tenant, sources, q, top_k_per_source, generation, want, with_vectors=True)
+            kept, vectors = _split_vectors(hits, q.shape[1], collapse)
+            # Collapsing drops hits, so gather more until `limit` survive or
+            # there are no more. A hit survives unless a better hit duplicates
+            # it, so the survivors of the best `want` are the first survivors
+            # of all of them
+            if not (collapse and limit) or len(kept) >= limit or len(hits) < want:
+                return kept[:limit], vectors[:limit]
+            want *= 2
+
+    def _gather_batch(
+        self,
+        tenant: str,
+        sources: List[str],
+        q: np.ndarray,
+        top_k_per_source: int,
+        generation: Optional[dict],
+        limit: Optional[int],
+        with_vectors: bool,
+    ) -> List[List[tuple]]:
+        """_gather for a matrix of queries: one FAISS call per source for all of them."""
+        per_query: List[List[tuple]] = [[] for _ in range(len(q))]
+        for source in sources:
+            index, ids = self._load(tenant, source, dim=q.shape[1], generation=generation)
+            if index.ntotal == 0 or index.d != q.shape[1]:
+                continue
+            self.search_stats["sources_searched"] += 1
+            if with_vectors:
+                D, I, R = index.search_and_reconstruct(q, top_k_per_source)
+            else:
                 D, I = index.search(q, top_k_per_source)
-                for score, idx in zip(D[0].tolist(), I[0].tolist()):
-                    # Guard against index/ids mismatch (e.g., from crash during write)
+            for row, (scores, idxs) in enumerate(zip(D.tolist(), I.tolist())):
+                hits = per_query[row]
+                for rank, (score, idx) in enumerate(zip(scores, idxs)):
                     if idx >= 0 and idx < len(ids):
-                        scored.append((ids[idx], float(score), source))
+                        hits.append((ids[idx], float(score), source, R[row, rank] if with_vectors else None))
+        self.search_stats["searches"] += len(q)
+        for hits in per_query:
+            hits.sort(key=lambda h: h[1], reverse=True)
+        return [hits[:limit] if limit else hits for hits in per_query]
+
+    def search_batch(
+        self,
+        tenant: str,
+        sources: List[str],
+        qvecs: List[List[float]],
+        top_k_per_source: int = 8,
+        generation: Optional[dict] = None,
+        collapse: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> List[List[Tuple[str, float, str]]]:
+        """
+        search() for many queries at once, one result list per query. Each
+        source is searched once for the whole query matrix, which is much
+        cheaper than one call per query; sources are not pruned.
+        """
+        if collapse:
+            return [
+                hits for hits, _ in self.search_batch_with_vectors(
+                    tenant, sources, qvecs, top_k_per_source, generation, collapse, limit
+                )
+            ]
+        q = _normalize(np.array(qvecs, dtype=np.float32))
+        with self._lock:
+            results = self._gather_batch(tenant, sources, q, top_k_per_source, generation, limit, with_vectors=False)
+        return [[h[:3] for h in hits] for hits in results]
+
+    def search_batch_with_vectors(
+        self,
+        tenant: str,
+        sources: List[str],
+        qvecs: List[List[float]],
+        top_k_per_source: int = 8,
+        generation: Optional[dict] = None,
+        collapse: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[List[Tuple[str, float, str]], np.ndarray]]:
+        """Like search_batch, plus each query's hit vectors (as search_with_vectors)."""
+        q = _normalize(np.array(qvecs, dtype=np.float32))
+        with self._lock:
+            # Sources are not pruned here, so every hit is at hand: collapse, then limit
+            results = self._gather_batch(
+                tenant, sources, q, top_k_per_source, generation, None if collapse else limit, with_vectors=True
+            )
+        out = []
+        for hits in results:
+            kept, vectors = _split_vectors(hits, q.shape[1], collapse)
+            out.append((kept[:limit], vectors[:limit]))
+        return out
 
-        scored.sort(key=lambda x: x[1], reverse=True)
-        return scored
@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import threading
+from typing import Dict, List, Tuple
+
+
+class IngestJournal:
+    """
+    Append-only write-ahead journal of per-file ingest progress.
+
+    Each line records the stage a file reached for one content version
+    (identified by its ingestKey):
+
+        convex_pending  the Convex write was sent, outcome unknown
+        convex_done     Convex returned docId/chunkIds
+        indexed         vectors are in FAISS and the manifest is updated
+        discarded       an unfinished version was cleaned up
+
+    Replaying the journal after a crash tells the next run which Convex ids it
+    can reuse and which writes it has to reconcile. A torn final line (crash
+    mid-write) is ignored and cut off.
+    """
+
+    TERMINAL = ("indexed", "discarded")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.state: Dict[Tuple[str, str], dict] = {}
+        if os.path.exists(path):
+            complete = 0
+            with open(path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    complete += len(line)
+                    try:
+                        rec = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._apply(rec)
+            if complete != os.path.getsize(path):
+                # Cut the torn line, or the next record would be appended to it
+                with open(path, "r+b") as f:
+                    f.truncate(complete)
+        self._f = open(path, "a")
+
+    @classmethod
+    def for_tenant(cls, base_dir: str, tenant: str) -> "IngestJournal":
+        d = os.path.join(base_dir, tenant)
+        os.makedirs(d, exist_ok=True)
+        return cls(os.path.join(d, "ingest_journal.jsonl"))
+
+    def _apply(self, rec: dict):
+        key = (rec["key"], rec["ingestKey"])
+        if rec["stage"] in self.TERMINAL:
+            self.state.pop(key, None)
+            return
+        st = self.state.setdefault(key, {})
+        # Streamed documents journal their chunk ids one window at a time
+        appended = rec.pop("appendChunkIds", None)
+        st.update(rec)
+        if appended:
+            st.setdefault("chunkIds", []).extend(appended)
+
+    def record_many(self, records: List[dict]):
+        """Durably append records ({"key", "ingestKey", "stage", ...})."""
+        if not records:
+            return
+        with self._lock:
+            now = time.time()
+            for rec in records:
+                rec = {**rec, "ts": now}
+                self._f.write(json.dumps(rec) + "\n")
+                self._apply(dict(rec))
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def record(self, key: str, ingest_key: str, stage: str, **fields):
+        self.record_many([{"key": key, "ingestKey": ingest_key, "stage": stage, **fields}])
+
+    def resumable(self, key: str, ingest_key: str) -> dict:
+        """Unfinished state for this exact content version, or {}."""
+        return self.state.get((key, ingest_key), {})
+
+    def unfinished(self) -> List[dict]:
+        return list(self.state.values())
+
+    def compact(self):
+        """Rewrite the journal with only the unfinished states (empty after a clean run)."""
+        with self._lock:
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                for rec in self.state.values():
+                    f.write(json.dumps(rec) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._f.close()
+            os.replace(tmp, self.path)
+            self._f = open(self.path, "a")
+
+    def close(self):
+        self._f.close()
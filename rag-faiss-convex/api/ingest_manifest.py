@@ -0,0 +1,74 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class IngestManifest:
+    """
+    Per-tenant record of what has been ingested, keyed by source path.
+
+    Each entry holds the file's size, mtime_ns and sha256, the Convex docId it
+    was ingested as, and the hash + chunkId of every chunk, so re-runs can skip
+    unchanged files, reuse vectors for unchanged chunks and retire files that
+    were deleted.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.files: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                self.files = data.get("files", {})
+
+    @classmethod
+    def for_tenant(cls, base_dir: str, tenant: str) -> "IngestManifest":
+        d = os.path.join(base_dir, tenant)
+        os.makedirs(d, exist_ok=True)
+        return cls(os.path.join(d, "ingest_manifest.json"))
+
+    def get(self, key: str) -> Optional[dict]:
+        return self.files.get(key)
+
+    def is_unchanged(self, key: str, size: int, mtime_ns: int) -> bool:
+        entry = self.files.get(key)
+        return bool(entry) and entry["size"] == size and entry["mtime_ns"] == mtime_ns
+
+    def set(self, key: str, entry: dict):
+        with self._lock:
+            self.files[key] = entry
+
+    def remove(self, key: str):
+        with self._lock:
+            self.files.pop(key, None)
+
+    def keys(self) -> List[str]:
+        return list(self.files)
+
+    def save(self):
+        with self._lock:
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump({"version": self.VERSION, "files": self.files}, f)
+            os.replace(tmp, self.path)
@@ -0,0 +1,139 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List
+
+from api.chunker import chunk_spans, utf16_spans
+from api.convex_bulk import ConvexBulkWriter
+from api.embed_batcher import EmbeddingBatcher
+from api.faiss_store import FaissPerSourceStore
+from api.writer_lock import TenantWriterLock
+
+
+class _Request:
+    __slots__ = ("docs", "future")
+
+    def __init__(self, docs: List[dict]):
+        self.docs = docs
+        self.future: Future = Future()
+
+
+class IngestQueue:
+    """
+    Per-tenant single-writer ingestion inside the API.
+
+    Requests are queued per tenant and drained by one worker thread per
+    tenant, which groups whatever has arrived within max_wait (up to
+    max_batch_docs documents) into one batch: chunk, embed in shared
+    requests, write to Convex in bulk, then one FAISS add (one published
+    index version) per source. The tenant's writer lock is held while a batch
+    is written, so batch ingest scripts and the API never write the same
+    indexes at once.
+    """
+
+    def __init__(
+        self,
+        store: FaissPerSourceStore,
+        batchers: Callable[[str], EmbeddingBatcher],
+        writer: ConvexBulkWriter,
+        models: Callable[[str], str],
+        max_batch_docs: int = 64,
+        max_wait: float = 0.05,
+        lock_timeout: float = 60.0,
+    ):
+        self.store = store
+        # Tenant id -> its embedding model spec, and model spec -> batcher
+        self.models = models
+        self.batchers = batchers
+        self.writer = writer
+        self.max_batch_docs = max_batch_docs
+        self.max_wait = max_wait
+        self.lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+        self._queues: Dict[str, queue.Queue] = {}
+
+    def submit(self, tenant_id: str, docs: List[dict]) -> Future:
+        """
+        Queue documents ({sourceKey, title, rawText, sourceUrl?}). The future
+        resolves to [{docId, chunks}] in the same order.
+        """
+        req = _Request(docs)
+        with self._lock:
+            q = self._queues.get(tenant_id)
+            if q is None:
+                q = self._queues[tenant_id] = queue.Queue()
+                threading.Thread(
+                    target=self._worker, args=(tenant_id, q), name=f"ingest-{tenant_id}", daemon=True
+                ).start()
+        q.put(req)
+        return req.future
+
+    def pending(self) -> Dict[str, int]:
+        return {tenant: q.qsize() for tenant, q in self._queues.items()}
+
+    def _worker(self, tenant_id: str, q: queue.Queue):
+        while True:
+            batch = [q.get()]
+            n_docs = len(batch[0].docs)
+            deadline = time.monotonic() + self.max_wait
+            while n_docs < self.max_batch_docs:
+                try:
+                    req = q.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                batch.append(req)
+                n_docs += len(req.docs)
+            try:
+                results = self._write(tenant_id, [d for req in batch for d in req.docs])
+            except Exception as e:
+                for req in batch:
+                    req.future.set_exception(e)
+                continue
+            pos = 0
+            for req in batch:
+                req.future.set_result(results[pos:pos + len(req.docs)])
+                pos += len(req.docs)
+
+    def _write(self, tenant_id: str, docs: List[dict]) -> List[dict]:
+        model = self.models(tenant_id)
+        spans = [chunk_spans(d["rawText"]) for d in docs]
+        vectors = self.batchers(model).embed_documents(
+            [[d["rawText"][s:e] for s, e in sp] for d, sp in zip(docs, spans)]
+        )
+        payload = []
+        for doc, sp in zip(docs, spans):
+            row = {
+                "sourceKey": doc["sourceKey"],
+                "title": doc["title"],
+                "rawText": doc["rawText"],
+                "chunks": [
+                    {"chunkIndex": i, "start": s, "end": e}
+                    for i, (s, e) in enumerate(utf16_spans(doc["rawText"], sp))
+                ],
+            }
+            if doc.get("sourceUrl"):
+                row["sourceUrl"] = doc["sourceUrl"]
+            payload.append(row)
+
+        lock = TenantWriterLock(self.store.base_dir, tenant_id)
+        lock.acquire(timeout=self.lock_timeout)
+        try:
+            # A rebuild may have moved the tenant to another model since the batch was embedded
+            self.store.require_model(tenant_id, model)
+            written = self.writer.add_documents(tenant_id, payload)
+            by_source: Dict[str, tuple] = {}
+            for doc, vecs, ids in zip(docs, vectors, written):
+                src_vecs, src_ids = by_source.setdefault(doc["sourceKey"], ([], []))
+                src_vecs.extend(vecs)
+                src_ids.extend(ids["chunkIds"])
+            for source, (src_vecs, src_ids) in by_source.items():
+                # Re-submitting identical documents returns ids that are already indexed
+                present = self.store.contains(tenant_id, source, src_ids)
+                pairs = [(v, cid) for v, cid in zip(src_vecs, src_ids) if cid not in present]
+                if pairs:
+                    self.store.add(tenant_id, source, [p[0] for p in pairs], [p[1] for p in pairs])
+        finally:
+            lock.release()
+
+        return [{"docId": w["docId"], "chunks": len(w["chunkIds"])} for w in written]
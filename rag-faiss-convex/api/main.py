@@ -1,12 +1,34 @@
 import os
-from typing import Optional
+import json
+import math
+import base64
+import hashlib
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Literal, Optional
 import requests
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from openai import OpenAI
 from api.faiss_store import FaissPerSourceStore
+from api.embed_batcher import EmbeddingBatcher
+from api.embed_cache import LRUCache, cache_from_env
+from api.embeddings import EmbeddingProvider, get_provider, tenant_model
+from api.convex_bulk import ConvexBulkWriter
+from api.dedupe import DEDUPE_COSINE, DEDUPE_JACCARD
+from api.diversify import MMR_CANDIDATES, MMR_LAMBDA, mmr
+from api.context import build_context, prompt_tokens
+from api.ingest_queue import IngestQueue
+from api.singleflight import SingleFlight
+from api.admission import Admission, Overloaded
+from api.writer_lock import WriterLockHeld
+from api.chunker import codepoint_offsets, utf16_length
+from api.http_cache import FastJSONResponse, dumps, encode_body, etag_matches, json_response, make_etag
 
 load_dotenv()
 
@@ -18,6 +40,19 @@ oa = OpenAI(
 EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")
 CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
 
+# Concurrency and rate limits on upstream calls, overall and per tenant, with
+# fair queuing between tenants (ADMIT_<UPSTREAM>_* in .env.example)
+embed_admission = Admission.from_env("embeddings", "ADMIT_EMBED", max_concurrency=16, tenant_concurrency=4)
+chat_admission = Admission.from_env("chat", "ADMIT_CHAT", max_concurrency=16, tenant_concurrency=4)
+convex_admission = Admission.from_env("convex", "ADMIT_CONVEX", max_concurrency=32, tenant_concurrency=8)
+# Convex calls that authenticate a request run before its tenant is known, so
+# they get their own pool without a per-tenant cap instead of sharing one
+# tenant's share of convex_admission
+_auth_concurrency = int(os.getenv("ADMIT_AUTH_CONCURRENCY", "32"))
+auth_admission = Admission.from_env(
+    "auth", "ADMIT_AUTH", max_concurrency=_auth_concurrency, tenant_concurrency=_auth_concurrency
+)
+
 # All available sources in the system (must match convex/users.ts AVAILABLE_SOURCES)
 ALL_SOURCES = ["gdrive", "confluence", "slack", "notion", "public", "finance", "engineering", "hr"]
 
@@ -31,7 +66,7 @@ def get_allowed_sources(user: dict) -> list:
     return user.get("allowedSources", [])
 
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # CORS for local development
 app.add_middleware(
@@ -43,18 +78,50 @@ app.add_middleware(
 )
 
 
-def convex_call(kind: str, path: str, args: dict, token: Optional[str] = None):
-    """Call Convex API with optional auth token."""
+@app.exception_handler(Overloaded)
+def overloaded(request: Request, exc: Overloaded):
+    # Fail fast instead of piling up behind a saturated upstream
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+
+@app.exception_handler(WriterLockHeld)
+def writer_busy(request: Request, exc: WriterLockHeld):
+    # ingest_folder, the watch daemon or a rebuild is writing the tenant's indexes
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Another ingestion or rebuild is writing this tenant's indexes, retry later"},
+        headers={"Retry-After": str(WRITER_BUSY_RETRY_AFTER)},
+    )
+
+
+def convex_call(
+    kind: str,
+    path: str,
+    args: dict,
+    token: Optional[str] = None,
+    reject: bool = True,
+    admission: Optional[Admission] = None,
+):
+    """
+    Call Convex API with optional auth token. reject=False waits out overload
+    (background work); admission replaces convex_admission (auth_admission).
+    """
     headers = {"Content-Type": "application/json"}
     if token:
         headers["Authorization"] = f"Bearer {token}"
     
-    r = requests.post(
-        f"{CONVEX_URL}/api/{kind}",
-        json={"path": path, "args": args, "format": "json"},
-        headers=headers,
-        timeout=60,
-    )
+    # Calls without a tenantId share one queue
+    with (admission or convex_admission).slot(args.get("tenantId", "-"), reject=reject):
+        r = requests.post(
+            f"{CONVEX_URL}/api/{kind}",
+            json={"path": path, "args": args, "format": "json"},
+            headers=headers,
+            timeout=60,
+        )
     r.raise_for_status()
     data = r.json()
     if data.get("status") != "success":
@@ -74,6 +141,85 @@ def get_auth_token(request: Request) -> Optional[str]:
     return request.cookies.get("__convexAuthToken")
 
 
+def _provider_embed(provider: EmbeddingProvider, tenant_id: str, texts: List[str], reject: bool = True):
+    """Embed texts, within the embeddings admission limits when the model is remote."""
+    if not provider.remote:
+        return provider.embed(texts)
+    with embed_admission.slot(tenant_id, reject=reject):
+        return provider.embed(texts)
+
+
+# One ingest batcher (and embedding cache) per embedding model in use
+_ingest_batchers = {}
+_ingest_batchers_lock = threading.Lock()
+
+
+def _ingest_batcher(model: str) -> EmbeddingBatcher:
+    with _ingest_batchers_lock:
+        batcher = _ingest_batchers.get(model)
+        if batcher is None:
+            provider = get_provider(model, oa)
+            # Ingestion is background work: it queues rather than being turned away
+            batcher = _ingest_batchers[model] = EmbeddingBatcher(
+                lambda texts: _provider_embed(provider, "-ingest", texts, reject=False),
+                cache=cache_from_env(model),
+                near_duplicates=DEDUPE_JACCARD or None,
+            )
+        return batcher
+
+
+# Repeated questions and later /search pages skip the embedding call
+query_embeddings = LRUCache(int(os.getenv("QUERY_EMBED_CACHE_ITEMS", "1024")))
+
+
+def _embed_queries(tenant_id: str, texts: List[str], generation: dict) -> List[List[float]]:
+    # Queries must use the model the tenant's served indexes were built with,
+    # which differs from the configured one while a migration is being rolled out
+    model = generation["model"] or tenant_model(tenant_id, EMBED_MODEL)
+    embs = {text: query_embeddings.get((model, text)) for text in texts}
+    missing = [text for text, emb in embs.items() if emb is None]
+    if missing:
+        # One request for all uncached queries
+        out = _provider_embed(get_provider(model, oa), tenant_id, missing)
+        for text, emb in zip(missing, out):
+            embs[text] = emb
+            query_embeddings.put((model, text), emb)
+    return [embs[text] for text in texts]
+
+
+def _embed_query(tenant_id: str, text: str, generation: dict) -> List[float]:
+    return _embed_queries(tenant_id, [text], generation)[0]
+
+
+# All FAISS writes made by the API go through one worker per tenant
+ingest_queue = IngestQueue(
+    faiss_store,
+    _ingest_batcher,
+    ConvexBulkWriter(lambda path, args: convex_call("mutation", path, args, reject=False)),
+    models=lambda tenant_id: tenant_model(tenant_id, EMBED_MODEL),
+    max_batch_docs=int(os.getenv("INGEST_BATCH_DOCS", "64")),
+    max_wait=float(os.getenv("INGEST_BATCH_WAIT_MS", "50")) / 1000,
+)
+INGEST_TIMEOUT = float(os.getenv("INGEST_TIMEOUT_SECONDS", "300"))
+# Retry-After for ingestion refused because another process holds the writer lock
+WRITER_BUSY_RETRY_AFTER = 30
+MAX_INGEST_BULK = 1000
+
+# /search pages through the best SEARCH_DEPTH hits, at most MAX_SEARCH_K per page
+SEARCH_DEPTH = int(os.getenv("SEARCH_DEPTH", "100"))
+# /chat hits searched for: the MMR pool if MMR is on, else just the top 8
+CHAT_CANDIDATES = max(MMR_CANDIDATES, 8) if MMR_LAMBDA < 1.0 else 8
+MAX_SEARCH_K = 50
+
+MAX_CHAT_BATCH = 100
+# Chat completions in flight per /chat/batch request (also bounded by ADMIT_CHAT_*)
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "8"))
+
+# Identical questions asked at the same time under the same ACL share one answer
+CHAT_COALESCE = os.getenv("CHAT_COALESCE", "true").lower() == "true"
+chat_flights = SingleFlight()
+
+
 def _require_user(request: Request) -> dict:
     """Get current user from Convex Auth session."""
     token = get_auth_token(request)
@@ -82,7 +228,7 @@ def _require_user(request: Request) -> dict:
     if not token and os.getenv("ALLOW_HEADER_AUTH", "").lower() == "true":
         user_id = request.headers.get("x-user-id")
         if user_id:
-            user = convex_call("query", "users:get", {"userId": user_id})
+            user = convex_call("query", "users:get", {"userId": user_id}, admission=auth_admission)
             if user:
                 return user
     
@@ -92,16 +238,57 @@ def _require_user(request: Request) -> dict:
     # Call the currentUser query with the auth token
     # This validates the session and returns the user
     try:
-        user = convex_call("query", "users:currentUser", {}, token=token)
-        if not user:
-            raise HTTPException(401, "User not found")
-        return user
+        user = convex_call("query", "users:currentUser", {}, token=token, admission=auth_admission)
+    except Overloaded:
+        # Not an authentication failure: answered with 429 and Retry-After
+        raise
     except Exception as e:
         raise HTTPException(401, f"Authentication failed: {str(e)}")
+    if not user:
+        raise HTTPException(401, "User not found")
+    return user
+
+
+# Fields of each retrieved chunk in /chat responses: "all" (snippet and full
+# chunkText), "text" (chunkText only), "snippets" (snippet only) or "ids"
+# (ids, scores and offsets only)
+HitFields = Literal["all", "text", "snippets", "ids"]
+_OMITTED_FIELDS = {
+    "all": (),
+    "text": ("snippet",),
+    "snippets": ("chunkText",),
+    "ids": ("snippet", "chunkText", "docTitle", "sourceUrl"),
+}
 
 
 class ChatIn(BaseModel):
     message: str
+    fields: HitFields = "all"
+
+
+class ChatBatchIn(BaseModel):
+    messages: List[str]
+    fields: HitFields = "all"
+
+
+class SearchIn(BaseModel):
+    query: str
+    k: int = 10
+    # Narrows the user's allowed sources; never widens them
+    sources: Optional[List[str]] = None
+    cursor: Optional[str] = None
+    includeText: bool = False
+
+
+class IngestDocIn(BaseModel):
+    sourceKey: str
+    title: str
+    rawText: str
+    sourceUrl: Optional[str] = None
+
+
+class IngestBulkIn(BaseModel):
+    documents: List[IngestDocIn]
 
 
 class FeedbackIn(BaseModel):
@@ -129,25 +316,169 @@ def me(request: Request):
     }
 
 
+@app.get("/admission")
+def admission_stats(request: Request):
+    """Queue lengths, queue times and rejections per upstream (admins only)."""
+    user = _require_user(request)
+    if user.get("role") != "admin":
+        raise HTTPException(403, "Only admins can view admission stats")
+    return {a.name: a.stats() for a in (embed_admission, chat_admission, convex_admission, auth_admission)}
+
+
+# Hot documents and encoded /documents responses are kept in memory. Documents
+# are never modified in place, so entries only go stale when a document is
+# deleted; the TTL bounds how long a deleted document is still served.
+DOC_CACHE_MB = int(os.getenv("DOC_CACHE_MB", "256"))
+DOC_CACHE_TTL_SECONDS = float(os.getenv("DOC_CACHE_TTL_SECONDS", "300"))
+# Chunks either side of ?chunk= returned by default, and at most
+DOC_WINDOW = 2
+MAX_DOC_WINDOW = 20
+
+documents_cache = LRUCache(4096, max_bytes=DOC_CACHE_MB << 20, ttl=DOC_CACHE_TTL_SECONDS)
+document_bodies = LRUCache(4096, max_bytes=DOC_CACHE_MB << 20, ttl=DOC_CACHE_TTL_SECONDS)
+
+
+def _document(tenant_id: str, doc_id: str) -> Optional[tuple]:
+    """(document, content version), from the cache when hot."""
+    key = (tenant_id, doc_id)
+    entry = documents_cache.get(key)
+    if entry is None:
+        doc = convex_call("query", "documents:get", {"id": doc_id, "tenantId": tenant_id})
+        if not doc:
+            return None
+        version = doc.get("ingestKey") or hashlib.sha256(doc["rawText"].encode("utf-8")).hexdigest()
+        entry = (doc, version)
+        documents_cache.put(key, entry, nbytes=len(doc["rawText"]))
+    return entry
+
+
+def _document_range(tenant_id: str, doc_id: str, chunk: Optional[int], window: int, start: Optional[int], end: Optional[int]):
+    """UTF-16 [start, end) of the requested range; end None means to the end of the document."""
+    if chunk is None:
+        return start or 0, end
+    rows = convex_call("query", "chunks:getRange", {
+        "docId": doc_id,
+        "tenantId": tenant_id,
+        "from": chunk - window,
+        "to": chunk + window,
+    })
+    if not rows:
+        raise HTTPException(404, "Chunk not found")
+    spans = [(r["start"], r["end"]) for r in rows if r.get("start") is not None]
+    if not spans:
+        # Ingested before chunk offsets were recorded
+        return 0, None
+    return min(s for s, _ in spans), max(e for _, e in spans)
+
+
 @app.get("/documents/{doc_id}")
-def get_document(doc_id: str, request: Request):
+def get_document(
+    doc_id: str,
+    request: Request,
+    chunk: Optional[int] = None,
+    window: int = DOC_WINDOW,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+):
+    """
+    A document, or part of it: ?chunk=N returns chunks N-window..N+window,
+    ?start=&end= a UTF-16 offset range of rawText (as in chunk hits). The
+    response carries the range's start and end and the full length. Bodies
+    are compressed when the client accepts it, and an ETag over the
+    document's content version and the range answers repeat requests with
+    304 (after the same access checks as any other request).
+    """
     user = _require_user(request)
     tenant_id = user["tenantId"]
     allowed_sources = set(get_allowed_sources(user))
 
-    doc = convex_call("query", "documents:get", {"id": doc_id, "tenantId": tenant_id})
-    if not doc:
+    if chunk is not None and (start is not None or end is not None):
+        raise HTTPException(400, "Use either chunk or start/end")
+    if chunk is not None and (chunk < 0 or not 0 <= window <= MAX_DOC_WINDOW):
+        raise HTTPException(400, f"chunk must be >= 0 and window between 0 and {MAX_DOC_WINDOW}")
+    if (start is not None and start < 0) or (end is not None and end < (start or 0)):
+        raise HTTPException(400, "Invalid start/end")
+
+    entry = _document(tenant_id, doc_id)
+    if entry is None:
         raise HTTPException(404, "Document not found")
+    doc, version = entry
     if doc["sourceKey"] not in allowed_sources:
         raise HTTPException(403, "Access denied")
 
-    return {
-        "id": doc["_id"],
-        "title": doc["title"],
-        "sourceKey": doc["sourceKey"],
-        "rawText": doc["rawText"],
-        "sourceUrl": doc.get("sourceUrl"),
+    if chunk is not None:
+        range_key = f"chunk={chunk}&window={window}"
+    elif start is not None or end is not None:
+        range_key = f"start={start or 0}&end={'' if end is None else end}"
+    else:
+        range_key = ""
+    etag = make_etag(doc_id, version, range_key)
+    headers = {
+        "ETag": etag,
+        # Per-user content: the browser may keep it but must revalidate
+        "Cache-Control": "private, no-cache",
+        "Vary": "Accept-Encoding, Authorization, Cookie",
     }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    accept_encoding = request.headers.get("accept-encoding")
+    cached = document_bodies.get((etag, accept_encoding))
+    if cached is None:
+        text = doc["rawText"]
+        length = utf16_length(text)
+        lo, hi = _document_range(tenant_id, doc_id, chunk, window, start, end)
+        lo = min(lo, length)
+        hi = length if hi is None else min(hi, length)
+        cp_lo, cp_hi = codepoint_offsets(text, [lo, hi])
+        body = dumps({
+            "id": doc["_id"],
+            "title": doc["title"],
+            "sourceKey": doc["sourceKey"],
+            "rawText": text[cp_lo:cp_hi],
+            "truncated": doc.get("truncated", False),
+            "sourceUrl": doc.get("sourceUrl"),
+            "start": lo,
+            "end": hi,
+            "length": length,
+            "version": version,
+        })
+        cached = encode_body(body, accept_encoding)
+        document_bodies.put((etag, accept_encoding), cached, nbytes=len(cached[0]))
+    body, encoding = cached
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def _ingest(user: dict, docs: List[IngestDocIn]) -> list:
+    if user.get("role") != "admin":
+        raise HTTPException(403, "Only admins can ingest documents")
+    unknown = sorted({d.sourceKey for d in docs} - set(ALL_SOURCES))
+    if unknown:
+        raise HTTPException(400, f"Unknown sources: {', '.join(unknown)}")
+    future = ingest_queue.submit(user["tenantId"], [d.model_dump(exclude_none=True) for d in docs])
+    try:
+        # Awaited on the event loop, so a request waiting for its batch holds
+        # no threadpool worker; shielded so a timeout doesn't cancel the batch
+        return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), INGEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        # Still queued or being written; it will complete in the background
+        raise HTTPException(504, "Ingestion did not finish in time")
+
+
+@app.post("/ingest")
+async def ingest(payload: IngestDocIn, request: Request):
+    user = await run_in_threadpool(_require_user, request)
+    return (await _ingest(user, [payload]))[0]
+
+
+@app.post("/ingest/bulk")
+async def ingest_bulk(payload: IngestBulkIn, request: Request):
+    user = await run_in_threadpool(_require_user, request)
+    if len(payload.documents) > MAX_INGEST_BULK:
+        raise HTTPException(400, f"At most {MAX_INGEST_BULK} documents per request")
+    return {"documents": await _ingest(user, payload.documents)}
 
 
 @app.post("/feedback")
@@ -167,6 +498,93 @@ def feedback(payload: FeedbackIn, request: Request):
     return {"status": "ok"}
 
 
+def _search_cursor(offset: int, fingerprint: str) -> str:
+    raw = json.dumps({"o": offset, "f": fingerprint}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _search_offset(cursor: str, fingerprint: str) -> int:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        offset, owner = int(data["o"]), data["f"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
+    if owner != fingerprint or offset < 0:
+        raise HTTPException(400, "Cursor belongs to a different search")
+    return offset
+
+
+@app.post("/search")
+def search(payload: SearchIn, request: Request):
+    """Ranked, ACL-filtered chunks without an LLM call or a query log."""
+    user = _require_user(request)
+    if not 1 <= payload.k <= MAX_SEARCH_K:
+        raise HTTPException(400, f"k must be between 1 and {MAX_SEARCH_K}")
+
+    tenant_id = user["tenantId"]
+    allowed_sources = get_allowed_sources(user)
+    if payload.sources is not None:
+        allowed_sources = [s for s in allowed_sources if s in set(payload.sources)]
+    fingerprint = hashlib.sha256(
+        json.dumps([payload.query, sorted(allowed_sources)]).encode()
+    ).hexdigest()[:16]
+    offset = _search_offset(payload.cursor, fingerprint) if payload.cursor else 0
+    if not allowed_sources or offset >= SEARCH_DEPTH:
+        return {"hits": [], "nextCursor": None}
+
+    generation = faiss_store.active_generation(tenant_id)
+    emb = _embed_query(tenant_id, payload.query, generation)
+    # Every page re-ranks the same SEARCH_DEPTH candidates (the query
+    # embedding is cached), so pages line up without server-side state
+    candidates = faiss_store.search(
+        tenant_id, allowed_sources, emb, top_k_per_source=SEARCH_DEPTH, generation=generation,
+        collapse=DEDUPE_COSINE or None, limit=SEARCH_DEPTH,
+    )
+    page = candidates[offset:offset + payload.k]
+    if not page:
+        return {"hits": [], "nextCursor": None}
+
+    chunk_ids = [cid for (cid, _, _) in page]
+    chunks = convex_call("query", "chunks:getMany", {"ids": chunk_ids, "tenantId": tenant_id})
+    by_id = {c["_id"]: c for c in chunks}
+    doc_ids = list({c["docId"] for c in chunks})
+    docs = convex_call("query", "documents:getMany", {"ids": doc_ids, "tenantId": tenant_id})
+    doc_by_id = {d["_id"]: d for d in docs}
+
+    # Defense-in-depth tenant and source check, as in /chat
+    allowed = set(allowed_sources)
+    hits = []
+    for rank, (chunk_id, score, source_key) in enumerate(page, start=offset + 1):
+        chunk = by_id.get(chunk_id)
+        if not chunk or chunk["tenantId"] != tenant_id or chunk["sourceKey"] not in allowed:
+            continue
+        doc = doc_by_id.get(chunk["docId"])
+        if not doc:
+            continue
+        hit = {
+            "rank": rank,
+            "sourceKey": source_key,
+            "score": score,
+            "docId": chunk["docId"],
+            "docTitle": doc["title"],
+            "chunkId": chunk["_id"],
+            "chunkIndex": chunk["chunkIndex"],
+            "snippet": _make_snippet(chunk["text"]),
+            "start": chunk.get("start"),
+            "end": chunk.get("end"),
+            "sourceUrl": doc.get("sourceUrl"),
+        }
+        if payload.includeText:
+            hit["text"] = chunk["text"]
+        hits.append(hit)
+
+    more = offset + payload.k < len(candidates)
+    return json_response(request, {
+        "hits": hits,
+        "nextCursor": _search_cursor(offset + payload.k, fingerprint) if more else None,
+    })
+
+
 @app.post("/chat")
 def chat(payload: ChatIn, request: Request):
     user = _require_user(request)
@@ -185,40 +603,89 @@ def chat(payload: ChatIn, request: Request):
                 "allowedSources": allowed_sources,
                 "retrieved": [],
             },
+            reject=False,
         )
         return {"answer": "No sources available for this user.", "retrieved": [], "logId": log_id}
 
-    emb = oa.embeddings.create(model=EMBED_MODEL, input=payload.message).data[0].embedding
+    # Keyed by everything the answer depends on: the tenant, the effective
+    # source ACL and the question (case and whitespace aside)
+    key = (tenant_id, tuple(sorted(set(allowed_sources))), " ".join(payload.message.lower().split()))
+    if CHAT_COALESCE:
+        result, shared = chat_flights.do(key, lambda: _answer(tenant_id, allowed_sources, payload.message))
+    else:
+        result, shared = _answer(tenant_id, allowed_sources, payload.message), False
+    answer, retrieved, retrieved_for_log, usage = result
+    # Followers made no model call of their own
+    usage = {**usage, "coalesced": shared}
+
+    # The completion is paid for: wait out Convex overload rather than
+    # failing the request after the fact
+    log_id = convex_call(
+        "mutation",
+        "logs:add",
+        {
+            "tenantId": tenant_id,
+            "userId": user["_id"],
+            "message": payload.message,
+            "answer": answer,
+            "allowedSources": allowed_sources,
+            "retrieved": retrieved_for_log,
+            "promptTokens": 0 if shared else usage["promptTokens"],
+        },
+        reject=False,
+    )
 
-    # Only search allowed FAISS indexes (core authorization guarantee)
-    hits = faiss_store.search(tenant_id, allowed_sources, emb, top_k_per_source=8)[:8]
-    chunk_ids = [cid for (cid, _, _) in hits]
+    return json_response(request, {
+        "answer": answer,
+        "retrieved": _select_fields(retrieved, payload.fields),
+        "logId": log_id,
+        "usage": usage,
+    })
 
-    chunks = convex_call("query", "chunks:getMany", {"ids": chunk_ids, "tenantId": tenant_id})
-    by_id = {c["_id"]: c for c in chunks}
 
-    # Preserve FAISS order + defense-in-depth tenant and source check
+def _pick(hits: list, vectors) -> list:
+    """
+    The 8 hits for the prompt, best first. With MMR_LAMBDA below 1 they are
+    diversified (MMR) so one document does not take every slot; the picks are
+    then put back in score order, since the context is packed best first.
+    """
+    pool = min(len(hits), CHAT_CANDIDATES)
+    picked = mmr([score for _, score, _ in hits[:pool]], vectors[:pool], k=8, lam=MMR_LAMBDA)
+    return [hits[i] for i in sorted(picked)]
+
+
+def _allowed_chunks(tenant_id: str, allowed_sources: List[str], hits: list, by_id: dict) -> list:
+    """Chunks of hits in FAISS order, with the defense-in-depth tenant and source check."""
     allowed = set(allowed_sources)
-    ordered = [by_id[cid] for cid in chunk_ids if cid in by_id]
-    ordered = [c for c in ordered if c["tenantId"] == tenant_id and c["sourceKey"] in allowed]
+    ordered = [by_id[cid] for cid, _, _ in hits if cid in by_id]
+    return [c for c in ordered if c["tenantId"] == tenant_id and c["sourceKey"] in allowed]
 
-    context = "\n\n".join([f"[source={c['sourceKey']}]\n{c['text']}" for c in ordered])
 
-    resp = oa.chat.completions.create(
-        model=CHAT_MODEL,
-        messages=[
-            {
-                "role": "system",
-                "content": "Answer using ONLY the provided context. If missing, say you don't know.",
-            },
-            {"role": "user", "content": f"CONTEXT:\n{context}\n\nQUESTION:\n{payload.message}"},
-        ],
-    )
+def _complete(tenant_id: str, message: str, ordered: list, reject: bool = True):
+    """Ask the chat model with the chunks as context: (answer, usage)."""
+    # Best chunks first, within the prompt token budget
+    context, context_stats = build_context(message, ordered)
+    messages = [
+        {
+            "role": "system",
+            "content": "Answer using ONLY the provided context. If missing, say you don't know.",
+        },
+        {"role": "user", "content": f"CONTEXT:\n{context}\n\nQUESTION:\n{message}"},
+    ]
+
+    with chat_admission.slot(tenant_id, reject=reject):
+        resp = oa.chat.completions.create(model=CHAT_MODEL, messages=messages)
+    usage = {**context_stats, "promptTokens": prompt_tokens(messages)}
+    if getattr(resp, "usage", None):
+        usage["promptTokens"] = resp.usage.prompt_tokens
+        usage["completionTokens"] = resp.usage.completion_tokens
+    # content is None when the model returns no text (e.g. a content filter)
+    return resp.choices[0].message.content or "", usage
 
-    doc_ids = list({c["docId"] for c in ordered})
-    docs = convex_call("query", "documents:getMany", {"ids": doc_ids, "tenantId": tenant_id})
-    doc_by_id = {d["_id"]: d for d in docs}
 
+def _retrieved(tenant_id: str, allowed_sources: List[str], hits: list, by_id: dict, doc_by_id: dict):
+    """(retrieved, retrieved_for_log) entries of hits whose chunk and document passed the checks."""
+    allowed = set(allowed_sources)
     retrieved = []
     retrieved_for_log = []
     for chunk_id, score, source_key in hits:
@@ -238,6 +705,9 @@ def chat(payload: ChatIn, request: Request):
                 "chunkIndex": chunk["chunkIndex"],
                 "snippet": _make_snippet(chunk["text"]),
                 "chunkText": chunk["text"],
+                # Offsets of the chunk in the document's rawText (UTF-16 units), when known
+                "start": chunk.get("start"),
+                "end": chunk.get("end"),
                 "sourceUrl": doc.get("sourceUrl"),
             }
         )
@@ -251,22 +721,116 @@ def chat(payload: ChatIn, request: Request):
                 "chunkIndex": chunk["chunkIndex"],
             }
         )
+    return retrieved, retrieved_for_log
 
-    log_id = convex_call(
-        "mutation",
-        "logs:add",
-        {
-            "tenantId": tenant_id,
-            "userId": user["_id"],
-            "message": payload.message,
-            "answer": resp.choices[0].message.content,
-            "allowedSources": allowed_sources,
-            "retrieved": retrieved_for_log,
-        },
+
+def _select_fields(retrieved: list, fields: str) -> list:
+    omitted = _OMITTED_FIELDS[fields]
+    if not omitted:
+        return retrieved
+    return [{k: v for k, v in hit.items() if k not in omitted} for hit in retrieved]
+
+
+def _answer(tenant_id: str, allowed_sources: List[str], message: str):
+    """Retrieve and answer: (answer, retrieved, retrieved_for_log, usage)."""
+    generation = faiss_store.active_generation(tenant_id)
+    emb = _embed_query(tenant_id, message, generation)
+
+    # Only search allowed FAISS indexes (core authorization guarantee). Hits are
+    # over-fetched so the top 8 are still full after near-duplicates collapse
+    hits, vectors = faiss_store.search_with_vectors(
+        tenant_id, allowed_sources, emb, top_k_per_source=16, generation=generation,
+        collapse=DEDUPE_COSINE or None, limit=CHAT_CANDIDATES,
     )
+    hits = _pick(hits, vectors)
+    chunk_ids = [cid for (cid, _, _) in hits]
 
-    return {
-        "answer": resp.choices[0].message.content,
-        "retrieved": retrieved,
-        "logId": log_id,
-    }
+    chunks = convex_call("query", "chunks:getMany", {"ids": chunk_ids, "tenantId": tenant_id})
+    by_id = {c["_id"]: c for c in chunks}
+    ordered = _allowed_chunks(tenant_id, allowed_sources, hits, by_id)
+
+    answer, usage = _complete(tenant_id, message, ordered)
+
+    # After the (paid) completion, so this waits out overload instead of rejecting
+    doc_ids = list({c["docId"] for c in ordered})
+    docs = convex_call("query", "documents:getMany", {"ids": doc_ids, "tenantId": tenant_id}, reject=False)
+    doc_by_id = {d["_id"]: d for d in docs}
+
+    retrieved, retrieved_for_log = _retrieved(tenant_id, allowed_sources, hits, by_id, doc_by_id)
+    return answer, retrieved, retrieved_for_log, usage
+
+
+@app.post("/chat/batch")
+def chat_batch(payload: ChatBatchIn, request: Request):
+    """
+    Answer many questions in one request: one embeddings call, one batched
+    FAISS search, one Convex read each for chunks and documents, completions
+    with bounded concurrency, and one logs:addMany write.
+    """
+    user = _require_user(request)
+    if len(payload.messages) > MAX_CHAT_BATCH:
+        raise HTTPException(400, f"At most {MAX_CHAT_BATCH} messages per request")
+    if not payload.messages:
+        return {"results": []}
+
+    tenant_id = user["tenantId"]
+    allowed_sources = get_allowed_sources(user)
+    rows = [
+        {"tenantId": tenant_id, "userId": user["_id"], "message": message, "allowedSources": allowed_sources}
+        for message in payload.messages
+    ]
+    if not allowed_sources:
+        log_ids = convex_call("mutation", "logs:addMany", {
+            "rows": [{**row, "answer": "No sources available for this user.", "retrieved": []} for row in rows]
+        }, reject=False)
+        return {"results": [
+            {"answer": "No sources available for this user.", "retrieved": [], "logId": log_id}
+            for log_id in log_ids
+        ]}
+
+    generation = faiss_store.active_generation(tenant_id)
+    embs = _embed_queries(tenant_id, payload.messages, generation)
+    # Only search allowed FAISS indexes (core authorization guarantee)
+    searched = faiss_store.search_batch_with_vectors(
+        tenant_id, allowed_sources, embs, top_k_per_source=16, generation=generation,
+        collapse=DEDUPE_COSINE or None, limit=CHAT_CANDIDATES,
+    )
+    picked = [_pick(hits, vectors) for hits, vectors in searched]
+
+    chunk_ids = list({cid for hits in picked for cid, _, _ in hits})
+    chunks = convex_call("query", "chunks:getMany", {"ids": chunk_ids, "tenantId": tenant_id})
+    by_id = {c["_id"]: c for c in chunks}
+    ordered = [_allowed_chunks(tenant_id, allowed_sources, hits, by_id) for hits in picked]
+    doc_ids = list({c["docId"] for chunks in ordered for c in chunks})
+    docs = convex_call("query", "documents:getMany", {"ids": doc_ids, "tenantId": tenant_id})
+    doc_by_id = {d["_id"]: d for d in docs}
+
+    def complete(i: int):
+        # A failed completion is returned as its exception, failing only its message
+        try:
+            # Bulk work queues for the chat model rather than being rejected
+            return _complete(tenant_id, payload.messages[i], ordered[i], reject=False)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=CHAT_BATCH_CONCURRENCY) as pool:
+        completions = list(pool.map(complete, range(len(payload.messages))))
+
+    results, logged = [], []
+    for i, completion in enumerate(completions):
+        retrieved, retrieved_for_log = _retrieved(tenant_id, allowed_sources, picked[i], by_id, doc_by_id)
+        retrieved = _select_fields(retrieved, payload.fields)
+        if isinstance(completion, Exception):
+            results.append({"answer": None, "error": str(completion), "retrieved": retrieved, "logId": None})
+            continue
+        answer, usage = completion
+        results.append({"answer": answer, "retrieved": retrieved, "usage": usage})
+        logged.append(len(results) - 1)
+        rows[i].update(answer=answer, retrieved=retrieved_for_log, promptTokens=usage["promptTokens"])
+
+    if logged:
+        # The completions are paid for: wait out Convex overload rather than reject
+        log_ids = convex_call("mutation", "logs:addMany", {"rows": [rows[i] for i in logged]}, reject=False)
+        for i, log_id in zip(logged, log_ids):
+            results[i]["logId"] = log_id
+    return json_response(request, {"results": results})
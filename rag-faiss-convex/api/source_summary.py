@@ -0,0 +1,153 @@
+import os
+from typing import Optional
+
+import numpy as np
+import faiss
+
+# Centroids per source codebook (at most one per 8 vectors); more centroids
+# give tighter bounds at the cost of a slower refit. Too few merge topics
+# into wide centroids whose bounds prune nothing
+SUMMARY_CENTROIDS = int(os.getenv("SUMMARY_CENTROIDS", "256"))
+# Members farthest from their centroid (at most 5% of a source) kept as exact
+# vectors instead of widening their centroid's radius
+SUMMARY_OUTLIERS = int(os.getenv("SUMMARY_OUTLIERS", "256"))
+# Search sources in bound order and skip those that cannot make the cut.
+# Off by default: only worth it where benchmarks (scripts/bench_faiss.py)
+# show sources being skipped for real queries
+SOURCE_PRUNING = os.getenv("SOURCE_PRUNING", "false").lower() == "true"
+# Scales each centroid's radius when bounding scores. 1.0 gives true upper
+# bounds (search returns exactly what an exhaustive scan would); smaller
+# values skip more sources at some risk of missing hits; 0 disables pruning.
+SOURCE_BOUND_SCALE = float(os.getenv("SOURCE_BOUND_SCALE", "1.0"))
+
+_FIT_SAMPLE = 20_000
+_ASSIGN_BLOCK = 65_536
+# Float32 rounding margin so a bound is never below a score it must cover
+_EPS = 1e-4
+
+
+class SourceSummary:
+    """
+    A small k-means codebook of a source index: unit centroids, how many
+    vectors each one holds, and the smallest cosine between a centroid and
+    its members (its angular radius). The members farthest from their
+    centroid are kept as exact outlier vectors instead, so a few stragglers
+    do not widen a radius.
+
+    For a query at angle a from a centroid whose members lie within angle r
+    of it, no member scores above cos(max(0, a - r)), so the best possible
+    score in a source, or the number of vectors that could beat a score, is
+    known without searching it (outliers are scored exactly). New vectors are
+    assigned to their nearest centroid as they are added, or kept as
+    outliers while there is room (radii only grow, so bounds stay valid);
+    removals leave the summary conservative. The codebook is refit when the
+    index has doubled or halved since it was fit.
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        counts: np.ndarray,
+        cos_min: np.ndarray,
+        fitted: int,
+        outliers: Optional[np.ndarray] = None,
+        max_outliers: int = 0,
+    ):
+        self.centroids = centroids.astype(np.float32)
+        self.counts = counts.astype(np.int64)
+        self.cos_min = cos_min.astype(np.float32)
+        self.fitted = int(fitted)
+        dim = self.centroids.shape[1]
+        self.outliers = np.zeros((0, dim), np.float32) if outliers is None else outliers.astype(np.float32)
+        self.max_outliers = int(max_outliers)
+
+    @classmethod
+    def fit(
+        cls, index: faiss.Index, n_centroids: int = SUMMARY_CENTROIDS, max_outliers: int = SUMMARY_OUTLIERS,
+    ) -> Optional["SourceSummary"]:
+        n = index.ntotal
+        if n == 0:
+            return None
+        k = max(1, min(n_centroids, n // 8 or 1))
+        sample = index.reconstruct_n(0, n) if n <= _FIT_SAMPLE else np.stack(
+            [index.reconstruct(int(i)) for i in np.random.RandomState(0).choice(n, _FIT_SAMPLE, replace=False)]
+        )
+        if k == 1:
+            centroids = sample.mean(axis=0, keepdims=True)
+        else:
+            km = faiss.Kmeans(index.d, k, niter=10, seed=1, spherical=True, min_points_per_centroid=1)
+            km.train(np.ascontiguousarray(sample, dtype=np.float32))
+            centroids = km.centroids
+        centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        faiss.normalize_L2(centroids)
+        nearest = np.empty(n, np.int64)
+        best = np.empty(n, np.float32)
+        for start in range(0, n, _ASSIGN_BLOCK):
+            sims = index.reconstruct_n(start, min(_ASSIGN_BLOCK, n - start)) @ centroids.T
+            nearest[start:start + len(sims)] = sims.argmax(axis=1)
+            best[start:start + len(sims)] = sims.max(axis=1)
+
+        # The farthest members become exact outliers, the rest set the radii
+        max_outliers = min(max_outliers, n // 20)
+        outlier = np.zeros(n, dtype=bool)
+        if max_outliers:
+            outlier[np.argpartition(best, max_outliers - 1)[:max_outliers]] = True
+        counts, cos_min = np.zeros(k, np.int64), np.ones(k, np.float32)
+        np.add.at(counts, nearest[~outlier], 1)
+        np.minimum.at(cos_min, nearest[~outlier], best[~outlier])
+        outliers = np.stack([index.reconstruct(int(i)) for i in np.flatnonzero(outlier)]) if max_outliers else None
+        return cls(centroids, counts, cos_min, fitted=n, outliers=outliers, max_outliers=max_outliers)
+
+    def update(self, xb: np.ndarray):
+        """Account for newly added (normalized) vectors."""
+        if len(xb) == 0:
+            return
+        sims = xb @ self.centroids.T
+        nearest = sims.argmax(axis=1)
+        best = sims[np.arange(len(xb)), nearest]
+        # Vectors outside their centroid's radius are outliers while there is room
+        wide = np.flatnonzero(best < self.cos_min[nearest])[:max(0, self.max_outliers - len(self.outliers))]
+        if len(wide):
+            self.outliers = np.concatenate([self.outliers, xb[wide].astype(np.float32)])
+            keep = np.ones(len(xb), dtype=bool)
+            keep[wide] = False
+            nearest, best = nearest[keep], best[keep]
+        np.add.at(self.counts, nearest, 1)
+        np.minimum.at(self.cos_min, nearest, best)
+
+    def stale(self, ntotal: int) -> bool:
+        return ntotal > 2 * self.fitted or ntotal < self.fitted // 2
+
+    def centroid_bounds(self, q: np.ndarray, scale: float = SOURCE_BOUND_SCALE) -> np.ndarray:
+        """
+        Upper bound on the score of q against any member of each centroid,
+        followed by each outlier's exact score.
+        """
+        if scale <= 0:
+            bounds = np.full(len(self.counts), np.inf)
+        else:
+            angle_q = np.arccos(np.clip((self.centroids @ q).astype(np.float64), -1.0, 1.0))
+            radius = np.arccos(np.clip(self.cos_min.astype(np.float64), -1.0, 1.0)) * scale
+            bounds = np.cos(np.maximum(0.0, angle_q - radius)) + _EPS
+        bounds[self.counts == 0] = -np.inf
+        return np.concatenate([bounds, (self.outliers @ q).astype(np.float64) + _EPS])
+
+    def count_above(self, bounds: np.ndarray, threshold: float) -> int:
+        """How many vectors could score above threshold, given centroid_bounds()."""
+        k = len(self.counts)
+        return int(self.counts[bounds[:k] > threshold].sum()) + int((bounds[k:] > threshold).sum())
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            np.savez(
+                f, centroids=self.centroids, counts=self.counts, cos_min=self.cos_min, fitted=self.fitted,
+                outliers=self.outliers, max_outliers=self.max_outliers,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "SourceSummary":
+        with np.load(path) as z:
+            # Summaries saved before outliers existed have none
+            outliers = z["outliers"] if "outliers" in z else None
+            max_outliers = int(z["max_outliers"]) if "max_outliers" in z else 0
+            return cls(z["centroids"], z["counts"], z["cos_min"], int(z["fitted"]), outliers, max_outliers)
@@ -0,0 +1,34 @@
+import os
+from typing import List
+
+# tiktoken is optional: without it token counts are estimated from length
+try:
+    import tiktoken
+    HAS_TIKTOKEN = True
+except ImportError:
+    HAS_TIKTOKEN = False
+
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "cl100k_base")
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Token count for the embedding/chat models (approximate without tiktoken)."""
+    if HAS_TIKTOKEN:
+        return len(_get_encoding().encode(text, disallowed_special=()))
+    # ~4 characters per token for English text
+    return (len(text) + 3) // 4
+
+
+def count_tokens_many(texts: List[str]) -> List[int]:
+    if HAS_TIKTOKEN:
+        return [len(t) for t in _get_encoding().encode_batch(texts, disallowed_special=())]
+    return [(len(t) + 3) // 4 for t in texts]
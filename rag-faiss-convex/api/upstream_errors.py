@@ -0,0 +1,34 @@
+from typing import Optional
+
+# Outcomes of a failed upstream call (see classify)
+INPUT = "input"
+FATAL = "fatal"
+TRANSIENT = "transient"
+
+# The request's content was rejected: bad or too long input, payload too large
+_INPUT_STATUSES = (400, 413, 422)
+# Retrying will not help soon: bad credentials, no access, no such model/function
+_FATAL_STATUSES = (401, 403, 404)
+
+
+def status_of(error: BaseException) -> Optional[int]:
+    """HTTP status of an error from openai, requests or httpx, if it carries one."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def classify(error: BaseException) -> str:
+    """
+    INPUT if the request's content was rejected (a smaller request may
+    succeed), FATAL if no retry can succeed soon (auth, permission, exhausted
+    quota), else TRANSIENT (rate limits, 5xx, connection errors, anything
+    unrecognized), which is worth retrying with backoff.
+    """
+    status = status_of(error)
+    if status in _INPUT_STATUSES:
+        return INPUT
+    if status in _FATAL_STATUSES or getattr(error, "code", None) == "insufficient_quota":
+        return FATAL
+    return TRANSIENT
@@ -0,0 +1,59 @@
+import os
+import time
+import fcntl
+
+
+class WriterLockHeld(RuntimeError):
+    pass
+
+
+class TenantWriterLock:
+    """
+    Exclusive per-tenant lock held by whichever process writes the tenant's
+    FAISS indexes and manifest (ingest_folder, the watch daemon, the API's
+    ingest worker while it writes a batch). The lock is an flock on
+    faiss_data/<tenant>/writer.lock, so it is released when the process
+    exits, however it exits.
+    """
+
+    def __init__(self, base_dir: str, tenant: str):
+        d = os.path.join(base_dir, tenant)
+        os.makedirs(d, exist_ok=True)
+        self.path = os.path.join(d, "writer.lock")
+        self._f = None
+
+    def acquire(self, timeout: float = 0.0):
+        """Take the lock, waiting up to timeout seconds for another holder to finish."""
+        f = open(self.path, "a+")
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    continue
+                f.seek(0)
+                holder = f.read().strip() or "unknown"
+                f.close()
+                raise WriterLockHeld(f"another writer holds {self.path} (pid {holder})")
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        self._f = f
+
+    def release(self):
+        if self._f:
+            fcntl.flock(self._f, fcntl.LOCK_UN)
+            self._f.close()
+            self._f = None
+
+    def __enter__(self):
+        if self._f is None:
+            self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
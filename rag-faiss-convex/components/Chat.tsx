@@ -89,6 +89,8 @@ function ChatContent() {
   const [activeDoc, setActiveDoc] = useState<SourceDocument | null>(null);
   const [docLoading, setDocLoading] = useState(false);
   const [docError, setDocError] = useState<string | null>(null);
+  // Load the whole document instead of the chunks around the hit
+  const [docFull, setDocFull] = useState(false);
 
   // Convert Convex user to UI User type
   const user: User | null = currentUser
@@ -109,7 +111,8 @@ function ChatContent() {
       setDocError(null);
       setActiveDoc(null);
       try {
-        const response = await fetch(`/api/documents/${activeSource.docId}`, {
+        const range = docFull ? "" : `?chunk=${activeSource.chunkIndex}`;
+        const response = await fetch(`/api/documents/${activeSource.docId}${range}`, {
           headers: authToken ? { Authorization: `Bearer ${authToken}` } : {},
         });
         if (!response.ok) {
@@ -136,7 +139,7 @@ function ChatContent() {
     return () => {
       cancelled = true;
     };
-  }, [activeSource, authToken]);
+  }, [activeSource, authToken, docFull]);
 
   const suggestions = useMemo(() => (user ? buildSuggestions(user) : []), [user]);
   const quickStarts = useMemo(() => suggestions.slice(0, 4), [suggestions]);
@@ -247,6 +250,7 @@ function ChatContent() {
     setActiveSource(null);
     setActiveDoc(null);
     setDocError(null);
+    setDocFull(false);
   }, []);
 
   // Still loading user data from Convex
@@ -346,6 +350,7 @@ function ChatContent() {
           loading={docLoading}
           error={docError}
           onClose={closeSourceViewer}
+          onShowFull={() => setDocFull(true)}
         />
       )}
     </div>
@@ -9,6 +9,8 @@ export interface SourceHit {
   chunkIndex: number;
   snippet: string;
   chunkText: string;
+  start?: number | null;
+  end?: number | null;
   sourceUrl?: string | null;
 }
 
@@ -7,6 +7,10 @@ export interface SourceDocument {
   sourceKey: string;
   rawText: string;
   sourceUrl?: string | null;
+  // UTF-16 range of the document that rawText covers, and its full length
+  start?: number;
+  end?: number;
+  length?: number;
 }
 
 interface SourceViewerProps {
@@ -15,13 +19,25 @@ interface SourceViewerProps {
   loading: boolean;
   error: string | null;
   onClose: () => void;
+  onShowFull?: () => void;
 }
 
-export function SourceViewer({ hit, document, loading, error, onClose }: SourceViewerProps) {
+export function SourceViewer({ hit, document, loading, error, onClose, onShowFull }: SourceViewerProps) {
   const highlightRef = useRef<HTMLSpanElement>(null);
 
   const highlight = useMemo(() => {
     const text = document?.rawText || "";
+    // Hit offsets are into the whole document; rawText may be a range of it
+    const offset = document?.start ?? 0;
+    const start = hit.start != null ? hit.start - offset : null;
+    const end = hit.end != null ? hit.end - offset : null;
+    if (start != null && end != null && start >= 0 && end <= text.length) {
+      return {
+        before: text.slice(0, start),
+        match: text.slice(start, end),
+        after: text.slice(end),
+      };
+    }
     const target = hit.chunkText || hit.snippet;
     if (!target) {
       return { before: text, match: "", after: "" };
@@ -35,7 +51,7 @@ export function SourceViewer({ hit, document, loading, error, onClose }: SourceV
       match: text.slice(index, index + target.length),
       after: text.slice(index + target.length),
     };
-  }, [document, hit.chunkText, hit.snippet]);
+  }, [document, hit.start, hit.end, hit.chunkText, hit.snippet]);
 
   useEffect(() => {
     if (highlightRef.current) {
@@ -92,6 +108,12 @@ export function SourceViewer({ hit, document, loading, error, onClose }: SourceV
                   Open original source
                 </a>
               )}
+              {onShowFull && document.length != null &&
+                ((document.start ?? 0) > 0 || (document.end ?? document.length) < document.length) && (
+                  <button type="button" className="source-doc-link source-doc-full" onClick={onShowFull}>
+                    Showing the section around this chunk. Show full document
+                  </button>
+                )}
               <div className="source-doc-text">
                 {highlight.match ? (
                   <>
@@ -13,3 +13,19 @@ export const getMany = query({
     return out;
   },
 });
+
+// Offsets of chunks from..to (by chunkIndex) of a document, for ranged document views
+export const getRange = query({
+  args: { docId: v.id("documents"), tenantId: v.string(), from: v.number(), to: v.number() },
+  handler: async (ctx, args) => {
+    const rows = await ctx.db
+      .query("chunks")
+      .withIndex("by_doc", (q) =>
+        q.eq("docId", args.docId).gte("chunkIndex", args.from).lte("chunkIndex", args.to)
+      )
+      .collect();
+    return rows
+      .filter((c) => c.tenantId === args.tenantId)
+      .map((c) => ({ chunkIndex: c.chunkIndex, start: c.start ?? null, end: c.end ?? null }));
+  },
+});
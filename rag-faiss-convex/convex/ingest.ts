@@ -1,5 +1,28 @@
-import { mutation, query } from "./_generated/server";
+import { mutation, query, QueryCtx } from "./_generated/server";
+import { Id } from "./_generated/dataModel";
 import { v } from "convex/values";
+import { paginationOptsValidator } from "convex/server";
+
+// A chunk is sent either as text or as [start, end) offsets into the
+// document's rawText (smaller payloads); offsets are stored either way.
+const chunkArg = v.object({
+  chunkIndex: v.number(),
+  text: v.optional(v.string()),
+  start: v.optional(v.number()),
+  end: v.optional(v.number()),
+});
+
+function chunkRow(rawText: string, c: { chunkIndex: number; text?: string; start?: number; end?: number }) {
+  if (c.text === undefined && (c.start === undefined || c.end === undefined)) {
+    throw new Error(`chunk ${c.chunkIndex} has neither text nor offsets`);
+  }
+  return {
+    chunkIndex: c.chunkIndex,
+    text: c.text ?? rawText.slice(c.start, c.end),
+    start: c.start,
+    end: c.end,
+  };
+}
 
 export const addDocument = mutation({
   args: {
@@ -8,6 +31,8 @@ export const addDocument = mutation({
     title: v.string(),
     rawText: v.string(),
     sourceUrl: v.optional(v.string()),
+    ingestKey: v.optional(v.string()),
+    truncated: v.optional(v.boolean()),
   },
   handler: async (ctx, args) => await ctx.db.insert("documents", args),
 });
@@ -17,17 +42,18 @@ export const addChunks = mutation({
     tenantId: v.string(),
     sourceKey: v.string(),
     docId: v.id("documents"),
-    chunks: v.array(v.object({ chunkIndex: v.number(), text: v.string() })),
+    chunks: v.array(chunkArg),
   },
   handler: async (ctx, args) => {
+    const doc = await ctx.db.get(args.docId);
+    if (!doc || doc.tenantId !== args.tenantId) throw new Error("document not found");
     const ids: string[] = [];
     for (const c of args.chunks) {
       const id = await ctx.db.insert("chunks", {
         tenantId: args.tenantId,
         sourceKey: args.sourceKey,
         docId: args.docId,
-        chunkIndex: c.chunkIndex,
-        text: c.text,
+        ...chunkRow(doc.rawText, c),
       });
       ids.push(id);
     }
@@ -35,6 +61,102 @@ export const addChunks = mutation({
   },
 });
 
+async function chunkIdsOf(ctx: QueryCtx, docId: Id<"documents">) {
+  const chunks = await ctx.db
+    .query("chunks")
+    .withIndex("by_doc", (q) => q.eq("docId", docId))
+    .collect();
+  chunks.sort((a, b) => a.chunkIndex - b.chunkIndex);
+  return chunks.map((c) => c._id);
+}
+
+// Insert several documents and their chunks in one round trip.
+// Returns [{ docId, chunkIds }] in the same order as args.documents.
+// Idempotent per ingestKey: a document whose key was already written is not
+// inserted again and its existing ids are returned, so batches can be retried.
+export const addDocuments = mutation({
+  args: {
+    tenantId: v.string(),
+    documents: v.array(
+      v.object({
+        sourceKey: v.string(),
+        title: v.string(),
+        rawText: v.string(),
+        sourceUrl: v.optional(v.string()),
+        ingestKey: v.optional(v.string()),
+        chunks: v.array(chunkArg),
+      }),
+    ),
+  },
+  handler: async (ctx, args) => {
+    const out: { docId: string; chunkIds: string[] }[] = [];
+    for (const { chunks, ...doc } of args.documents) {
+      if (doc.ingestKey !== undefined) {
+        const existing = await ctx.db
+          .query("documents")
+          .withIndex("by_tenant_ingestKey", (q) =>
+            q.eq("tenantId", args.tenantId).eq("ingestKey", doc.ingestKey),
+          )
+          .first();
+        if (existing) {
+          out.push({ docId: existing._id, chunkIds: await chunkIdsOf(ctx, existing._id) });
+          continue;
+        }
+      }
+      const docId = await ctx.db.insert("documents", { tenantId: args.tenantId, ...doc });
+      const chunkIds: string[] = [];
+      for (const c of chunks) {
+        const id = await ctx.db.insert("chunks", {
+          tenantId: args.tenantId,
+          sourceKey: doc.sourceKey,
+          docId,
+          ...chunkRow(doc.rawText, c),
+        });
+        chunkIds.push(id);
+      }
+      out.push({ docId, chunkIds });
+    }
+    return out;
+  },
+});
+
+// Look up documents previously written with the given ingest keys, so an
+// interrupted ingest can reuse them. Chunk ids are returned in chunkIndex order.
+export const findByIngestKeys = query({
+  args: { tenantId: v.string(), ingestKeys: v.array(v.string()) },
+  handler: async (ctx, args) => {
+    const out: { ingestKey: string; docId: string; chunkIds: string[] }[] = [];
+    for (const ingestKey of args.ingestKeys) {
+      const docs = await ctx.db
+        .query("documents")
+        .withIndex("by_tenant_ingestKey", (q) =>
+          q.eq("tenantId", args.tenantId).eq("ingestKey", ingestKey),
+        )
+        .collect();
+      for (const doc of docs) {
+        out.push({ ingestKey, docId: doc._id, chunkIds: await chunkIdsOf(ctx, doc._id) });
+      }
+    }
+    return out;
+  },
+});
+
+// Delete a document and all of its chunks (used when a source file changes or disappears)
+export const deleteDocument = mutation({
+  args: { id: v.id("documents"), tenantId: v.string() },
+  handler: async (ctx, args) => {
+    const doc = await ctx.db.get(args.id);
+    if (!doc || doc.tenantId !== args.tenantId) return 0;
+    const chunks = await ctx.db
+      .query("chunks")
+      .withIndex("by_doc", (q) => q.eq("docId", args.id))
+      .collect();
+    for (const c of chunks) await ctx.db.delete(c._id);
+    await ctx.db.delete(args.id);
+    return chunks.length;
+  },
+});
+
 // List all documents for a tenant (for debugging/admin)
 export const listDocuments = query({
   args: { tenantId: v.string() },
@@ -52,7 +174,32 @@ export const listChunks = query({
   handler: async (ctx, args) => {
     return await ctx.db
       .query("chunks")
-      .filter((q) => q.eq(q.field("tenantId"), args.tenantId))
+      .withIndex("by_tenant_source", (q) => q.eq("tenantId", args.tenantId))
       .collect();
   },
 });
+
+// One page of a tenant's chunks (optionally one source), for rebuilding
+// indexes without reading everything in a single query. Only the fields
+// needed to re-embed are returned.
+export const listChunksPage = query({
+  args: {
+    tenantId: v.string(),
+    sourceKey: v.optional(v.string()),
+    paginationOpts: paginationOptsValidator,
+  },
+  handler: async (ctx, args) => {
+    const result = await ctx.db
+      .query("chunks")
+      .withIndex("by_tenant_source", (q) =>
+        args.sourceKey === undefined
+          ? q.eq("tenantId", args.tenantId)
+          : q.eq("tenantId", args.tenantId).eq("sourceKey", args.sourceKey),
+      )
+      .paginate(args.paginationOpts);
+    return {
+      ...result,
+      page: result.page.map((c) => ({ _id: c._id, sourceKey: c.sourceKey, text: c.text })),
+    };
+  },
+});
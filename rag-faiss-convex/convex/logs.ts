@@ -2,28 +2,44 @@ import { mutation } from "./_generated/server";
 import { v } from "convex/values";
 import { auth } from "./auth";
 
+const logFields = {
+  tenantId: v.string(),
+  userId: v.id("users"),
+  message: v.string(),
+  answer: v.string(),
+  allowedSources: v.array(v.string()),
+  retrieved: v.array(
+    v.object({
+      sourceKey: v.string(),
+      score: v.number(),
+      docId: v.id("documents"),
+      docTitle: v.string(),
+      chunkId: v.id("chunks"),
+      chunkIndex: v.number(),
+    }),
+  ),
+  promptTokens: v.optional(v.number()),
+};
+
 export const add = mutation({
-  args: {
-    tenantId: v.string(),
-    userId: v.id("users"),
-    message: v.string(),
-    answer: v.string(),
-    allowedSources: v.array(v.string()),
-    retrieved: v.array(
-      v.object({
-        sourceKey: v.string(),
-        score: v.number(),
-        docId: v.id("documents"),
-        docTitle: v.string(),
-        chunkId: v.id("chunks"),
-        chunkIndex: v.number(),
-      }),
-    ),
-  },
+  args: logFields,
   handler: async (ctx, args) =>
     await ctx.db.insert("queryLogs", { ...args, createdAt: Date.now() }),
 });
 
+// One transaction for the logs of a /chat/batch request; returns ids in order
+export const addMany = mutation({
+  args: { rows: v.array(v.object(logFields)) },
+  handler: async (ctx, { rows }) => {
+    const createdAt = Date.now();
+    const ids = [];
+    for (const row of rows) {
+      ids.push(await ctx.db.insert("queryLogs", { ...row, createdAt }));
+    }
+    return ids;
+  },
+});
+
 export const addFeedback = mutation({
   args: {
     logId: v.id("queryLogs"),
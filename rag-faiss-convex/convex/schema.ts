@@ -29,7 +29,11 @@ export default defineSchema({
     title: v.string(),
     rawText: v.string(),
     sourceUrl: v.optional(v.string()),
-  }).index("by_tenant_source", ["tenantId", "sourceKey"]),
+    ingestKey: v.optional(v.string()), // content-version key written by the ingesters
+    truncated: v.optional(v.boolean()), // rawText is only a prefix (streamed large files)
+  })
+    .index("by_tenant_source", ["tenantId", "sourceKey"])
+    .index("by_tenant_ingestKey", ["tenantId", "ingestKey"]),
 
   chunks: defineTable({
     tenantId: v.string(),
@@ -37,7 +41,11 @@ export default defineSchema({
     docId: v.id("documents"),
     chunkIndex: v.number(),
     text: v.string(),
-  }).index("by_doc", ["docId"]),
+    start: v.optional(v.number()), // offsets of text within the document's rawText
+    end: v.optional(v.number()),
+  })
+    .index("by_doc", ["docId", "chunkIndex"])
+    .index("by_tenant_source", ["tenantId", "sourceKey"]),
 
   queryLogs: defineTable({
     tenantId: v.string(),
@@ -55,6 +63,7 @@ export default defineSchema({
         chunkIndex: v.number(),
       }),
     ),
+    promptTokens: v.optional(v.number()),
     createdAt: v.number(),
   }).index("by_tenant_user", ["tenantId", "userId"]),
 
@@ -68,6 +68,9 @@ Bun.serve({
         const response = await fetch(targetUrl, {
           method: req.method,
           headers,
+          // Pass compressed API responses through as-is (with their
+          // Content-Encoding) instead of inflating them here
+          decompress: false,
           body:
             req.method !== "GET" && req.method !== "HEAD"
               ? await req.text()
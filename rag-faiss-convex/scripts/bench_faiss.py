@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for FaissPerSourceStore.
+
+Generates synthetic normalized vectors for several tenants and sources and
+measures:
+- add throughput (each add() call rewrites the .index/.ids.json files)
+- decoding an embeddings response into store-ready vectors, from float lists
+  and from base64 payloads (time and peak Python allocations)
+- cold _load time from disk
+- single-query and batched (search_batch) search latency over 1-8 sources
+- memory footprint (RSS and on-disk index size)
+- recall@k of non-flat FAISS modes against exact (flat) search
+- MMR diversification latency over 100 candidates and the documents it covers
+- summary-pruned search against an exhaustive scan of all sources (latency,
+  sources skipped, identical results)
+
+Results are written as JSON so runs can be compared across commits:
+
+    python -m scripts.bench_faiss --scales 10000,100000 --out bench.json
+    python -m scripts.bench_faiss --scales 10000 --compare bench.json
+"""
+import os
+import re
+import sys
+import gc
+import json
+import time
+import shutil
+import base64
+import argparse
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+from typing import Dict, List, Optional
+
+import numpy as np
+import faiss
+
+# Add parent dir to path for api module
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.faiss_store import FaissPerSourceStore, _normalize
+from api.embeddings import decode_embeddings
+from api.diversify import MMR_CANDIDATES, MMR_LAMBDA, mmr
+
+SOURCE_COUNTS = [1, 2, 4, 8]
+# MMR is off by default (MMR_LAMBDA=1); benchmark a typical setting then
+BENCH_MMR_LAMBDA = MMR_LAMBDA if MMR_LAMBDA < 1.0 else 0.7
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process (Linux), 0 if unavailable."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    arr = np.asarray(samples, dtype=np.float64) * 1000.0
+    return {
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p95_ms": float(np.percentile(arr, 95)),
+        "p99_ms": float(np.percentile(arr, 99)),
+        "mean_ms": float(arr.mean()),
+    }
+
+
+def synthetic_vectors(rng: np.random.Generator, n: int, dim: int, clusters: int = 64) -> np.ndarray:
+    """Clustered unit vectors, closer to real embeddings than pure noise."""
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    assign = rng.integers(0, clusters, size=n)
+    xb = centers[assign] + 0.5 * rng.standard_normal((n, dim), dtype=np.float32)
+    faiss.normalize_L2(xb)
+    return xb
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True, text=True, timeout=10,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for fn in files:
+            total += os.path.getsize(os.path.join(root, fn))
+    return total
+
+
+def bench_add(store: FaissPerSourceStore, tenants: List[str], sources: List[str],
+              data: Dict[tuple, np.ndarray], batch: int) -> dict:
+    call_times = []
+    total = 0
+    start = time.perf_counter()
+    for tenant in tenants:
+        for source in sources:
+            xb = data[(tenant, source)]
+            for lo in range(0, len(xb), batch):
+                part = xb[lo:lo + batch]
+                ids = [f"{tenant}:{source}:{i}" for i in range(lo, lo + len(part))]
+                t0 = time.perf_counter()
+                store.add(tenant, source, part, ids)
+                call_times.append(time.perf_counter() - t0)
+                total += len(part)
+    wall = time.perf_counter() - start
+    return {
+        "vectors": total,
+        "calls": len(call_times),
+        "batch": batch,
+        "wall_s": wall,
+        "vectors_per_s": total / wall if wall else 0.0,
+        "call_latency": percentiles(call_times),
+    }
+
+
+def bench_decode(rng: np.random.Generator, dim: int, batch: int, trials: int = 5) -> dict:
+    """
+    Parse an embeddings response of `batch` vectors and turn it into the
+    normalized float32 matrix add() indexes: float-list JSON (the SDK's list
+    output) against base64 payloads decoded with np.frombuffer.
+    """
+    xb = synthetic_vectors(rng, batch, dim)
+    bodies = {
+        "float_lists": json.dumps({"data": [{"embedding": v} for v in xb.tolist()]}),
+        "base64": json.dumps({"data": [{"embedding": base64.b64encode(v.tobytes()).decode()} for v in xb]}),
+    }
+    decoders = {
+        "float_lists": lambda items: _normalize(np.array(items, dtype=np.float32)),
+        "base64": lambda items: _normalize(decode_embeddings(items)),
+    }
+    out = {}
+    for name, body in bodies.items():
+        times = []
+        for _ in range(trials):
+            gc.collect()
+            t0 = time.perf_counter()
+            decoders[name]([d["embedding"] for d in json.loads(body)["data"]])
+            times.append(time.perf_counter() - t0)
+        # Traced separately: tracemalloc slows every allocation down
+        tracemalloc.start()
+        decoders[name]([d["embedding"] for d in json.loads(body)["data"]])
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        out[name] = {
+            "payload_bytes": len(body),
+            "latency": percentiles(times),
+            "peak_alloc_bytes": int(peak),
+        }
+    out["batch"] = batch
+    return out
+
+
+def bench_cold_load(base_dir: str, tenants: List[str], sources: List[str], dim: int) -> dict:
+    gc.collect()
+    rss_before = rss_bytes()
+    store = FaissPerSourceStore(base_dir=base_dir, pruning=True)
+    times = []
+    for tenant in tenants:
+        for source in sources:
+            t0 = time.perf_counter()
+            store._load(tenant, source, dim)
+            times.append(time.perf_counter() - t0)
+    rss_after = rss_bytes()
+    return {
+        "indexes": len(times),
+        "total_s": float(sum(times)),
+        "per_index": percentiles(times),
+        "rss_delta_bytes": rss_after - rss_before,
+        "on_disk_bytes": dir_size(base_dir),
+    }, store
+
+
+def bench_search(store: FaissPerSourceStore, tenant: str, sources: List[str],
+                 queries: np.ndarray, k: int) -> dict:
+    out = {}
+    for n_sources in SOURCE_COUNTS:
+        if n_sources > len(sources):
+            break
+        subset = sources[:n_sources]
+
+        # Warm-up so the first-touch page faults are not in the numbers
+        store.search(tenant, subset, queries[0], top_k_per_source=k)
+
+        single = []
+        for q in queries:
+            t0 = time.perf_counter()
+            store.search(tenant, subset, q, top_k_per_source=k)
+            single.append(time.perf_counter() - t0)
+
+        # Batched: search_batch makes one FAISS call per source for the whole query matrix
+        t0 = time.perf_counter()
+        store.search_batch(tenant, subset, queries, top_k_per_source=k)
+        batched_wall = time.perf_counter() - t0
+
+        out[str(n_sources)] = {
+            "single": percentiles(single),
+            "batched": {
+                "queries": len(queries),
+                "wall_ms": batched_wall * 1000.0,
+                "per_query_ms": batched_wall * 1000.0 / len(queries),
+            },
+        }
+    return out
+
+
+def bench_pruned(store: FaissPerSourceStore, tenant: str, sources: List[str],
+                 data: Dict[tuple, np.ndarray], rng: np.random.Generator, n_queries: int,
+                 limit: int = MMR_CANDIDATES, top_k: int = 16) -> dict:
+    """
+    The /chat search (best `limit` hits over all sources) with and without
+    source pruning (the store is built with pruning on), for queries near
+    one source's vectors.
+    """
+    owners = rng.integers(0, len(sources), size=n_queries)
+    queries = np.stack([data[(tenant, sources[o])][rng.integers(len(data[(tenant, sources[o])]))] for o in owners])
+    # Noise of norm ~0.3 in total (not per dimension): each query stays within
+    # ~17 degrees of the vector it was drawn from, like a paraphrase would
+    queries += (0.3 / np.sqrt(queries.shape[1])) * rng.standard_normal(queries.shape, dtype=np.float32)
+    faiss.normalize_L2(queries)
+
+    store.search(tenant, sources, queries[0], top_k_per_source=top_k, limit=limit)
+    exhaustive, pruned, same = [], [], 0
+    searched_before = store.search_stats["sources_searched"]
+    for q in queries:
+        t0 = time.perf_counter()
+        full = store.search(tenant, sources, q, top_k_per_source=top_k)[:limit]
+        exhaustive.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        hits = store.search(tenant, sources, q, top_k_per_source=top_k, limit=limit)
+        pruned.append(time.perf_counter() - t0)
+        same += [h[0] for h in hits] == [h[0] for h in full]
+    searched = store.search_stats["sources_searched"] - searched_before - len(queries) * len(sources)
+    return {
+        "sources": len(sources),
+        "limit": limit,
+        "exhaustive": percentiles(exhaustive),
+        "pruned": percentiles(pruned),
+        "sources_searched_per_query": searched / len(queries),
+        "identical": same / len(queries),
+    }
+
+
+def bench_recall(xb: np.ndarray, queries: np.ndarray, k: int, modes: List[str]) -> dict:
+    dim = xb.shape[1]
+    exact = faiss.IndexFlatIP(dim)
+    exact.add(xb)
+    _, truth = exact.search(queries, k)
+
+    out = {}
+    for mode in modes:
+        # k-means wants at least 39 training points per IVF list
+        nlist = re.search(r"IVF(\d+)", mode)
+        max_nlist = len(xb) // 39
+        if nlist and int(nlist.group(1)) > max_nlist:
+            if max_nlist < 1:
+                print(f"  recall {mode}: skipped, {len(xb)} vectors are too few to train it")
+                out[mode] = {"skipped": f"{len(xb)} training vectors"}
+                continue
+            capped = f"{mode[:nlist.start(1)]}{max_nlist}{mode[nlist.end(1):]}"
+            print(f"  recall {mode}: {len(xb)} training vectors, using {capped}")
+            mode = capped
+        index = faiss.index_factory(dim, mode, faiss.METRIC_INNER_PRODUCT)
+        t0 = time.perf_counter()
+        if not index.is_trained:
+            index.train(xb)
+        index.add(xb)
+        build_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        _, found = index.search(queries, k)
+        search_s = time.perf_counter() - t0
+
+        hits = sum(len(set(t.tolist()) & set(f.tolist())) for t, f in zip(truth, found))
+        out[mode] = {
+            f"recall_at_{k}": hits / float(truth.size),
+            "build_s": build_s,
+            "per_query_ms": search_s * 1000.0 / len(queries),
+            "bytes": int(faiss.serialize_index(index).nbytes),
+        }
+    return out
+
+
+def bench_mmr(rng: np.random.Generator, dim: int, k: int, candidates: int = 100,
+              chunks_per_doc: int = 5, trials: int = 200) -> dict:
+    """
+    MMR over `candidates` hits drawn from documents of `chunks_per_doc`
+    similar chunks each: latency, and distinct documents in the top k
+    compared with plain top-k by score.
+    """
+    n_docs = candidates // chunks_per_doc
+    times, plain_docs, mmr_docs = [], [], []
+    for _ in range(trials):
+        centers = rng.standard_normal((n_docs, dim), dtype=np.float32)
+        doc_of = np.repeat(np.arange(n_docs), chunks_per_doc)
+        xb = centers[doc_of] + 0.6 * rng.standard_normal((candidates, dim), dtype=np.float32)
+        faiss.normalize_L2(xb)
+        q = (centers[:4].sum(axis=0) + rng.standard_normal(dim, dtype=np.float32))[None, :]
+        faiss.normalize_L2(q)
+        scores = (xb @ q[0]).tolist()
+
+        t0 = time.perf_counter()
+        picked = mmr(scores, xb, k, BENCH_MMR_LAMBDA)
+        times.append(time.perf_counter() - t0)
+
+        top = np.argsort(scores)[::-1][:k]
+        plain_docs.append(len(set(doc_of[top].tolist())))
+        mmr_docs.append(len(set(doc_of[picked].tolist())))
+    return {
+        "candidates": candidates,
+        "lambda": BENCH_MMR_LAMBDA,
+        "latency": percentiles(times),
+        "docs_in_top_k": {"plain": float(np.mean(plain_docs)), "mmr": float(np.mean(mmr_docs))},
+    }
+
+
+def run_scale(n: int, args, rng: np.random.Generator) -> dict:
+    tenants = [f"tenant{t}" for t in range(args.tenants)]
+    sources = [f"source{s}" for s in range(args.sources)]
+    per_index = max(1, n // (len(tenants) * len(sources)))
+
+    print(f"\n== scale {n:,} ({len(tenants)} tenants x {len(sources)} sources, "
+          f"{per_index:,} vectors/index, dim={args.dim})")
+
+    data = {
+        (tenant, source): synthetic_vectors(rng, per_index, args.dim)
+        for tenant in tenants for source in sources
+    }
+    queries = synthetic_vectors(rng, args.queries, args.dim)
+
+    base_dir = tempfile.mkdtemp(prefix="bench_faiss_", dir=args.workdir)
+    try:
+        result = {"vectors": per_index * len(tenants) * len(sources), "per_index": per_index}
+
+        store = FaissPerSourceStore(base_dir=base_dir, pruning=True)
+        result["add"] = bench_add(store, tenants, sources, data, args.add_batch)
+        print(f"  add: {result['add']['vectors_per_s']:,.0f} vec/s")
+
+        result["decode"] = bench_decode(rng, args.dim, args.add_batch)
+        for name in ("float_lists", "base64"):
+            r = result["decode"][name]
+            print(f"  decode {args.add_batch} {name}: p50={r['latency']['p50_ms']:.1f}ms "
+                  f"peak alloc={r['peak_alloc_bytes'] / 1e6:.1f}MB payload={r['payload_bytes'] / 1e6:.1f}MB")
+        del store
+        gc.collect()
+
+        result["cold_load"], store = bench_cold_load(base_dir, tenants, sources, args.dim)
+        print(f"  cold load: {result['cold_load']['total_s']:.3f}s "
+              f"({result['cold_load']['on_disk_bytes'] / 1e6:.1f} MB on disk)")
+
+        result["search"] = bench_search(store, tenants[0], sources, queries, args.k)
+        for n_src, r in result["search"].items():
+            print(f"  search {n_src} src: p50={r['single']['p50_ms']:.2f}ms "
+                  f"p99={r['single']['p99_ms']:.2f}ms batched={r['batched']['per_query_ms']:.3f}ms/q")
+
+        result["pruned"] = {
+            str(limit): bench_pruned(store, tenants[0], sources, data, rng, args.queries, limit=limit)
+            for limit in (args.k, MMR_CANDIDATES)
+        }
+        for limit, r in result["pruned"].items():
+            print(f"  pruned search top {limit} of {r['sources']} src: p50={r['exhaustive']['p50_ms']:.2f}ms -> "
+                  f"{r['pruned']['p50_ms']:.2f}ms, {r['sources_searched_per_query']:.1f} sources searched, "
+                  f"{r['identical']:.0%} identical")
+
+        result["mmr"] = bench_mmr(rng, args.dim, args.k)
+        print(f"  mmr {result['mmr']['candidates']} candidates: p50={result['mmr']['latency']['p50_ms']:.3f}ms "
+              f"p99={result['mmr']['latency']['p99_ms']:.3f}ms docs in top {args.k}: "
+              f"{result['mmr']['docs_in_top_k']['plain']:.1f} -> {result['mmr']['docs_in_top_k']['mmr']:.1f}")
+
+        result["memory"] = {"rss_bytes": rss_bytes()}
+
+        if args.modes:
+            result["recall"] = bench_recall(
+                data[(tenants[0], sources[0])], queries, args.k, args.modes
+            )
+            for mode, r in result["recall"].items():
+                print(f"  recall {mode}: {r[f'recall_at_{args.k}']:.3f}")
+        return result
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+
+def compare(current: dict, baseline_path: str):
+    """Print ratios of headline metrics against a previous run (new / old)."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    print(f"\nComparison against {baseline_path} (commit {baseline.get('env', {}).get('commit')})")
+    for scale, cur in current["scales"].items():
+        old = baseline.get("scales", {}).get(scale)
+        if not old:
+            continue
+        rows = [
+            ("add vec/s", cur["add"]["vectors_per_s"], old["add"]["vectors_per_s"]),
+            ("cold load s", cur["cold_load"]["total_s"], old["cold_load"]["total_s"]),
+        ]
+        for name in ("float_lists", "base64"):
+            if name in old.get("decode", {}):
+                rows.append((f"decode {name} p50 ms", cur["decode"][name]["latency"]["p50_ms"],
+                             old["decode"][name]["latency"]["p50_ms"]))
+                rows.append((f"decode {name} peak MB", cur["decode"][name]["peak_alloc_bytes"] / 1e6,
+                             old["decode"][name]["peak_alloc_bytes"] / 1e6))
+        for n_src, r in cur["search"].items():
+            if n_src in old.get("search", {}):
+                rows.append((f"search {n_src}src p50 ms", r["single"]["p50_ms"],
+                             old["search"][n_src]["single"]["p50_ms"]))
+        for limit, r in cur.get("pruned", {}).items():
+            if limit in old.get("pruned", {}):
+                rows.append((f"pruned top{limit} p50 ms", r["pruned"]["p50_ms"],
+                             old["pruned"][limit]["pruned"]["p50_ms"]))
+        if "mmr" in cur and "mmr" in old:
+            rows.append(("mmr p50 ms", cur["mmr"]["latency"]["p50_ms"], old["mmr"]["latency"]["p50_ms"]))
+        print(f"  scale {scale}:")
+        for name, new_v, old_v in rows:
+            ratio = new_v / old_v if old_v else float("nan")
+            print(f"    {name:<24} {old_v:>12.3f} -> {new_v:>12.3f}  (x{ratio:.2f})")
+
+
+def write_results(results: dict, out: Optional[str]):
+    if out:
+        with open(out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {out}")
+    else:
+        print(json.dumps(results, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FaissPerSourceStore")
+    parser.add_argument("--scales", default="10000,100000,1000000",
+                        help="Comma-separated total vector counts per run")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--tenants", type=int, default=2)
+    parser.add_argument("--sources", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--add-batch", type=int, default=1000,
+                        help="Vectors per add() call")
+    parser.add_argument("--modes", default="HNSW32;IVF256,Flat",
+                        help="Semicolon-separated faiss index_factory strings to check recall for")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="Where temporary indexes are written")
+    parser.add_argument("--out", default=None, help="Write JSON results to this path")
+    parser.add_argument("--compare", default=None, help="Baseline JSON to compare against")
+    args = parser.parse_args()
+    args.modes = [m for m in args.modes.split(";") if m]
+
+    rng = np.random.default_rng(args.seed)
+    results = {
+        "env": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "faiss": getattr(faiss, "__version__", "unknown"),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "workdir")},
+        "scales": {},
+    }
+
+    try:
+        for n in [int(s) for s in args.scales.split(",") if s]:
+            results["scales"][str(n)] = run_scale(n, args, rng)
+    finally:
+        # Keep the scales that finished if a later one fails or is interrupted
+        write_results(results, args.out)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
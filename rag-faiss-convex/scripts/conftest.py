@@ -0,0 +1,65 @@
+import itertools
+import os
+import sys
+
+import pytest
+
+# Tests import the api package the same way the scripts do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Runs against a live Convex deployment and API: python scripts/test_acl.py
+collect_ignore = ["test_acl.py"]
+
+# Read at import by api.main and the scripts: no Convex, OpenAI or disk cache
+# is ever reached, and embeddings come from the hashing backend
+os.environ.setdefault("CONVEX_URL", "http://convex.invalid")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+os.environ["EMBED_MODEL"] = "hashing:16"
+os.environ["EMBED_CACHE_DIR"] = ""
+
+
+class FakeConvex:
+    """
+    The Convex functions api.main calls, answered in memory. Users are
+    looked up by id (header auth); tests add handlers for anything else.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self._ids = itertools.count()
+        self.users = {
+            "admin": {"_id": "admin", "tenantId": "t", "role": "admin", "allowedSources": ["hr", "public"]},
+            "alice": {"_id": "alice", "tenantId": "t", "role": "user", "allowedSources": ["hr", "public"]},
+            "bob": {"_id": "bob", "tenantId": "t", "role": "user", "allowedSources": ["public"]},
+        }
+        self.handlers = {
+            "users:get": lambda args: self.users.get(args["userId"]),
+            "ingest:addDocuments": self._add_documents,
+        }
+
+    def _add_documents(self, args: dict) -> list:
+        return [
+            {"docId": f"d{next(self._ids)}", "chunkIds": [f"c{next(self._ids)}" for _ in doc["chunks"]]}
+            for doc in args["documents"]
+        ]
+
+    def __call__(self, kind: str, path: str, args: dict, token=None, reject: bool = True, admission=None):
+        self.calls.append(path)
+        return self.handlers[path](args)
+
+
+@pytest.fixture
+def api(monkeypatch, tmp_path):
+    """(api.main, FakeConvex, TestClient) with the tenant's indexes under tmp_path."""
+    from fastapi.testclient import TestClient
+
+    from api import main
+    from api.faiss_store import FaissPerSourceStore
+
+    monkeypatch.setenv("ALLOW_HEADER_AUTH", "true")
+    convex = FakeConvex()
+    monkeypatch.setattr(main, "convex_call", convex)
+    store = FaissPerSourceStore(str(tmp_path / "faiss"))
+    monkeypatch.setattr(main, "faiss_store", store)
+    monkeypatch.setattr(main.ingest_queue, "store", store)
+    return main, convex, TestClient(main.app)
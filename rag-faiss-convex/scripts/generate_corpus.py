@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+Generate a large, reproducible multi-tenant corpus for benchmarking.
+
+Unlike generate_sample_docs.py (a dozen fixed files for one tenant), this
+writes any number of tenants, sources and documents in every format that
+ingest_folder.parse_file_to_text understands (md, Slack JSON, pdf, pptx,
+xlsx), with log-normally distributed document sizes. Each document belongs
+to a topic with its own rare key terms, and a matching query set lists the
+documents relevant to each query, so retrieval quality can be scored.
+
+Layout:
+    <out>/<tenant>/<source>/<file>   one directory per tenant, ingestable with
+                                     DATA_DIR=<out>/<tenant> TENANT_ID=<tenant>
+    <out>/queries.jsonl              {"id", "tenant", "query", "relevant": [...]}
+    <out>/corpus.json                generation params and per-file metadata
+
+The same --seed always produces the same documents and queries.
+
+    python -m scripts.generate_corpus --tenants 4 --docs 25000 --out data_scale
+"""
+import os
+import json
+import math
+import re
+import random
+import zipfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+# Try to import document generation libraries
+try:
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.units import inch
+    HAS_REPORTLAB = True
+except ImportError:
+    HAS_REPORTLAB = False
+
+try:
+    from pptx import Presentation
+    from pptx.util import Inches, Pt
+    HAS_PPTX = True
+except ImportError:
+    HAS_PPTX = False
+
+try:
+    from openpyxl import Workbook
+    HAS_OPENPYXL = True
+except ImportError:
+    HAS_OPENPYXL = False
+
+DEFAULT_SOURCES = "gdrive,confluence,slack,public,finance,engineering,hr"
+DEFAULT_FORMATS = "md=0.45,json=0.2,pdf=0.15,pptx=0.1,xlsx=0.1"
+
+# Fixed timestamp written into document metadata so output is byte-stable
+EPOCH = datetime(2025, 1, 1)
+MODIFIED_RE = re.compile(rb"(<dcterms:modified[^>]*>)[^<]*(</dcterms:modified>)")
+
+WORDS = (
+    "account action agenda alert analysis approval archive audit backlog balance "
+    "baseline benefit billing budget capacity change checklist client cluster "
+    "compliance contract cost coverage customer dashboard database deadline "
+    "deploy design escalation estimate expense feature feedback forecast "
+    "governance handoff headcount hiring incident infrastructure invoice "
+    "latency launch license limit meeting metric migration milestone monitoring "
+    "network onboarding outage owner payroll performance pipeline plan policy "
+    "priority process procurement project quarter quota rate release renewal "
+    "report request requirement review revenue risk roadmap rollout schedule "
+    "security service signoff spend sprint staffing status storage strategy "
+    "support target team timeline training travel update vendor workflow"
+).split()
+
+VERBS = "approve audit block confirm deliver draft escalate extend finalize review ship track".split()
+PEOPLE = ["alice", "bob", "carol", "dave", "erin", "frank", "grace", "heidi"]
+SYLLABLES = "ka lo mi ra ven tor quin zel dar pho nix sul bri cor tam vex".split()
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    weights = {}
+    for part in spec.split(","):
+        fmt, _, w = part.partition("=")
+        weights[fmt.strip()] = float(w or 1)
+    return weights
+
+
+def available_formats(weights: Dict[str, float]) -> Dict[str, float]:
+    """Drop formats whose writer library is missing; md absorbs their weight."""
+    missing = {
+        "pdf": not HAS_REPORTLAB,
+        "pptx": not HAS_PPTX,
+        "xlsx": not HAS_OPENPYXL,
+    }
+    out = {}
+    for fmt, w in weights.items():
+        if missing.get(fmt):
+            print(f"Note: no writer library for {fmt}, generating md instead")
+            fmt = "md"
+        out[fmt] = out.get(fmt, 0.0) + w
+    return out
+
+
+def codename(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(3))
+
+
+def make_topics(seed: int, tenant: str, count: int) -> List[dict]:
+    """Each topic gets a unique codename and a few anchor words."""
+    rng = random.Random(f"{seed}:{tenant}:topics")
+    seen = set()
+    topics = []
+    while len(topics) < count:
+        name = codename(rng)
+        if name in seen:
+            name = f"{name}{len(topics)}"
+        seen.add(name)
+        topics.append({"id": len(topics), "name": name, "anchors": rng.sample(WORDS, 3)})
+    return topics
+
+
+def sentence(rng: random.Random, topic: dict, on_topic: bool) -> str:
+    words = rng.sample(WORDS, rng.randint(5, 12))
+    if on_topic:
+        words.insert(rng.randrange(len(words)), f"project {topic['name']}")
+        words.insert(rng.randrange(len(words)), rng.choice(topic["anchors"]))
+    text = " ".join(words)
+    return f"{rng.choice(PEOPLE).title()} will {rng.choice(VERBS)} the {text}."
+
+
+def paragraphs(rng: random.Random, topic: dict, count: int) -> List[str]:
+    out = []
+    for _ in range(count):
+        n = rng.randint(2, 6)
+        # Roughly a third of the sentences mention the topic
+        out.append(" ".join(sentence(rng, topic, rng.random() < 0.35) for _ in range(n)))
+    return out
+
+
+def size_in_paragraphs(rng: random.Random, median: int, sigma: float, cap: int) -> int:
+    """Log-normal size: most documents are short, a few are very large."""
+    return max(1, min(cap, int(rng.lognormvariate(math.log(median), sigma))))
+
+
+# ============ Writers ============
+
+def write_md(path: str, title: str, paras: List[str]):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"# {title}\n\n" + "\n\n".join(paras) + "\n")
+
+
+def write_slack(path: str, title: str, paras: List[str], rng: random.Random):
+    messages = []
+    for i, p in enumerate(paras):
+        messages.append({
+            "user": rng.choice(PEOPLE),
+            "ts": str((EPOCH - timedelta(minutes=15 * i)).timestamp()),
+            "text": p,
+        })
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"channel": title.lower().replace(" ", "-"), "messages": messages}, f, indent=2)
+
+
+def write_pdf(path: str, title: str, paras: List[str]):
+    c = canvas.Canvas(path, pagesize=letter, invariant=1)
+    width, height = letter
+    c.setTitle(title)
+    c.setFont("Helvetica-Bold", 18)
+    c.drawString(1*inch, height - 1*inch, title)
+    c.setFont("Helvetica", 10)
+    y = height - 1.5*inch
+    for para in paras:
+        # Naive wrap at ~95 chars per line
+        words, line = para.split(), ""
+        lines = []
+        for w in words:
+            if len(line) + len(w) + 1 > 95:
+                lines.append(line)
+                line = w
+            else:
+                line = f"{line} {w}" if line else w
+        lines.append(line)
+        lines.append("")
+        for ln in lines:
+            if y < 1*inch:
+                c.showPage()
+                c.setFont("Helvetica", 10)
+                y = height - 1*inch
+            c.drawString(1*inch, y, ln)
+            y -= 13
+    c.save()
+
+
+def write_pptx(path: str, title: str, paras: List[str]):
+    prs = Presentation()
+    prs.core_properties.created = EPOCH
+    prs.core_properties.modified = EPOCH
+    prs.core_properties.title = title
+    layout = prs.slide_layouts[6]  # Blank layout
+    for i in range(0, len(paras), 3):
+        slide = prs.slides.add_slide(layout)
+        box = slide.shapes.add_textbox(Inches(0.5), Inches(0.3), Inches(9), Inches(0.8))
+        p = box.text_frame.paragraphs[0]
+        p.text = f"{title} ({i // 3 + 1})"
+        p.font.size = Pt(28)
+        p.font.bold = True
+        body = slide.shapes.add_textbox(Inches(0.5), Inches(1.2), Inches(9), Inches(5))
+        tf = body.text_frame
+        tf.word_wrap = True
+        for j, para in enumerate(paras[i:i + 3]):
+            p = tf.paragraphs[0] if j == 0 else tf.add_paragraph()
+            p.text = para
+            p.font.size = Pt(14)
+    prs.save(path)
+
+
+def write_xlsx(path: str, title: str, paras: List[str], rng: random.Random):
+    wb = Workbook()
+    wb.properties.created = EPOCH
+    wb.properties.modified = EPOCH
+    wb.properties.title = title
+    ws = wb.active
+    ws.title = "Items"
+    ws.append(["ID", "Owner", "Status", "Amount", "Notes"])
+    for i, para in enumerate(paras):
+        # Spread long paragraphs over several rows, like a tracker sheet
+        for k, sent in enumerate(para.split(". ")):
+            ws.append([
+                f"R{i:05d}-{k}",
+                rng.choice(PEOPLE),
+                rng.choice(["open", "blocked", "done", "review"]),
+                round(rng.uniform(10, 50000), 2),
+                sent,
+            ])
+    wb.save(path)
+
+
+def normalize_zip(path: str):
+    """Rewrite an OOXML zip with fixed entry timestamps so bytes are stable."""
+    with zipfile.ZipFile(path) as zin:
+        entries = [(info, zin.read(info.filename)) for info in zin.infolist()]
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zout:
+        for info, data in entries:
+            if info.filename == "docProps/core.xml":
+                # openpyxl stamps the save time regardless of wb.properties
+                data = MODIFIED_RE.sub(rb"\g<1>" + EPOCH.strftime("%Y-%m-%dT%H:%M:%SZ").encode() + rb"\g<2>", data)
+            fixed = zipfile.ZipInfo(info.filename, date_time=EPOCH.timetuple()[:6])
+            fixed.compress_type = zipfile.ZIP_DEFLATED
+            fixed.external_attr = info.external_attr
+            zout.writestr(fixed, data)
+
+
+EXTENSIONS = {"md": ".md", "json": ".json", "pdf": ".pdf", "pptx": ".pptx", "xlsx": ".xlsx"}
+
+
+def write_doc(spec: dict) -> dict:
+    """Write one document; runs in a worker process. Returns file metadata."""
+    rng = random.Random(spec["rng_seed"])
+    topic = spec["topic"]
+    paras = paragraphs(rng, topic, spec["paragraphs"])
+    path = spec["path"]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    fmt = spec["format"]
+    if fmt == "md":
+        write_md(path, spec["title"], paras)
+    elif fmt == "json":
+        write_slack(path, spec["title"], paras, rng)
+    elif fmt == "pdf":
+        write_pdf(path, spec["title"], paras)
+    elif fmt == "pptx":
+        write_pptx(path, spec["title"], paras)
+        normalize_zip(path)
+    elif fmt == "xlsx":
+        write_xlsx(path, spec["title"], paras, rng)
+        normalize_zip(path)
+    else:
+        raise ValueError(f"unknown format: {fmt}")
+
+    return {
+        "tenant": spec["tenant"],
+        "source": spec["source"],
+        "path": spec["relpath"],
+        "format": fmt,
+        "topic": topic["id"],
+        "paragraphs": spec["paragraphs"],
+        "bytes": os.path.getsize(path),
+    }
+
+
+def plan_tenant(args, tenant: str, sources: List[str], formats: Dict[str, float]):
+    """Decide every document of a tenant up front (cheap, deterministic)."""
+    topics = make_topics(args.seed, tenant, max(1, args.docs // args.docs_per_topic))
+    rng = random.Random(f"{args.seed}:{tenant}:plan")
+    fmt_names = list(formats)
+    fmt_weights = [formats[f] for f in fmt_names]
+
+    specs = []
+    for i in range(args.docs):
+        topic = topics[i % len(topics)]
+        source = rng.choice(sources)
+        fmt = rng.choices(fmt_names, weights=fmt_weights)[0]
+        # Slack exports live in the slack source when there is one
+        if fmt == "json" and "slack" in sources:
+            source = "slack"
+        title = f"{topic['name'].title()} {rng.choice(WORDS).title()} {i:06d}"
+        filename = title.replace(" ", "_") + EXTENSIONS[fmt]
+        relpath = os.path.join(tenant, source, filename)
+        specs.append({
+            "tenant": tenant,
+            "source": source,
+            "format": fmt,
+            "title": title,
+            "topic": topic,
+            "paragraphs": size_in_paragraphs(rng, args.median_paragraphs, args.size_sigma, args.max_paragraphs),
+            "rng_seed": f"{args.seed}:{tenant}:doc:{i}",
+            "relpath": relpath,
+            "path": os.path.join(args.out, relpath),
+        })
+    return topics, specs
+
+
+def make_queries(args, tenant: str, topics: List[dict], files: List[dict]) -> List[dict]:
+    by_topic: Dict[int, List[dict]] = {}
+    for f in files:
+        by_topic.setdefault(f["topic"], []).append(f)
+
+    rng = random.Random(f"{args.seed}:{tenant}:queries")
+    picked = rng.sample(topics, min(args.queries, len(topics)))
+    queries = []
+    for topic in picked:
+        relevant = by_topic.get(topic["id"], [])
+        if not relevant:
+            continue
+        anchor = rng.choice(topic["anchors"])
+        queries.append({
+            "id": f"{tenant}-q{len(queries):05d}",
+            "tenant": tenant,
+            "query": f"What is the latest {anchor} status for project {topic['name']}?",
+            "relevant": sorted(f["path"] for f in relevant),
+            "sources": sorted({f["source"] for f in relevant}),
+        })
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a reproducible multi-tenant corpus")
+    parser.add_argument("--out", default="data_scale")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--tenants", type=int, default=1)
+    parser.add_argument("--sources", default=DEFAULT_SOURCES)
+    parser.add_argument("--docs", type=int, default=1000, help="Documents per tenant")
+    parser.add_argument("--formats", default=DEFAULT_FORMATS, help="Format weights, e.g. md=0.5,pdf=0.5")
+    parser.add_argument("--docs-per-topic", type=int, default=5)
+    parser.add_argument("--median-paragraphs", type=int, default=8)
+    parser.add_argument("--size-sigma", type=float, default=1.0)
+    parser.add_argument("--max-paragraphs", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200, help="Queries per tenant")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    sources = [s for s in args.sources.split(",") if s]
+    formats = available_formats(parse_weights(args.formats))
+    tenants = [f"tenant{t:03d}" for t in range(args.tenants)]
+    os.makedirs(args.out, exist_ok=True)
+
+    all_files: List[dict] = []
+    all_queries: List[dict] = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for tenant in tenants:
+            topics, specs = plan_tenant(args, tenant, sources, formats)
+            files = list(pool.map(write_doc, specs, chunksize=64))
+            total_mb = sum(f["bytes"] for f in files) / 1e6
+            print(f"{tenant}: {len(files)} documents, {total_mb:.1f} MB")
+            all_files.extend(files)
+            all_queries.extend(make_queries(args, tenant, topics, files))
+
+    with open(os.path.join(args.out, "queries.jsonl"), "w") as f:
+        for q in all_queries:
+            f.write(json.dumps(q) + "\n")
+
+    with open(os.path.join(args.out, "corpus.json"), "w") as f:
+        params = {k: v for k, v in vars(args).items() if k not in ("out", "workers")}
+        json.dump({"params": params, "tenants": tenants, "files": all_files}, f, indent=1)
+
+    print(f"\nDone! {len(all_files)} documents and {len(all_queries)} queries in {args.out}/")
+    print(f"Ingest a tenant with: DATA_DIR={args.out}/{tenants[0]} TENANT_ID={tenants[0]} "
+          f"python -m scripts.ingest_folder")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,12 @@ import os, requests
 from dotenv import load_dotenv
 from openai import OpenAI
 from api.faiss_store import FaissPerSourceStore
+from api.embed_batcher import EmbeddingBatcher, RateLimiter
+from api.embed_cache import cache_from_env
+from api.embeddings import get_provider, tenant_model
+from api.chunker import chunk_spans, utf16_spans
+from api.dedupe import DEDUPE_JACCARD
+from api.convex_bulk import ConvexBulkWriter
 
 load_dotenv()
 CONVEX_URL = os.environ["CONVEX_URL"].rstrip("/")
@@ -26,59 +32,61 @@ def convex_mutation(path: str, args: dict):
         raise RuntimeError(data)
     return data["value"]
 
-def chunk_text(text: str, max_chars: int = 1200):
-    chunks, cur, cur_len = [], [], 0
-    separator = "\n\n"
-    sep_len = len(separator)
-    for para in text.split(separator):
-        para = para.strip()
-        if not para:
-            continue
-        # Account for separator length when calculating if we'd exceed max_chars
-        added_len = len(para) + (sep_len if cur else 0)
-        if cur and cur_len + added_len > max_chars:
-            chunks.append(separator.join(cur))
-            cur, cur_len = [], 0
-            added_len = len(para)  # No separator for first item
-        cur.append(para)
-        cur_len += added_len
-    if cur:
-        chunks.append(separator.join(cur))
-    return chunks
+def make_batcher(model: str) -> EmbeddingBatcher:
+    provider = get_provider(model, oa)
+    # Splits large documents into requests within the provider's input limits
+    return EmbeddingBatcher(
+        provider.embed,
+        max_items=int(os.getenv("EMBED_BATCH_ITEMS", "512")),
+        max_tokens=int(os.getenv("EMBED_BATCH_TOKENS", "100000")),
+        concurrency=int(os.getenv("EMBED_CONCURRENCY", "4")),
+        # Request budgets only apply to remote APIs
+        rate_limiter=RateLimiter(
+            requests_per_minute=float(os.getenv("EMBED_RPM", "0")) or None,
+            tokens_per_minute=float(os.getenv("EMBED_TPM", "0")) or None,
+        ) if provider.remote else None,
+        cache=cache_from_env(model),
+        near_duplicates=DEDUPE_JACCARD or None,
+    )
+
+# One batcher per model, built when a tenant first needs it
+batchers = {}
 
-def embed(texts):
-    out = oa.embeddings.create(model=EMBED_MODEL, input=texts)
-    return [d.embedding for d in out.data]
+convex_bulk = ConvexBulkWriter(convex_mutation)
 
 def ingest_doc(tenant_id: str, source_key: str, title: str, raw_text: str, source_url: str | None = None):
-    doc_args = {
-        "tenantId": tenant_id,
+    # Each tenant embeds with its configured model (TENANT_EMBED_MODELS)
+    model = tenant_model(tenant_id, EMBED_MODEL)
+    faiss_store.require_model(tenant_id, model)
+    spans = chunk_spans(raw_text)
+    if not spans:
+        print("skipped (no content):", title)
+        return
+
+    if model not in batchers:
+        batchers[model] = make_batcher(model)
+    vectors = batchers[model].embed([raw_text[s:e] for s, e in spans])
+
+    doc = {
         "sourceKey": source_key,
         "title": title,
         "rawText": raw_text,
+        "chunks": [{"chunkIndex": i, "start": s, "end": e} for i, (s, e) in enumerate(utf16_spans(raw_text, spans))],
     }
     if source_url:
-        doc_args["sourceUrl"] = source_url
-
-    doc_id = convex_mutation("ingest:addDocument", doc_args)
-
-    pieces = chunk_text(raw_text)
-    if not pieces:
-        print("skipped (no content):", title)
+        doc["sourceUrl"] = source_url
+    # One round trip for the document and its chunks. Re-running returns the
+    # already-written ids (same content => same ingestKey)
+    chunk_ids = convex_bulk.add_documents(tenant_id, [doc])[0]["chunkIds"]
+    # Only index what is missing (a run that died mid-write left some ids out)
+    present = faiss_store.contains(tenant_id, source_key, chunk_ids)
+    missing = [i for i, cid in enumerate(chunk_ids) if cid not in present]
+    if not missing:
+        print("already ingested:", title)
         return
 
-    vectors = embed(pieces)
-
-    chunk_rows = [{"chunkIndex": i, "text": pieces[i]} for i in range(len(pieces))]
-    chunk_ids = convex_mutation("ingest:addChunks", {
-        "tenantId": tenant_id,
-        "sourceKey": source_key,
-        "docId": doc_id,
-        "chunks": chunk_rows,
-    })
-
-    faiss_store.add(tenant_id, source_key, vectors, chunk_ids)
-    print("ingested:", title, "chunks:", len(chunk_ids))
+    faiss_store.add(tenant_id, source_key, [vectors[i] for i in missing], [chunk_ids[i] for i in missing])
+    print("ingested:", title, "chunks:", len(missing))
 
 if __name__ == "__main__":
     ingest_doc(
@@ -89,3 +97,6 @@ if __name__ == "__main__":
         "acme", "public", "Public Handbook",
         "Public handbook: office hours are 9-5.\n\nEveryone can see this."
     )
+    for batcher in batchers.values():
+        if batcher.cache:
+            print(batcher.cache.summary())
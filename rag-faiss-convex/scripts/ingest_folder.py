@@ -1,14 +1,30 @@
 import os
 import sys
 import json
+import time
+import hashlib
+import functools
+import itertools
+import asyncio
+import argparse
 import requests
-from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, Optional
 from dotenv import load_dotenv
 from openai import OpenAI
 
 # Add parent dir to path for api module
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from api.faiss_store import FaissPerSourceStore
+from api.embed_batcher import EmbeddingBatcher, RateLimiter
+from api.embed_cache import EmbeddingCache, cache_from_env
+from api.embeddings import get_provider, tenant_model
+from api.dedupe import DEDUPE_JACCARD
+from api.ingest_manifest import IngestManifest, chunk_hash, file_sha256
+from api.ingest_journal import IngestJournal
+from api.chunker import CHUNKER_ID, chunk_spans, iter_chunks, utf16_spans
+from api.convex_bulk import ConvexBulkWriter
+from api.writer_lock import TenantWriterLock, WriterLockHeld
 
 # Document parsing libraries (optional - graceful fallback)
 try:
@@ -43,9 +59,30 @@ EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")
 
 faiss_store = FaissPerSourceStore()
 
-DATA_DIR = "data"
+DATA_DIR = os.getenv("DATA_DIR", "data")
 TENANT_ID = os.getenv("TENANT_ID", "acme")
 
+# Files at least this large are parsed, chunked, embedded and stored
+# incrementally instead of being loaded whole
+STREAM_THRESHOLD_BYTES = int(float(os.getenv("STREAM_THRESHOLD_MB", "20")) * 1e6)
+STREAM_WINDOW_CHUNKS = int(os.getenv("STREAM_WINDOW_CHUNKS", "256"))
+# Convex documents are size-limited, so streamed documents keep only a prefix
+STREAM_PREVIEW_CHARS = int(os.getenv("STREAM_PREVIEW_CHARS", "100000"))
+XLSX_ROWS_PER_BLOCK = 200
+
+def convex_query(path: str, args: dict):
+    r = requests.post(
+        f"{CONVEX_URL}/api/query",
+        json={"path": path, "args": args, "format": "json"},
+        headers={"Content-Type": "application/json"},
+        timeout=60,
+    )
+    r.raise_for_status()
+    data = r.json()
+    if data.get("status") != "success":
+        raise RuntimeError(data)
+    return data["value"]
+
 def convex_mutation(path: str, args: dict):
     r = requests.post(
         f"{CONVEX_URL}/api/mutation",
@@ -59,126 +96,137 @@ def convex_mutation(path: str, args: dict):
         raise RuntimeError(data)
     return data["value"]
 
-def chunk_text(text: str, max_chars: int = 1200, overlap_chars: int = 200):
-    """
-    Split text into chunks with overlap for better context preservation.
-    
-    Args:
-        text: The text to chunk
-        max_chars: Maximum characters per chunk (default 1200)
-        overlap_chars: Characters to overlap between chunks (default 200)
-    
-    Returns:
-        List of text chunks
-    """
-    # Split into paragraphs
-    paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
-    
-    if not paragraphs:
-        return []
-    
-    chunks = []
-    current_chunk = []
-    current_len = 0
-    
-    for para in paragraphs:
-        para_len = len(para)
-        
-        # If adding this paragraph exceeds max, save current chunk and start new one
-        if current_chunk and current_len + para_len + 2 > max_chars:  # +2 for \n\n
-            chunk_text = "\n\n".join(current_chunk)
-            chunks.append(chunk_text)
-            
-            # Start new chunk with overlap from previous chunk
-            # Take paragraphs from end of current_chunk that fit in overlap
-            overlap_paras = []
-            overlap_len = 0
-            for p in reversed(current_chunk):
-                if overlap_len + len(p) + 2 <= overlap_chars:
-                    overlap_paras.insert(0, p)
-                    overlap_len += len(p) + 2
-                else:
-                    break
-            
-            current_chunk = overlap_paras
-            current_len = overlap_len
-        
-        current_chunk.append(para)
-        current_len += para_len + 2
-    
-    # Don't forget the last chunk
-    if current_chunk:
-        chunks.append("\n\n".join(current_chunk))
-    
-    return chunks
+def embed(texts, model: str = EMBED_MODEL):
+    return get_provider(model, oa).embed(texts)
+
+
+# Embedding request packing and budgets (0 = no rate budget)
+EMBED_BATCH_ITEMS = int(os.getenv("EMBED_BATCH_ITEMS", "512"))
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "100000"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_RPM = float(os.getenv("EMBED_RPM", "0"))
+EMBED_TPM = float(os.getenv("EMBED_TPM", "0"))
+
+
+def make_embed_batcher(
+    max_items: int = EMBED_BATCH_ITEMS,
+    max_tokens: int = EMBED_BATCH_TOKENS,
+    concurrency: int = EMBED_CONCURRENCY,
+    rpm: float = EMBED_RPM,
+    tpm: float = EMBED_TPM,
+    cache: Optional[EmbeddingCache] = None,
+    model: str = EMBED_MODEL,
+) -> EmbeddingBatcher:
+    # Request budgets only apply to remote APIs
+    remote = get_provider(model, oa).remote
+    return EmbeddingBatcher(
+        functools.partial(embed, model=model),
+        max_items=max_items,
+        max_tokens=max_tokens,
+        concurrency=concurrency,
+        rate_limiter=RateLimiter(
+            requests_per_minute=rpm if remote and rpm else None,
+            tokens_per_minute=tpm if remote and tpm else None,
+        ),
+        cache=cache,
+        near_duplicates=DEDUPE_JACCARD or None,
+    )
 
-def embed(texts):
-    out = oa.embeddings.create(model=EMBED_MODEL, input=texts)
-    return [d.embedding for d in out.data]
 
-def parse_pdf(filepath: str) -> str:
-    """Extract text from PDF file."""
+# Built on first use, not at import: a batcher owns threads (and, for local
+# models, worker processes) that importers such as ingest_watch don't need
+_model_batchers = {}
+
+
+def batcher_for(model: str) -> EmbeddingBatcher:
+    """The shared batcher for an embedding model, with its default settings."""
+    batcher = _model_batchers.get(model)
+    if batcher is None:
+        batcher = _model_batchers[model] = make_embed_batcher(cache=cache_from_env(model), model=model)
+    return batcher
+
+def iter_pdf(filepath: str) -> Iterator[str]:
+    """Yield the text of each PDF page."""
     if not HAS_PDF:
         raise ValueError("PyPDF2 not installed")
     
     reader = PdfReader(filepath)
-    text_parts = []
     for page in reader.pages:
         text = page.extract_text()
-        if text:
-            text_parts.append(text.strip())
-    return "\n\n".join(text_parts)
+        if text and text.strip():
+            yield text.strip()
 
 
-def parse_pptx(filepath: str) -> str:
-    """Extract text from PowerPoint file."""
+def iter_pptx(filepath: str) -> Iterator[str]:
+    """Yield the text of each PowerPoint slide."""
     if not HAS_PPTX:
         raise ValueError("python-pptx not installed")
     
     prs = Presentation(filepath)
-    text_parts = []
-    
     for slide_num, slide in enumerate(prs.slides, 1):
         slide_text = [f"--- Slide {slide_num} ---"]
         for shape in slide.shapes:
             if hasattr(shape, "text") and shape.text.strip():
                 slide_text.append(shape.text.strip())
         if len(slide_text) > 1:  # More than just the slide header
-            text_parts.append("\n".join(slide_text))
-    
-    return "\n\n".join(text_parts)
+            yield "\n".join(slide_text)
 
 
-def parse_xlsx(filepath: str) -> str:
-    """Extract text from Excel file."""
+def iter_xlsx(filepath: str, rows_per_block: int = XLSX_ROWS_PER_BLOCK) -> Iterator[str]:
+    """
+    Yield Excel rows in blocks of rows_per_block, each prefixed with its sheet
+    name. Blocks are separate paragraphs, so a large sheet is chunked by rows
+    instead of becoming one oversized paragraph.
+    """
     if not HAS_XLSX:
         raise ValueError("openpyxl not installed")
     
     wb = load_workbook(filepath, read_only=True, data_only=True)
-    text_parts = []
-    
-    for sheet_name in wb.sheetnames:
-        sheet = wb[sheet_name]
-        sheet_text = [f"=== Sheet: {sheet_name} ==="]
-        
-        for row in sheet.iter_rows():
-            row_values = []
-            for cell in row:
-                if cell.value is not None:
-                    row_values.append(str(cell.value))
-            if row_values:
-                sheet_text.append(" | ".join(row_values))
-        
-        if len(sheet_text) > 1:
-            text_parts.append("\n".join(sheet_text))
-    
-    wb.close()
-    return "\n\n".join(text_parts)
+    try:
+        for sheet_name in wb.sheetnames:
+            sheet = wb[sheet_name]
+            header = f"=== Sheet: {sheet_name} ==="
+            block = []
+            for row in sheet.iter_rows():
+                row_values = [str(cell.value) for cell in row if cell.value is not None]
+                if row_values:
+                    block.append(" | ".join(row_values))
+                if len(block) >= rows_per_block:
+                    yield "\n".join([header] + block)
+                    block = []
+            if block:
+                yield "\n".join([header] + block)
+    finally:
+        wb.close()
+
+
+def parse_pdf(filepath: str) -> str:
+    """Extract text from PDF file."""
+    return "\n\n".join(iter_pdf(filepath))
+
+
+def parse_pptx(filepath: str) -> str:
+    """Extract text from PowerPoint file."""
+    return "\n\n".join(iter_pptx(filepath))
+
+
+def parse_xlsx(filepath: str) -> str:
+    """Extract text from Excel file."""
+    return "\n\n".join(iter_xlsx(filepath))
+
+
+STREAM_PARSERS = {".pdf": iter_pdf, ".pptx": iter_pptx, ".xlsx": iter_xlsx}
+
+
+class ParseError(Exception):
+    """A supported file could not be parsed (corrupt, half-written, or its parser is not installed)."""
 
 
 def parse_file_to_text(filepath: str) -> Optional[tuple]:
     """
-    Returns (title, text) or None if file type not supported.
+    Returns (title, text) or None if file type not supported. Raises (e.g.
+    ParseError) if a supported file cannot be parsed, so that a failure is
+    never mistaken for a file without content.
     
     Supported formats:
     - .md/.txt: plain text
@@ -210,38 +258,29 @@ def parse_file_to_text(filepath: str) -> Optional[tuple]:
     # PDF documents
     if ext == ".pdf":
         if not HAS_PDF:
-            print(f"  Skipping {name} (PyPDF2 not installed)")
-            return None
+            raise ParseError(f"{name}: PyPDF2 not installed")
         try:
-            text = parse_pdf(filepath)
-            return title, text
+            return title, parse_pdf(filepath)
         except Exception as e:
-            print(f"  Error parsing {name}: {e}")
-            return None
+            raise ParseError(f"{name}: {e}") from e
 
     # PowerPoint presentations
     if ext == ".pptx":
         if not HAS_PPTX:
-            print(f"  Skipping {name} (python-pptx not installed)")
-            return None
+            raise ParseError(f"{name}: python-pptx not installed")
         try:
-            text = parse_pptx(filepath)
-            return title, text
+            return title, parse_pptx(filepath)
         except Exception as e:
-            print(f"  Error parsing {name}: {e}")
-            return None
+            raise ParseError(f"{name}: {e}") from e
 
     # Excel spreadsheets
     if ext in [".xlsx", ".xls"]:
         if not HAS_XLSX:
-            print(f"  Skipping {name} (openpyxl not installed)")
-            return None
+            raise ParseError(f"{name}: openpyxl not installed")
         try:
-            text = parse_xlsx(filepath)
-            return title, text
+            return title, parse_xlsx(filepath)
         except Exception as e:
-            print(f"  Error parsing {name}: {e}")
-            return None
+            raise ParseError(f"{name}: {e}") from e
 
     # Unknown file type - skip silently
     print(f"  Skipping {name} (unsupported file type: {ext})")
@@ -254,72 +293,725 @@ def ingest_doc(
     raw_text: str,
     source_url: str | None = None,
 ):
-    doc_args = {
-        "tenantId": tenant_id,
+    model = tenant_model(tenant_id, EMBED_MODEL)
+    faiss_store.require_model(tenant_id, model)
+    spans = chunk_spans(raw_text)
+    vectors = batcher_for(model).embed([raw_text[s:e] for s, e in spans])
+
+    doc = {
         "sourceKey": source_key,
         "title": title,
         "rawText": raw_text,
+        # Convex slices the chunk text out of rawText
+        "chunks": [{"chunkIndex": i, "start": s, "end": e} for i, (s, e) in enumerate(utf16_spans(raw_text, spans))],
     }
     if source_url:
-        doc_args["sourceUrl"] = source_url
+        doc["sourceUrl"] = source_url
+    chunk_ids = ConvexBulkWriter(convex_mutation).add_documents(tenant_id, [doc])[0]["chunkIds"]
 
-    doc_id = convex_mutation("ingest:addDocument", doc_args)
+    faiss_store.add(tenant_id, source_key, vectors, chunk_ids)
+    print(f"Ingested [{source_key}] {title}  chunks={len(chunk_ids)}")
 
-    pieces = chunk_text(raw_text)
-    vectors = embed(pieces)
+# ============ Pipelined ingestion ============
+#
+# files -> [parse: process pool] -> [embed: N async workers] -> [convex: batched]
+#       -> [faiss: single writer]
+#
+# Stages are connected by bounded queues so a slow stage applies backpressure
+# instead of letting parsed documents pile up in memory.
+
+_DONE = object()
+
+
+class StageStats:
+    """Per-stage throughput counters."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.chunks = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def record(self, elapsed: float, items: int = 1, chunks: int = 0):
+        now = time.perf_counter()
+        if self.started is None:
+            self.started = now - elapsed
+        self.finished = now
+        self.items += items
+        self.chunks += chunks
+        self.busy += elapsed
+
+    def line(self, workers: int) -> str:
+        wall = (self.finished - self.started) if self.started is not None else 0.0
+        rate = self.items / wall if wall > 0 else 0.0
+        util = self.busy / (wall * workers) * 100 if wall > 0 else 0.0
+        return (
+            f"  {self.name:<7} docs={self.items:<7} chunks={self.chunks:<8} failed={self.failed:<4} "
+            f"wall={wall:7.1f}s  {rate:8.1f} docs/s  busy={util:5.1f}%"
+        )
+
+
+def iter_files(data_dir: str, paths: Optional[Iterable[str]] = None):
+    """
+    Yield (source_key, path) for every non-hidden file under data_dir/<source>/,
+    or, given paths, only for those that are (or are under) one of them.
+    """
+    tops = [os.path.join(data_dir, s) for s in sorted(os.listdir(data_dir))] if paths is None else sorted(paths)
+    for top in tops:
+        parts = os.path.relpath(top, data_dir).split(os.sep)
+        if parts == ["."]:
+            yield from iter_files(data_dir)
+            continue
+        if parts[0] == "..":
+            continue
+        source_key = parts[0]
+        if os.path.isdir(top):
+            for root, _, files in os.walk(top):
+                for fn in sorted(files):
+                    # Skip hidden files
+                    if fn.startswith("."):
+                        continue
+                    yield source_key, os.path.join(root, fn)
+        elif len(parts) >= 2 and not parts[-1].startswith(".") and os.path.isfile(top):
+            yield source_key, top
+
+
+def parse_and_chunk(fp: str, known_sha256: Optional[str] = None) -> dict:
+    """
+    Process-pool entry point: hash, parse and chunk a file.
+
+    If the content hash matches known_sha256 the file is not parsed and
+    {"unchanged": True} is returned. Otherwise returns title, text, the
+    chunks' (start, end) spans in text and their hashes; spans is empty when
+    the file type is not supported or the file has no text. A file that
+    cannot be parsed raises instead. The chunk texts are not returned:
+    they are slices of text, and sending them back too would pickle every
+    document (more than) twice.
+    """
+    sha = file_sha256(fp)
+    if sha == known_sha256:
+        return {"sha256": sha, "unchanged": True}
+    out = {"sha256": sha, "unchanged": False, "title": None, "text": "", "spans": [], "hashes": []}
+    result = parse_file_to_text(fp)
+    if result is None:
+        return out
+    title, text = result
+    if not text.strip():
+        print(f"  Skipping {os.path.basename(fp)} (empty content)")
+        return out
+    spans = chunk_spans(text)
+    out.update(title=title, text=text, spans=spans, hashes=[chunk_hash(text[s:e]) for s, e in spans])
+    return out
+
+
+def make_ingest_key(tenant_id: str, key: str, sha256: str) -> str:
+    """
+    Identifies one content version of one file, as chunked by the current
+    chunker settings; stored on the Convex document.
+    """
+    raw = f"{tenant_id}:{key}:{sha256}:{CHUNKER_ID}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
 
-    chunk_rows = [{"chunkIndex": i, "text": pieces[i]} for i in range(len(pieces))]
-    chunk_ids = convex_mutation("ingest:addChunks", {
+
+def reconcile_pending(tenant_id: str, journal: IngestJournal):
+    """
+    Resolve Convex writes whose outcome was never journaled: if the document
+    exists, record its ids so this run reuses them instead of writing again.
+    """
+    pending = [st for st in journal.unfinished() if st["stage"] == "convex_pending"]
+    by_ik = {st["ingestKey"]: st for st in pending}
+    found = []
+    keys = list(by_ik)
+    for i in range(0, len(keys), 100):
+        found.extend(convex_query("ingest:findByIngestKeys", {
+            "tenantId": tenant_id, "ingestKeys": keys[i:i + 100],
+        }))
+    records = []
+    for f in found:
+        st = by_ik.pop(f["ingestKey"], None)
+        if st is None:
+            continue  # duplicates of the same key: the first one wins
+        records.append({"key": st["key"], "ingestKey": f["ingestKey"], "stage": "convex_done",
+                        "sourceKey": st["sourceKey"], "docId": f["docId"], "chunkIds": f["chunkIds"]})
+    for st in by_ik.values():
+        # Never reached Convex: nothing to clean up
+        records.append({"key": st["key"], "ingestKey": st["ingestKey"], "stage": "discarded"})
+    journal.record_many(records)
+    return len(found)
+
+
+def discard_state(tenant_id: str, st: dict):
+    """Remove an unfinished version's Convex document and any vectors it got."""
+    faiss_store.remove(tenant_id, st["sourceKey"], st.get("chunkIds", []))
+    convex_mutation("ingest:deleteDocument", {"id": st["docId"], "tenantId": tenant_id})
+
+
+def retire_entry(tenant_id: str, entry: dict):
+    """Remove a previously ingested file's vectors and Convex document."""
+    chunk_ids = [c["chunkId"] for c in entry["chunks"]]
+    faiss_store.remove(tenant_id, entry["sourceKey"], chunk_ids)
+    convex_mutation("ingest:deleteDocument", {"id": entry["docId"], "tenantId": tenant_id})
+
+
+def reuse_vectors(tenant_id: str, doc: dict):
+    """
+    Fill doc["vectors"] from the index for chunks whose text is unchanged since
+    the previous ingest; doc["todo"] lists the chunk positions still to embed.
+    """
+    doc["vectors"] = [None] * len(doc["pieces"])
+    doc["todo"] = list(range(len(doc["pieces"])))
+    prev = doc.get("prev")
+    if not prev:
+        return
+    by_hash = {c["hash"]: c["chunkId"] for c in prev["chunks"]}
+    known = faiss_store.reconstruct(
+        tenant_id, prev["sourceKey"], [by_hash[h] for h in doc["hashes"] if h in by_hash]
+    )
+    todo = []
+    for i, h in enumerate(doc["hashes"]):
+        vec = known.get(by_hash.get(h))
+        if vec is not None:
+            doc["vectors"][i] = vec
+        else:
+            todo.append(i)
+    doc["todo"] = todo
+
+
+def _windows(chunks: Iterator[tuple], size: int) -> Iterator[list]:
+    window = []
+    for chunk in chunks:
+        window.append(chunk)
+        if len(window) >= size:
+            yield window
+            window = []
+    if window:
+        yield window
+
+
+def ingest_streaming(
+    tenant_id: str,
+    source_key: str,
+    fp: str,
+    key: str,
+    prev: Optional[dict],
+    st: os.stat_result,
+    sha256: str,
+    journal: IngestJournal,
+    manifest: IngestManifest,
+    batcher: EmbeddingBatcher,
+    window_chunks: int = STREAM_WINDOW_CHUNKS,
+    preview_chars: int = STREAM_PREVIEW_CHARS,
+) -> int:
+    """
+    Ingest one large file with bounded memory: pages/slides/row blocks are
+    chunked as they are parsed, and every window of chunks is embedded,
+    written to Convex and added to FAISS before the next one is parsed.
+    The Convex document keeps only the first preview_chars of text.
+    Returns the number of chunks ingested (0 if the file has no text).
+    """
+    ext = os.path.splitext(fp)[1].lower()
+    title = os.path.splitext(os.path.basename(fp))[0].replace("_", " ")
+    ingest_key = make_ingest_key(tenant_id, key, sha256)
+
+    # A streamed version is never resumed mid-file: drop what a previous
+    # attempt wrote and start over
+    stale = journal.resumable(key, ingest_key)
+    if stale.get("docId"):
+        discard_state(tenant_id, stale)
+        journal.record(key, ingest_key, "discarded")
+
+    segments = STREAM_PARSERS[ext](fp)
+    head, head_len, truncated = [], 0, False
+    for segment in segments:
+        head.append(segment)
+        head_len += len(segment) + 2
+        if head_len >= preview_chars:
+            truncated = True
+            break
+    if not head:
+        return 0
+    raw_text = "\n\n".join(head)
+    truncated = truncated or len(raw_text) > preview_chars
+
+    journal.record(key, ingest_key, "convex_pending", sourceKey=source_key)
+    doc_args = {
         "tenantId": tenant_id,
         "sourceKey": source_key,
+        "title": title,
+        "rawText": raw_text[:preview_chars],
+        "ingestKey": ingest_key,
+    }
+    if truncated:
+        doc_args["truncated"] = True
+    doc_id = convex_mutation("ingest:addDocument", doc_args)
+    journal.record(key, ingest_key, "convex_done", sourceKey=source_key, docId=doc_id, chunkIds=[])
+    del raw_text
+
+    chunk_entries = []
+    chunks = iter_chunks(itertools.chain(head, segments))
+    head = None
+    for window in _windows(chunks, window_chunks):
+        pieces = [c[2] for c in window]
+        hashes = [chunk_hash(p) for p in pieces]
+        part = {"pieces": pieces, "hashes": hashes, "prev": prev}
+        reuse_vectors(tenant_id, part)
+        fresh = batcher.embed([pieces[i] for i in part["todo"]])
+        for i, vec in zip(part["todo"], fresh):
+            part["vectors"][i] = vec
+
+        start = len(chunk_entries)
+        chunk_ids = convex_mutation("ingest:addChunks", {
+            "tenantId": tenant_id,
+            "sourceKey": source_key,
+            "docId": doc_id,
+            # rawText only holds a prefix, so the text travels with each chunk
+            "chunks": [{"chunkIndex": start + i, "text": p} for i, p in enumerate(pieces)],
+        })
+        journal.record(key, ingest_key, "convex_done", appendChunkIds=chunk_ids)
+        faiss_store.add(tenant_id, source_key, part["vectors"], chunk_ids)
+        chunk_entries.extend({"hash": h, "chunkId": cid} for h, cid in zip(hashes, chunk_ids))
+
+    if prev:
+        retire_entry(tenant_id, prev)
+    manifest.set(key, {
+        "sourceKey": source_key,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": sha256,
         "docId": doc_id,
-        "chunks": chunk_rows,
+        "chunks": chunk_entries,
     })
+    manifest.save()
+    journal.record(key, ingest_key, "indexed")
+    return len(chunk_entries)
+
+
+def _take_batch(queue: asyncio.Queue, first, max_items: int):
+    """Drain whatever is already queued behind `first`, up to max_items."""
+    batch = [first]
+    done = False
+    while len(batch) < max_items and not queue.empty():
+        item = queue.get_nowait()
+        if item is _DONE:
+            done = True
+            break
+        batch.append(item)
+    return batch, done
+
+
+async def run_pipeline(
+    data_dir: str,
+    tenant_id: str,
+    parse_workers: int,
+    embed_concurrency: int,
+    convex_batch: int,
+    queue_size: int,
+    batcher: Optional[EmbeddingBatcher] = None,
+    force: bool = False,
+    stream_threshold: int = STREAM_THRESHOLD_BYTES,
+    model: Optional[str] = None,
+    paths: Optional[Iterable[str]] = None,
+):
+    """
+    Ingest the files under data_dir/<source>/, or only the given changed
+    paths (files or directories; missing ones were deleted, and what the
+    manifest has at or under them is retired). Returns per-stage StageStats.
+    """
+    # The batcher, if given, must embed with the tenant's model
+    model = model or tenant_model(tenant_id, EMBED_MODEL)
+    batcher = batcher or batcher_for(model)
+    faiss_store.require_model(tenant_id, model)
+    bulk = ConvexBulkWriter(convex_mutation, max_docs=convex_batch)
+    manifest = IngestManifest.for_tenant(faiss_store.base_dir, tenant_id)
+    journal = IngestJournal.for_tenant(faiss_store.base_dir, tenant_id)
+    counts = {"unchanged": 0, "retired": 0, "reused_chunks": 0, "resumed": 0, "discarded": 0, "duplicates": 0}
+    if journal.unfinished():
+        print(f"Resuming: {len(journal.unfinished())} unfinished files in the ingest journal")
+        reconcile_pending(tenant_id, journal)
+    if paths is not None:
+        paths = set(paths)
+        if any(os.path.relpath(p, data_dir) == "." for p in paths):
+            paths = None
+    scopes = None if paths is None else [os.path.relpath(p, data_dir) for p in paths]
+
+    def in_scope(key: str) -> bool:
+        return scopes is None or any(key == r or key.startswith(r + os.sep) for r in scopes)
+
+    current = {}  # key -> ingestKey of the version seen this run
+    seen = set()
+    vanished = []  # manifest keys whose file now parses to no content
+    stats = {name: StageStats(name) for name in ("parse", "embed", "convex", "faiss", "stream")}
+    paths_q: asyncio.Queue = asyncio.Queue(queue_size)
+    stream_q: asyncio.Queue = asyncio.Queue(queue_size)
+    embed_q: asyncio.Queue = asyncio.Queue(queue_size)
+    convex_q: asyncio.Queue = asyncio.Queue(queue_size)
+    faiss_q: asyncio.Queue = asyncio.Queue(queue_size)
+    loop = asyncio.get_running_loop()
+
+    async def discover():
+        for source_key, fp in iter_files(data_dir, paths):
+            key = os.path.relpath(fp, data_dir)
+            if key in seen:
+                continue  # named both as a file and through its directory
+            seen.add(key)
+            try:
+                st = os.stat(fp)
+            except FileNotFoundError:
+                seen.discard(key)  # deleted since it was listed
+                continue
+            if not force and manifest.is_unchanged(key, st.st_size, st.st_mtime_ns):
+                counts["unchanged"] += 1
+                continue
+            ext = os.path.splitext(fp)[1].lower()
+            if st.st_size >= stream_threshold and ext in STREAM_PARSERS:
+                await stream_q.put((source_key, fp, key, manifest.get(key), st))
+            else:
+                await paths_q.put((source_key, fp, key, manifest.get(key), st))
+        for _ in range(parse_workers):
+            await paths_q.put(_DONE)
+        await stream_q.put(_DONE)
+
+    async def stream_worker():
+        # Large files one at a time, so at most one is in memory (a window of it)
+        while (item := await stream_q.get()) is not _DONE:
+            source_key, fp, key, prev, st = item
+            t0 = time.perf_counter()
+            try:
+                sha = await asyncio.to_thread(file_sha256, fp)
+                if prev and not force and prev["sha256"] == sha:
+                    manifest.set(key, {**prev, "size": st.st_size, "mtime_ns": st.st_mtime_ns})
+                    counts["unchanged"] += 1
+                    continue
+                current[key] = make_ingest_key(tenant_id, key, sha)
+                n = await asyncio.to_thread(
+                    ingest_streaming, tenant_id, source_key, fp, key, prev, st, sha,
+                    journal, manifest, batcher,
+                )
+            except Exception as e:
+                print(f"  Error streaming {fp}: {e}")
+                stats["stream"].failed += 1
+                continue
+            if n == 0:
+                # Parsed, and no text left (parse errors and missing parsers
+                # raise, keeping the previous version)
+                if prev:
+                    vanished.append(key)
+                continue
+            stats["stream"].record(time.perf_counter() - t0, chunks=n)
+            print(f"{'Updated' if prev else 'Ingested'} [{source_key}] {os.path.basename(fp)}  "
+                  f"chunks={n} (streamed)")
+
+    async def parse_worker(pool):
+        while (item := await paths_q.get()) is not _DONE:
+            source_key, fp, key, prev, st = item
+            t0 = time.perf_counter()
+            known = prev["sha256"] if prev and not force else None
+            try:
+                result = await loop.run_in_executor(pool, parse_and_chunk, fp, known)
+            except Exception as e:
+                print(f"  Error parsing {fp}: {e}")
+                stats["parse"].failed += 1
+                continue
+            if result["unchanged"]:
+                # Touched but identical content: just refresh the stat fields
+                manifest.set(key, {**prev, "size": st.st_size, "mtime_ns": st.st_mtime_ns})
+                counts["unchanged"] += 1
+                continue
+            if not result["spans"]:
+                # Parsed, and no text left (parse errors were raised above and
+                # keep the previous version)
+                if prev:
+                    vanished.append(key)
+                continue
+            stats["parse"].record(time.perf_counter() - t0, chunks=len(result["spans"]))
+            text = result["text"]
+            doc = {
+                "sourceKey": source_key, "path": fp, "key": key, "prev": prev,
+                "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": result["sha256"],
+                "ingestKey": make_ingest_key(tenant_id, key, result["sha256"]),
+                "title": result["title"], "text": text,
+                "pieces": [text[s:e] for s, e in result["spans"]], "spans": result["spans"],
+                "hashes": result["hashes"],
+            }
+            current[key] = doc["ingestKey"]
+            resume = journal.resumable(key, doc["ingestKey"])
+            if resume.get("docId") and len(resume["chunkIds"]) == len(doc["pieces"]):
+                # Written to Convex by an interrupted run: reuse those ids
+                doc["docId"], doc["chunkIds"] = resume["docId"], resume["chunkIds"]
+                counts["resumed"] += 1
+            await embed_q.put(doc)
+
+    async def embed_worker():
+        # Pack chunks from whatever documents are queued into shared requests
+        done = False
+        while not done:
+            first = await embed_q.get()
+            if first is _DONE:
+                break
+            pack, n_chunks = [first], len(first["pieces"])
+            while n_chunks < batcher.max_items and not embed_q.empty():
+                doc = embed_q.get_nowait()
+                if doc is _DONE:
+                    done = True
+                    break
+                pack.append(doc)
+                n_chunks += len(doc["pieces"])
+
+            t0 = time.perf_counter()
+            try:
+                for doc in pack:
+                    await asyncio.to_thread(reuse_vectors, tenant_id, doc)
+                vectors = await asyncio.to_thread(
+                    batcher.embed_documents, [[d["pieces"][i] for i in d["todo"]] for d in pack]
+                )
+            except Exception as e:
+                print(f"  Error embedding {len(pack)} docs: {e}")
+                stats["embed"].failed += len(pack)
+                continue
+            embedded = 0
+            for doc, vecs in zip(pack, vectors):
+                for i, vec in zip(doc["todo"], vecs):
+                    doc["vectors"][i] = vec
+                embedded += len(doc["todo"])
+                counts["reused_chunks"] += len(doc["pieces"]) - len(doc["todo"])
+            stats["embed"].record(time.perf_counter() - t0, items=len(pack), chunks=embedded)
+            for doc in pack:
+                await convex_q.put(doc)
+
+    async def convex_writer():
+        # Documents are packed into size-capped addDocuments calls; each call
+        # is journaled on its own so one failing batch doesn't fail the rest
+        done = False
+        while not done:
+            first = await convex_q.get()
+            if first is _DONE:
+                break
+            batch, done = _take_batch(convex_q, first, convex_batch)
+            todo = [doc for doc in batch if "docId" not in doc]
+            payload = [
+                {
+                    "sourceKey": doc["sourceKey"],
+                    "title": doc["title"],
+                    "rawText": doc["text"],
+                    "ingestKey": doc["ingestKey"],
+                    "chunks": [{"chunkIndex": i, "start": st, "end": en}
+                               for i, (st, en) in enumerate(utf16_spans(doc["text"], doc["spans"]))],
+                }
+                for doc in todo
+            ]
+            failed = set()
+            for part in bulk.pack(payload):
+                docs = [todo[p] for p in part]
+                t0 = time.perf_counter()
+                try:
+                    await asyncio.to_thread(journal.record_many, [
+                        {"key": d["key"], "ingestKey": d["ingestKey"], "stage": "convex_pending",
+                         "sourceKey": d["sourceKey"]} for d in docs
+                    ])
+                    ids = await asyncio.to_thread(bulk.write_batch, tenant_id, [payload[p] for p in part])
+                    for doc, written in zip(docs, ids):
+                        doc["docId"] = written["docId"]
+                        doc["chunkIds"] = written["chunkIds"]
+                    await asyncio.to_thread(journal.record_many, [
+                        {"key": d["key"], "ingestKey": d["ingestKey"], "stage": "convex_done",
+                         "sourceKey": d["sourceKey"], "docId": d["docId"], "chunkIds": d["chunkIds"]}
+                        for d in docs
+                    ])
+                except Exception as e:
+                    print(f"  Error writing batch of {len(docs)} docs to Convex: {e}")
+                    stats["convex"].failed += len(docs)
+                    failed.update(id(d) for d in docs)
+                else:
+                    stats["convex"].record(time.perf_counter() - t0, items=len(docs),
+                                           chunks=sum(len(d["pieces"]) for d in docs))
+            for doc in batch:
+                if id(doc) not in failed and "docId" in doc:
+                    await faiss_q.put(doc)
+        await faiss_q.put(_DONE)
+
+    async def faiss_writer():
+        # Single writer: one add() (and one index rewrite) per source per batch
+        done = False
+        while not done:
+            first = await faiss_q.get()
+            if first is _DONE:
+                break
+            batch, done = _take_batch(faiss_q, first, max(convex_batch, 64))
+            by_source = {}
+            for doc in batch:
+                vecs, ids = by_source.setdefault(doc["sourceKey"], ([], []))
+                vecs.extend(doc["vectors"])
+                ids.extend(doc["chunkIds"])
+            t0 = time.perf_counter()
+            for source_key, (vecs, ids) in by_source.items():
+                # A resumed run may already have added some of these
+                present = await asyncio.to_thread(faiss_store.contains, tenant_id, source_key, ids)
+                if present:
+                    pairs = [(v, cid) for v, cid in zip(vecs, ids) if cid not in present]
+                    vecs, ids = [p[0] for p in pairs], [p[1] for p in pairs]
+                if ids:
+                    counts["duplicates"] += await asyncio.to_thread(faiss_store.add, tenant_id, source_key, vecs, ids)
+            # New versions are searchable before the old ones are retired
+            for doc in batch:
+                # Re-ingesting an identical version gets the same document back
+                if doc["prev"] and doc["prev"]["docId"] != doc["docId"]:
+                    try:
+                        await asyncio.to_thread(retire_entry, tenant_id, doc["prev"])
+                    except Exception as e:
+                        print(f"  Error retiring old version of {doc['key']}: {e}")
+                manifest.set(doc["key"], {
+                    "sourceKey": doc["sourceKey"],
+                    "size": doc["size"],
+                    "mtime_ns": doc["mtime_ns"],
+                    "sha256": doc["sha256"],
+                    "docId": doc["docId"],
+                    "chunks": [{"hash": h, "chunkId": cid} for h, cid in zip(doc["hashes"], doc["chunkIds"])],
+                })
+            await asyncio.to_thread(manifest.save)
+            await asyncio.to_thread(journal.record_many, [
+                {"key": d["key"], "ingestKey": d["ingestKey"], "stage": "indexed"} for d in batch
+            ])
+            stats["faiss"].record(time.perf_counter() - t0, items=len(batch), chunks=sum(
+                len(d["chunkIds"]) for d in batch))
+            for doc in batch:
+                verb = "Updated" if doc["prev"] else "Ingested"
+                print(f"{verb} [{doc['sourceKey']}] {doc['title']}  chunks={len(doc['chunkIds'])}")
+
+    async def parse_stage(pool):
+        await asyncio.gather(*(parse_worker(pool) for _ in range(parse_workers)))
+        for _ in range(embed_concurrency):
+            await embed_q.put(_DONE)
+
+    async def embed_stage():
+        await asyncio.gather(*(embed_worker() for _ in range(embed_concurrency)))
+        await convex_q.put(_DONE)
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=parse_workers) as pool:
+        await asyncio.gather(
+            discover(), parse_stage(pool), embed_stage(), convex_writer(), faiss_writer(),
+            stream_worker(),
+        )
+
+    # Files that were deleted (or now parse to no text) since the last run.
+    # Files that failed to parse are in `seen` and keep their version
+    for key in vanished + [k for k in manifest.keys() if k not in seen and in_scope(k)]:
+        entry = manifest.get(key)
+        try:
+            await asyncio.to_thread(retire_entry, tenant_id, entry)
+        except Exception as e:
+            print(f"  Error retiring {key}: {e}")
+            continue
+        manifest.remove(key)
+        counts["retired"] += 1
+        print(f"Retired [{entry['sourceKey']}] {key}")
+    manifest.save()
+
+    # Unfinished versions that are no longer current (file changed or deleted
+    # since the interrupted run) are orphans: clean them up. Versions that are
+    # still current but failed this run stay journaled for the next run, and
+    # so do files outside the paths this run looked at.
+    for st in journal.unfinished():
+        if st["stage"] != "convex_done" or not in_scope(st["key"]):
+            continue
+        key = st["key"]
+        entry = manifest.get(key)
+        if entry and entry["docId"] == st["docId"]:
+            # Indexed and in the manifest; only the journal record was lost
+            journal.record(key, st["ingestKey"], "indexed")
+            continue
+        if current.get(key) == st["ingestKey"]:
+            continue
+        try:
+            await asyncio.to_thread(discard_state, tenant_id, st)
+        except Exception as e:
+            print(f"  Error discarding orphaned {key}: {e}")
+            continue
+        journal.record(key, st["ingestKey"], "discarded")
+        counts["discarded"] += 1
+    journal.compact()
+    journal.close()
+    elapsed = time.perf_counter() - started
+
+    workers = {"parse": parse_workers, "embed": embed_concurrency, "convex": 1, "faiss": 1, "stream": 1}
+    print(f"\nStage throughput ({elapsed:.1f}s total):")
+    for name, st in stats.items():
+        print(st.line(workers[name]))
+    print(f"  unchanged={counts['unchanged']} retired={counts['retired']} "
+          f"reused_chunks={counts['reused_chunks']} resumed={counts['resumed']} "
+          f"orphans_discarded={counts['discarded']} duplicate_chunks={counts['duplicates']} "
+          f"unfinished={len(journal.unfinished())}")
+    print(f"  {bulk.summary()}")
+    return stats
 
-    faiss_store.add(tenant_id, source_key, vectors, chunk_ids)
-    print(f"Ingested [{source_key}] {title}  chunks={len(chunk_ids)}")
 
 def main():
-    if not os.path.isdir(DATA_DIR):
-        raise RuntimeError(f"Missing {DATA_DIR}/ directory")
-
-    total_docs = 0
-    total_chunks = 0
-    
-    for source_key in os.listdir(DATA_DIR):
-        src_dir = os.path.join(DATA_DIR, source_key)
-        if not os.path.isdir(src_dir):
-            continue
-
-        print(f"\nProcessing source: {source_key}")
-        
-        for root, _, files in os.walk(src_dir):
-            for fn in files:
-                # Skip hidden files
-                if fn.startswith("."):
-                    continue
-                    
-                fp = os.path.join(root, fn)
-                result = parse_file_to_text(fp)
-                
-                # Skip if file type not supported
-                if result is None:
-                    continue
-                    
-                title, text = result
-                
-                # Skip empty documents
-                if not text.strip():
-                    print(f"  Skipping {fn} (empty content)")
-                    continue
-                
-                ingest_doc(TENANT_ID, source_key, title, text)
-                total_docs += 1
+    parser = argparse.ArgumentParser(description="Ingest all files under <data-dir>/<source>/")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--tenant", default=TENANT_ID)
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes used for parsing PDF/PPTX/XLSX")
+    parser.add_argument("--embed-concurrency", type=int, default=EMBED_CONCURRENCY,
+                        help="Embedding requests in flight at once")
+    parser.add_argument("--embed-batch-items", type=int, default=EMBED_BATCH_ITEMS,
+                        help="Max chunks per embeddings request")
+    parser.add_argument("--embed-batch-tokens", type=int, default=EMBED_BATCH_TOKENS,
+                        help="Max estimated tokens per embeddings request")
+    parser.add_argument("--embed-rpm", type=float, default=EMBED_RPM, help="Embedding requests/minute budget (0 = unlimited)")
+    parser.add_argument("--embed-tpm", type=float, default=EMBED_TPM, help="Embedding tokens/minute budget (0 = unlimited)")
+    parser.add_argument("--convex-batch", type=int, default=64,
+                        help="Max documents per ingest:addDocuments mutation (also capped by size)")
+    parser.add_argument("--queue-size", type=int, default=64,
+                        help="Capacity of the queues between stages")
+    parser.add_argument("--stream-threshold-mb", type=float, default=STREAM_THRESHOLD_BYTES / 1e6,
+                        help="PDF/PPTX/XLSX files at least this large are ingested incrementally")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-ingest every file even if the manifest says it is unchanged")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.data_dir):
+        raise RuntimeError(f"Missing {args.data_dir}/ directory")
+
+    # One writer per tenant: refuse to run alongside the watch daemon
+    try:
+        lock = TenantWriterLock(faiss_store.base_dir, args.tenant)
+        lock.acquire()
+    except WriterLockHeld as e:
+        raise SystemExit(str(e))
+    model = tenant_model(args.tenant, EMBED_MODEL)
+    cache = cache_from_env(model)
+    with lock:
+        stats = asyncio.run(run_pipeline(
+            args.data_dir,
+            args.tenant,
+            parse_workers=args.parse_workers,
+            embed_concurrency=args.embed_concurrency,
+            convex_batch=args.convex_batch,
+            queue_size=args.queue_size,
+            force=args.force,
+            stream_threshold=int(args.stream_threshold_mb * 1e6),
+            batcher=make_embed_batcher(
+                max_items=args.embed_batch_items,
+                max_tokens=args.embed_batch_tokens,
+                concurrency=args.embed_concurrency,
+                rpm=args.embed_rpm,
+                tpm=args.embed_tpm,
+                cache=cache,
+                model=model,
+            ),
+            model=model,
+        ))
 
     print(f"\n{'='*50}")
     print(f"Ingestion complete!")
-    print(f"Total documents: {total_docs}")
-    print(f"FAISS indexes stored in ./faiss_data/{TENANT_ID}/<source>.index")
+    print(f"Total documents: {stats['faiss'].items + stats['stream'].items}")
+    print(f"Total chunks: {stats['faiss'].chunks + stats['stream'].chunks}")
+    if cache:
+        print(cache.summary())
+    print(f"FAISS indexes stored in ./faiss_data/{args.tenant}/<source>.index")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,253 @@
+"""
+Continuous ingestion: watch <data-dir>/<source>/ and incrementally ingest
+new, modified and deleted files as they change.
+
+Bursts of changes are debounced into one ingest_folder pipeline run over just
+the changed paths: new and modified files are ingested (touched but identical
+ones are skipped by the manifest) and deleted files and directories are
+retired. The first run, and any run after inotify dropped events, covers the
+whole data dir. Each run holds the
+tenant's writer lock, so it never writes the FAISS indexes at the same time
+as ingest_folder or the API's ingest worker; the API reloads an index as soon
+as its files change on disk. Each run reports the ingest lag: the time from the
+oldest change it picked up to that change being searchable.
+
+Usage:
+    python -m scripts.ingest_watch --tenant acme --debounce 2
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from typing import Dict, List, Set
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.embed_cache import cache_from_env
+from api.embeddings import tenant_model
+from api.writer_lock import TenantWriterLock
+from scripts.ingest_folder import (
+    DATA_DIR,
+    EMBED_CONCURRENCY,
+    STREAM_THRESHOLD_BYTES,
+    TENANT_ID,
+    EMBED_MODEL,
+    faiss_store,
+    iter_files,
+    make_embed_batcher,
+    run_pipeline,
+)
+
+# inotify is optional (Linux only): without it the data dir is polled
+try:
+    from inotify_simple import INotify, flags
+    HAS_INOTIFY = True
+except ImportError:
+    HAS_INOTIFY = False
+
+
+def _relevant(data_dir: str, path: str) -> bool:
+    """Files ingest_folder would look at: non-hidden, inside a source directory."""
+    rel = os.path.relpath(path, data_dir)
+    parts = rel.split(os.sep)
+    return len(parts) >= 2 and not parts[-1].startswith(".") and not rel.startswith("..")
+
+
+class InotifyWatcher:
+    """Recursive inotify watch over the data dir; new subdirectories are watched as they appear."""
+
+    MASK = (
+        flags.CREATE | flags.CLOSE_WRITE | flags.DELETE | flags.MOVED_FROM
+        | flags.MOVED_TO | flags.DELETE_SELF
+    ) if HAS_INOTIFY else 0
+
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self.inotify = INotify()
+        self.dirs: Dict[int, str] = {}
+        self._watch_tree(data_dir)
+
+    def _watch_tree(self, top: str):
+        for root, dirs, _ in os.walk(top):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            try:
+                self.dirs[self.inotify.add_watch(root, self.MASK)] = root
+            except OSError:
+                continue  # removed while walking
+
+    def wait(self, timeout: float) -> List[str]:
+        changed = []
+        for event in self.inotify.read(timeout=int(timeout * 1000)):
+            if event.mask & flags.Q_OVERFLOW:
+                # Events were dropped: treat it as "something changed"
+                changed.append(self.data_dir)
+                continue
+            parent = self.dirs.get(event.wd)
+            if parent is None:
+                continue
+            if event.mask & flags.IGNORED:
+                self.dirs.pop(event.wd, None)
+                continue
+            path = os.path.join(parent, event.name) if event.name else parent
+            if event.mask & flags.ISDIR:
+                if event.mask & (flags.CREATE | flags.MOVED_TO):
+                    # Files may already be inside (moved in, or written before the watch existed)
+                    self._watch_tree(path)
+                changed.append(path)
+            elif _relevant(self.data_dir, path):
+                changed.append(path)
+        return changed
+
+
+class PollingWatcher:
+    """Fallback when inotify is unavailable: diff a (size, mtime) snapshot every interval."""
+
+    def __init__(self, data_dir: str, interval: float):
+        self.data_dir = data_dir
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self) -> Dict[str, tuple]:
+        out = {}
+        for _, fp in iter_files(self.data_dir):
+            try:
+                st = os.stat(fp)
+            except FileNotFoundError:
+                continue
+            out[fp] = (st.st_size, st.st_mtime_ns)
+        return out
+
+    def wait(self, timeout: float) -> List[str]:
+        time.sleep(min(self.interval, timeout))
+        current = self._scan()
+        changed = [p for p, sig in current.items() if self.snapshot.get(p) != sig]
+        changed += [p for p in self.snapshot if p not in current]
+        self.snapshot = current
+        return changed
+
+
+class LagStats:
+    """Ingest lag per run, written to faiss_data/<tenant>/ingest_status.json for monitoring."""
+
+    def __init__(self, base_dir: str, tenant: str):
+        self.path = os.path.join(base_dir, tenant, "ingest_status.json")
+        self.runs = 0
+        self.lags: List[float] = []
+
+    def record(self, lag: float, run_seconds: float, changed: int):
+        self.runs += 1
+        self.lags = (self.lags + [lag])[-1000:]
+        ordered = sorted(self.lags)
+        status = {
+            "lastRunAt": time.time(),
+            "runs": self.runs,
+            "changedPaths": changed,
+            "lastLagSeconds": round(lag, 3),
+            "lastRunSeconds": round(run_seconds, 3),
+            "p50LagSeconds": round(ordered[len(ordered) // 2], 3),
+            "maxLagSeconds": round(ordered[-1], 3),
+        }
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(status, f)
+        os.replace(tmp, self.path)
+        return status
+
+
+def watch(args):
+    if HAS_INOTIFY and not args.poll:
+        watcher = InotifyWatcher(args.data_dir)
+        print(f"Watching {args.data_dir} (inotify), debounce {args.debounce}s")
+    else:
+        watcher = PollingWatcher(args.data_dir, args.poll_interval)
+        print(f"Watching {args.data_dir} (polling every {args.poll_interval}s), debounce {args.debounce}s")
+
+    model = tenant_model(args.tenant, EMBED_MODEL)
+    batcher = make_embed_batcher(
+        concurrency=args.embed_concurrency,
+        cache=cache_from_env(model),
+        model=model,
+    )
+    lag_stats = LagStats(faiss_store.base_dir, args.tenant)
+    lock = TenantWriterLock(faiss_store.base_dir, args.tenant)
+    # Catch up on whatever changed while the daemon was not running
+    pending: Dict[str, float] = {args.data_dir: time.monotonic()}
+    # Paths of a run in which some files failed (e.g. a parse or embedding
+    # error), tried again with the next burst
+    retry: Set[str] = set()
+    last_event = 0.0
+
+    while True:
+        now = time.monotonic()
+        oldest = min(pending.values()) if pending else None
+        quiet = now - last_event >= args.debounce
+        overdue = oldest is not None and now - oldest >= args.max_delay
+        if pending and (quiet or overdue):
+            batch, pending = pending, {}
+            t0 = time.monotonic()
+            try:
+                lock.acquire(timeout=args.max_delay)
+                with lock:
+                    stats = asyncio.run(run_pipeline(
+                        args.data_dir,
+                        args.tenant,
+                        parse_workers=args.parse_workers,
+                        embed_concurrency=args.embed_concurrency,
+                        convex_batch=args.convex_batch,
+                        queue_size=args.queue_size,
+                        batcher=batcher,
+                        stream_threshold=int(args.stream_threshold_mb * 1e6),
+                        model=model,
+                        paths=retry | set(batch),
+                    ))
+            except Exception as e:
+                # e.g. Convex unreachable or another writer busy: keep the changes pending and retry
+                print(f"[watch] ingest run failed, retrying in {args.max_delay:.0f}s: {e}", flush=True)
+                pending = batch
+                time.sleep(args.max_delay)
+                continue
+            retry = retry | set(batch) if any(st.failed for st in stats.values()) else set()
+            done = time.monotonic()
+            changed = len(batch)
+            status = lag_stats.record(done - oldest, done - t0, changed)
+            print(f"[watch] {changed} changed paths ingested: lag={status['lastLagSeconds']:.1f}s "
+                  f"(run {status['lastRunSeconds']:.1f}s) p50={status['p50LagSeconds']:.1f}s "
+                  f"max={status['maxLagSeconds']:.1f}s", flush=True)
+            continue
+
+        timeout = args.debounce - (now - last_event) if pending else args.poll_interval
+        for path in watcher.wait(max(timeout, 0.05)):
+            t = time.monotonic()
+            pending.setdefault(path, t)
+            last_event = t
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch <data-dir>/<source>/ and ingest changes continuously")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--tenant", default=TENANT_ID)
+    parser.add_argument("--debounce", type=float, default=2.0,
+                        help="Seconds without further changes before a burst is ingested")
+    parser.add_argument("--max-delay", type=float, default=30.0,
+                        help="Ingest anyway once the oldest pending change is this old")
+    parser.add_argument("--poll", action="store_true", help="Poll even if inotify is available")
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument("--parse-workers", type=int, default=2)
+    parser.add_argument("--embed-concurrency", type=int, default=EMBED_CONCURRENCY)
+    parser.add_argument("--convex-batch", type=int, default=64)
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument("--stream-threshold-mb", type=float, default=STREAM_THRESHOLD_BYTES / 1e6)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.data_dir):
+        raise RuntimeError(f"Missing {args.data_dir}/ directory")
+
+    try:
+        watch(args)
+    except KeyboardInterrupt:
+        print("\nStopped")
+
+
+if __name__ == "__main__":
+    main()
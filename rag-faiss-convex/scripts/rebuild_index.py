@@ -0,0 +1,152 @@
+"""
+Rebuild a tenant's FAISS indexes from the chunks stored in Convex.
+
+Use it to recover a lost faiss_data/ or to migrate to another embedding
+model or backend (see api/embeddings.py) without the original files. Chunks are read page by page
+(ingest:listChunksPage), the next page is fetched while the current one is
+embedded in parallel batches, and per-source indexes are built in a new
+generation directory next to the served one:
+
+    faiss_data/<tenant>/generations/<generation>/<source>.v1.index
+
+Only once every source is written is faiss_data/<tenant>/current.json
+atomically repointed at the new generation and model. Until then queries keep
+using the old indexes with the old model; the API picks up the swap on its
+next query. The tenant's writer lock is held for the whole rebuild, so
+incremental ingestion waits instead of writing to the generation being
+replaced. After a model migration, configure the new model for the tenant
+(TENANT_EMBED_MODELS, or EMBED_MODEL) for ingestion; writes with another
+model are refused.
+
+Usage:
+    python -m scripts.rebuild_index --tenant acme
+    python -m scripts.rebuild_index --tenant acme --model text-embedding-3-large
+    python -m scripts.rebuild_index --tenant acme --model onnx:/models/minilm
+"""
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+import faiss
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.embed_batcher import EmbeddingBatcher
+from api.embed_cache import cache_from_env
+from api.embeddings import canonical_spec, tenant_model
+from api.faiss_store import _normalize
+from api.writer_lock import TenantWriterLock, WriterLockHeld
+from scripts.ingest_folder import (
+    EMBED_CONCURRENCY,
+    EMBED_MODEL,
+    TENANT_ID,
+    convex_query,
+    faiss_store,
+    make_embed_batcher,
+)
+
+
+def iter_chunk_pages(tenant_id: str, page_size: int, source_key: Optional[str] = None) -> Iterator[List[dict]]:
+    """Pages of [{_id, sourceKey, text}] for a tenant, in index order."""
+    cursor = None
+    while True:
+        args = {"tenantId": tenant_id, "paginationOpts": {"numItems": page_size, "cursor": cursor}}
+        if source_key:
+            args["sourceKey"] = source_key
+        result = convex_query("ingest:listChunksPage", args)
+        if result["page"]:
+            yield result["page"]
+        if result["isDone"]:
+            return
+        cursor = result["continueCursor"]
+
+
+def _prefetch(pages: Iterator[List[dict]]) -> Iterator[List[dict]]:
+    """Fetch the next page in the background while the caller works on the current one."""
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pending = pool.submit(next, pages, None)
+        while True:
+            page = pending.result()
+            if page is None:
+                return
+            pending = pool.submit(next, pages, None)
+            yield page
+
+
+def rebuild(tenant_id: str, model: str, batcher: EmbeddingBatcher, page_size: int) -> Optional[dict]:
+    """Build and swap in a new generation; returns its {generation, model, dim}, or None if empty."""
+    generation = time.strftime("g%Y%m%d-%H%M%S")
+    indexes: Dict[str, faiss.Index] = {}
+    ids: Dict[str, List[str]] = {}
+    dim = None
+    total, t0 = 0, time.time()
+
+    for page in _prefetch(iter_chunk_pages(tenant_id, page_size)):
+        xb = _normalize(batcher.embed([c["text"] for c in page]))
+        if dim is None:
+            dim = xb.shape[1]
+        for source in {c["sourceKey"] for c in page}:
+            rows = [i for i, c in enumerate(page) if c["sourceKey"] == source]
+            if source not in indexes:
+                indexes[source] = faiss.IndexFlatIP(dim)
+                ids[source] = []
+            indexes[source].add(xb[rows])
+            ids[source].extend(page[i]["_id"] for i in rows)
+        total += len(page)
+        rate = total / max(time.time() - t0, 1e-9)
+        print(f"  {total} chunks embedded ({rate:.0f}/s)", flush=True)
+
+    if dim is None:
+        return None
+    for source, index in indexes.items():
+        faiss_store.write_generation_index(tenant_id, generation, source, index, ids[source])
+        print(f"  {source}: {index.ntotal} vectors")
+    faiss_store.swap_generation(tenant_id, generation, model, dim)
+    return {"generation": generation, "model": model, "dim": dim}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild a tenant's FAISS indexes from Convex")
+    parser.add_argument("--tenant", default=TENANT_ID)
+    parser.add_argument("--model", default=None,
+                        help="Embedding model spec for the new indexes (default: the tenant's configured model)")
+    parser.add_argument("--page-size", type=int, default=1000, help="Chunks read from Convex per query")
+    parser.add_argument("--embed-concurrency", type=int, default=EMBED_CONCURRENCY,
+                        help="Embedding requests in flight at once")
+    parser.add_argument("--keep", type=int, default=1,
+                        help="Previous generations kept after the swap (for rollback and in-flight queries)")
+    parser.add_argument("--lock-timeout", type=float, default=60.0,
+                        help="Seconds to wait for another writer to finish")
+    args = parser.parse_args()
+    configured = tenant_model(args.tenant, EMBED_MODEL)
+    args.model = canonical_spec(args.model or configured)
+
+    before = faiss_store.active_generation(args.tenant)
+    print(f"Rebuilding {args.tenant}: {before['model'] or configured} -> {args.model}")
+    cache = cache_from_env(args.model)
+    batcher = make_embed_batcher(concurrency=args.embed_concurrency, cache=cache, model=args.model)
+
+    try:
+        lock = TenantWriterLock(faiss_store.base_dir, args.tenant)
+        lock.acquire(timeout=args.lock_timeout)
+    except WriterLockHeld as e:
+        raise SystemExit(str(e))
+    with lock:
+        info = rebuild(args.tenant, args.model, batcher, args.page_size)
+        if info is None:
+            raise SystemExit(f"No chunks stored for tenant {args.tenant}; nothing to rebuild")
+        removed = faiss_store.prune_generations(args.tenant, keep=args.keep)
+
+    print(f"\nServing generation {info['generation']} ({info['model']}, dim {info['dim']})")
+    if removed:
+        print(f"Removed old generations: {', '.join(g or '(tenant dir)' for g in removed)}")
+    if cache:
+        print(cache.summary())
+    if args.model != configured:
+        print(f"Configure {args.model} for {args.tenant} (TENANT_EMBED_MODELS) for ingestion into the new indexes")
+
+
+if __name__ == "__main__":
+    main()
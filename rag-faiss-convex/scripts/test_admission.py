@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+
+from api.admission import Admission, Overloaded, TokenBucket
+
+
+def _wait_for(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_token_bucket_reservations():
+    bucket = TokenBucket(per_minute=60)
+    now = time.monotonic()
+    for _ in range(60):
+        assert bucket.wait_time(now) == 0.0
+        bucket.take()
+    # Empty: the next token is a second away, and later callers queue behind
+    assert bucket.wait_time(now) == pytest.approx(1.0)
+    bucket.take()
+    assert bucket.wait_time(now) == pytest.approx(2.0)
+    # Refills at the rate, never above capacity
+    assert bucket.wait_time(now + 2.0) == pytest.approx(0.0)
+    assert bucket.wait_time(now + 3600) == 0.0 and bucket.level == 60
+
+
+def test_freed_slots_go_round_robin():
+    adm = Admission("test", max_concurrency=1, tenant_concurrency=1, max_wait=5.0)
+    order, threads = [], []
+
+    def call(tenant):
+        with adm.slot(tenant, reject=False):
+            order.append(tenant)
+
+    with adm.slot("x"):
+        # A burst from tenant a, then one call from b, queued in that order
+        for tenant in ("a", "a", "a", "b"):
+            t = threading.Thread(target=call, args=(tenant,))
+            t.start()
+            threads.append(t)
+            _wait_for(lambda: adm._waiting == len(threads))
+    for t in threads:
+        t.join(5)
+    # b waits behind one of a's calls, not all of them
+    assert order == ["a", "b", "a", "a"]
+    assert adm.stats()["admitted"] == 5
+
+
+def test_tenant_limit_does_not_block_others():
+    adm = Admission("test", max_concurrency=4, tenant_concurrency=1, max_wait=0.01)
+    with adm.slot("a"):
+        with pytest.raises(Overloaded):
+            with adm.slot("a"):
+                pass
+        with adm.slot("b"):
+            pass
+    assert adm.rejected == 1
+
+
+def test_rejects_when_the_wait_is_too_long():
+    adm = Admission("test", max_concurrency=1, tenant_concurrency=1, max_wait=0.05)
+    with adm.slot("a"):
+        t0 = time.monotonic()
+        with pytest.raises(Overloaded) as exc:
+            with adm.slot("b"):
+                pass
+        assert exc.value.upstream == "test" and exc.value.retry_after > 0
+        # Turned away at once, not after waiting out max_wait
+        assert time.monotonic() - t0 < 0.05
+
+
+def test_rate_limit_rejects_or_waits():
+    adm = Admission("test", tenant_rpm=1, max_wait=0.05)
+    with adm.slot("a"):
+        pass
+    with pytest.raises(Overloaded) as exc:
+        with adm.slot("a"):
+            pass
+    assert exc.value.retry_after == pytest.approx(60, abs=1)
+    with adm.slot("b"):
+        pass
+
+
+def test_auth_overload_is_429(api):
+    main, convex, client = api
+
+    def overloaded(args):
+        raise Overloaded("auth", 2.5)
+
+    convex.handlers["users:get"] = overloaded
+    convex.handlers["users:currentUser"] = overloaded
+    r = client.get("/me", headers={"x-user-id": "alice"})
+    assert r.status_code == 429 and r.headers["Retry-After"] == "3"
+    r = client.get("/me", headers={"Authorization": "Bearer token"})
+    assert r.status_code == 429 and r.headers["Retry-After"] == "3"
+
+    convex.handlers["users:currentUser"] = lambda args: None
+    assert client.get("/me", headers={"Authorization": "Bearer token"}).status_code == 401
+
+
+def test_auth_calls_skip_the_shared_tenant_queue(monkeypatch):
+    from api import main
+
+    class Response:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"status": "success", "value": {"_id": "u"}}
+
+    monkeypatch.setattr(main.requests, "post", lambda *a, **kw: Response())
+    convex = Admission("convex", max_concurrency=8, tenant_concurrency=1, max_wait=0.01)
+    monkeypatch.setattr(main, "convex_admission", convex)
+    with convex.slot("-"):
+        # Another tenantless call is over the per-tenant limit...
+        with pytest.raises(Overloaded):
+            main.convex_call("query", "users:currentUser", {}, token="t")
+        # ...but authentication has its own pool
+        user = main.convex_call("query", "users:currentUser", {}, token="t", admission=main.auth_admission)
+        assert user == {"_id": "u"}
@@ -0,0 +1,72 @@
+"""
+/chat/batch: one failed or empty completion does not fail the others.
+/chat and /chat/batch: Convex calls after a paid completion are never rejected.
+"""
+
+from types import SimpleNamespace
+
+from api.admission import Overloaded
+
+
+class FakeChat:
+    """chat.completions.create answering by question: "fail" raises, "empty" has no content."""
+
+    def __init__(self):
+        self.completions = self
+        self.calls = 0
+
+    def create(self, model, messages):
+        self.calls += 1
+        question = messages[-1]["content"].rsplit("\n", 1)[-1]
+        if question == "fail":
+            raise RuntimeError("upstream error")
+        content = None if question == "empty" else f"answer to {question}"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+
+def test_failures_stay_per_message(api, monkeypatch):
+    main, convex, client = api
+    logged = []
+    convex.handlers["chunks:getMany"] = lambda args: []
+    convex.handlers["documents:getMany"] = lambda args: []
+
+    def add_many(args):
+        logged.extend(args["rows"])
+        return [f"log{i}" for i in range(len(args["rows"]))]
+
+    convex.handlers["logs:addMany"] = add_many
+    monkeypatch.setattr(main.oa, "chat", FakeChat())
+
+    r = client.post("/chat/batch", json={"messages": ["a", "fail", "empty", "b"]}, headers={"x-user-id": "alice"})
+    assert r.status_code == 200
+    results = r.json()["results"]
+    assert [res["answer"] for res in results] == ["answer to a", None, "", "answer to b"]
+    assert results[1]["error"] == "upstream error" and results[1]["logId"] is None
+    assert [res["logId"] for res in results if res["answer"] is not None] == ["log0", "log1", "log2"]
+    # Only answered messages are logged, with string answers
+    assert [row["message"] for row in logged] == ["a", "empty", "b"]
+    assert all(isinstance(row["answer"], str) for row in logged)
+
+
+def test_no_rejection_after_completion(api, monkeypatch):
+    main, convex, client = api
+    chat = FakeChat()
+    monkeypatch.setattr(main.oa, "chat", chat)
+    convex.handlers["chunks:getMany"] = lambda args: []
+    convex.handlers["documents:getMany"] = lambda args: []
+    convex.handlers["logs:add"] = lambda args: "log"
+    convex.handlers["logs:addMany"] = lambda args: [f"log{i}" for i in range(len(args["rows"]))]
+
+    def overloaded_convex(kind, path, args, token=None, reject=True, admission=None):
+        # Convex is overloaded from the first completion on: only calls that wait get through
+        if reject and chat.calls:
+            raise Overloaded("convex", 1.0)
+        return convex(kind, path, args, token=token, reject=reject, admission=admission)
+
+    monkeypatch.setattr(main, "convex_call", overloaded_convex)
+    headers = {"x-user-id": "alice"}
+    r = client.post("/chat", json={"message": "a"}, headers=headers)
+    assert r.status_code == 200 and r.json()["logId"] == "log" and chat.calls == 1
+    chat.calls = 0
+    r = client.post("/chat/batch", json={"messages": ["b", "c"]}, headers=headers)
+    assert r.status_code == 200 and [res["logId"] for res in r.json()["results"]] == ["log0", "log1"]
@@ -0,0 +1,71 @@
+"""Chunker: token-bounded chunks with exact offsets, streamed or whole, and UTF-16 spans."""
+
+import random
+
+from api.chunker import SEGMENT_SEPARATOR, chunk_spans, codepoint_offsets, iter_chunks, utf16_length, utf16_spans
+from api.tokens import count_tokens
+
+WORDS = "alpha beta gamma delta epsilon zeta eta theta iota kappa".split()
+
+
+def _text(paragraphs: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    paras = []
+    for _ in range(paragraphs):
+        sentences = [
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 14))).capitalize() + "."
+            for _ in range(rng.randint(1, 8))
+        ]
+        paras.append(" ".join(sentences))
+    return "\n\n".join(paras)
+
+
+def test_spans_slice_the_text_within_budget():
+    text = _text(60)
+    spans = chunk_spans(text, max_tokens=80, overlap_tokens=20)
+    assert len(spans) > 5
+    for s, e in spans:
+        chunk = text[s:e]
+        assert chunk == chunk.strip()
+        assert count_tokens(chunk) <= 80
+    # In order, overlapping at most, and covering the whole text
+    assert spans[0][0] == 0 and spans[-1][1] == len(text)
+    for (s1, e1), (s2, e2) in zip(spans, spans[1:]):
+        assert s1 < s2 <= e1 + len(SEGMENT_SEPARATOR) and e1 < e2
+
+
+def test_long_paragraph_is_split_by_sentences_and_runs():
+    sentence = "word " * 500
+    text = "Short intro.\n\n" + sentence.strip() + ".\n\nShort outro."
+    for s, e in chunk_spans(text, max_tokens=50, overlap_tokens=0):
+        assert count_tokens(text[s:e]) <= 50
+
+
+def test_streamed_segments_match_joined_text():
+    segments = [_text(6, seed=i) for i in range(8)]
+    joined = SEGMENT_SEPARATOR.join(segments)
+    streamed = list(iter_chunks(iter(segments), max_tokens=60, overlap_tokens=15))
+    assert [(s, e) for s, e, _ in streamed] == chunk_spans(joined, max_tokens=60, overlap_tokens=15)
+    for s, e, chunk in streamed:
+        assert chunk == joined[s:e]
+
+
+def _js_offset(text: str, i: int) -> int:
+    return len(text[:i].encode("utf-16-le")) // 2
+
+
+def test_utf16_spans_match_javascript_offsets():
+    text = "Deploy 🚀 notes\n\nCafé ünïcode and 𝔘𝔫𝔦 text 😀😀.\n\n" + _text(10)
+    spans = chunk_spans(text, max_tokens=20, overlap_tokens=5)
+    assert utf16_spans(text, spans) == [(_js_offset(text, s), _js_offset(text, e)) for s, e in spans]
+    # BMP-only and ASCII text need no conversion
+    assert utf16_spans("Café", [(0, 4)]) == [(0, 4)]
+
+
+def test_codepoint_offsets_invert_utf16_spans():
+    text = "😀a𝔘𝔫b 🚀\n\nCafé ü" + _text(3) + "😀"
+    assert utf16_length(text) == _js_offset(text, len(text))
+    points = list(range(len(text) + 1))
+    units = [_js_offset(text, p) for p in points]
+    assert codepoint_offsets(text, units) == points
+    assert codepoint_offsets("plain", [0, 3, 5]) == [0, 3, 5]
@@ -0,0 +1,63 @@
+from api.chunker import sentence_spans
+from api.context import build_context, trim_to_query
+from api.tokens import count_tokens
+
+FILLER = "Unrelated filler about the weather and lunch menus goes here. " * 6
+
+
+def _chunk(doc: str, index: int, text: str, source: str = "hr") -> dict:
+    return {"docId": doc, "chunkIndex": index, "sourceKey": source, "text": text}
+
+
+def _blocks(context: str):
+    return [b.split("\n", 1)[1] for b in context.split("\n\n")] if context else []
+
+
+def test_sentence_spans():
+    text = "First one. Second?  Third line\nFourth!"
+    assert [text[s:e] for s, e in sentence_spans(text)] == ["First one.", "Second?", "Third line", "Fourth!"]
+    assert [text[s:e] for s, e in sentence_spans(text, 11, 30)] == ["Second?", "Third line"]
+
+
+def test_context_stays_within_budget():
+    chunks = [_chunk(f"d{i}", 0, f"Chunk {i} on vacation policy. " + FILLER) for i in range(20)]
+    for budget in (60, 200, 500):
+        context, stats = build_context("vacation policy", chunks, budget=budget, chunk_tokens=400)
+        assert stats["contextTokens"] <= budget
+        assert count_tokens(context) <= budget
+        assert stats["chunks"] == len(_blocks(context)) > 0
+
+
+def test_trimming_keeps_whole_matching_sentences():
+    text = FILLER + "Parental leave lasts sixteen weeks. " + FILLER + "Leave requests go to HR."
+    trimmed = trim_to_query(text, {"parental", "leave"}, {"parental": 2.0, "leave": 1.0}, max_tokens=20)
+    sentences = {text[s:e] for s, e in sentence_spans(text)}
+    kept = [part.strip() for part in trimmed.split(" ... ")]
+    assert "Parental leave lasts sixteen weeks." in kept
+    # Only whole sentences, in their original order
+    assert all(part in sentences for part in kept)
+    assert [text.index(p) for p in kept] == sorted(text.index(p) for p in kept)
+    assert count_tokens(trimmed) <= 20
+
+
+def test_kept_chunks_stay_in_rank_order():
+    long = "Travel budget approvals need a director. " + FILLER * 3
+    chunks = [
+        _chunk("a", 0, "Best: travel budget rules apply to everyone."),
+        _chunk("b", 0, long),
+        _chunk("c", 0, "Third: travel is booked through the portal."),
+        _chunk("d", 0, FILLER * 10),
+    ]
+    context, stats = build_context("travel budget", chunks, budget=150, chunk_tokens=60)
+    blocks = _blocks(context)
+    assert blocks[0] == chunks[0]["text"] and blocks[2] == chunks[2]["text"]
+    # The long chunk keeps its place, trimmed to its best sentence
+    assert blocks[1].startswith("Travel budget approvals need a director.")
+    assert stats["trimmed"] >= 1 and stats["contextTokens"] <= 150
+
+
+def test_overlap_with_adjacent_chunk_is_left_out():
+    shared = "This sentence is shared by both adjacent chunks of the doc."
+    chunks = [_chunk("a", 0, "Opening words. " + shared), _chunk("a", 1, shared + " Closing words.")]
+    context, stats = build_context("words", chunks, budget=500)
+    assert context.count(shared) == 1 and stats["overlapChars"] == len(shared)
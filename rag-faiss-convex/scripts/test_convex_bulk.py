@@ -0,0 +1,117 @@
+import itertools
+
+import pytest
+
+from api.convex_bulk import ConvexBulkWriter
+
+
+class StatusError(Exception):
+    """A Convex HTTP error, like requests' HTTPError carrying a response status."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+class FakeConvex:
+    """ingest:addDocuments in memory, idempotent per ingestKey; batches holding a `bad` title fail with `error`."""
+
+    def __init__(self, bad=(), error=None):
+        self.ids = itertools.count()
+        self.by_key = {}
+        self.calls = []
+        self.bad = set(bad)
+        self.error = error
+
+    def __call__(self, path: str, args: dict):
+        assert path == "ingest:addDocuments"
+        docs = args["documents"]
+        self.calls.append([d["title"] for d in docs])
+        if self.error is not None and (not self.bad or self.bad & {d["title"] for d in docs}):
+            raise self.error
+        out = []
+        for doc in docs:
+            key = (args["tenantId"], doc["ingestKey"])
+            if key not in self.by_key:
+                self.by_key[key] = {
+                    "docId": f"d{next(self.ids)}",
+                    "chunkIds": [f"c{next(self.ids)}" for _ in doc["chunks"]],
+                }
+            out.append(self.by_key[key])
+        return out
+
+
+def _doc(title: str, chunks: int = 1, text: str = "text"):
+    return {
+        "sourceKey": "hr",
+        "title": title,
+        "rawText": text,
+        "chunks": [{"chunkIndex": i, "text": text} for i in range(chunks)],
+    }
+
+
+def _writer(convex, **kw):
+    return ConvexBulkWriter(convex, backoff=0, **kw)
+
+
+def test_pack_respects_limits():
+    docs = [_doc(f"d{i}", chunks=3) for i in range(10)]
+    assert _writer(None, max_docs=4).pack(docs) == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    # 4 rows per document (itself and its chunks)
+    assert _writer(None, max_rows=10).pack(docs) == [[0, 1], [2, 3], [4, 5], [6, 7], [8, 9]]
+    big = [_doc(f"d{i}", text="x" * 1000) for i in range(5)]
+    assert _writer(None, max_bytes=4500).pack(big) == [[0, 1], [2, 3], [4]]
+    # A document over the limits still gets a batch of its own
+    assert _writer(None, max_bytes=10).pack(big[:2]) == [[0], [1]]
+
+
+def test_ingest_key_makes_writes_idempotent():
+    convex = FakeConvex()
+    writer = _writer(convex)
+    first = writer.add_documents("t", [_doc("a"), _doc("b")])
+    again = writer.add_documents("t", [_doc("b"), _doc("a"), _doc("c")])
+    assert again[:2] == [first[1], first[0]]
+    assert len(convex.by_key) == 3
+    # The same content for another tenant is another document
+    assert writer.add_documents("u", [_doc("a")])[0] != first[0]
+
+
+def test_rejected_document_is_isolated_and_the_rest_written():
+    convex = FakeConvex(bad={"d2"}, error=StatusError(400))
+    writer = _writer(convex)
+    docs = [_doc(f"d{i}") for i in range(8)]
+    with pytest.raises(StatusError):
+        writer.add_documents("t", docs)
+    # Both halves were written, down to the bad document, with no retries
+    assert sorted(k for _, k in convex.by_key) == sorted(d["ingestKey"] for d in docs if d["title"] != "d2")
+    assert writer.stats["retries"] == 0 and writer.stats["splits"] == 3
+
+    # A re-run (the bad document fixed) returns the existing ids
+    written = dict(convex.by_key)
+    convex.error = None
+    out = writer.add_documents("t", docs)
+    assert [out[i] for i in (0, 1, 3)] == [written[("t", docs[i]["ingestKey"])] for i in (0, 1, 3)]
+
+
+@pytest.mark.parametrize("status", [401, 403])
+def test_auth_errors_fail_fast(status):
+    convex = FakeConvex(error=StatusError(status))
+    with pytest.raises(StatusError):
+        _writer(convex).add_documents("t", [_doc(f"d{i}") for i in range(8)])
+    assert len(convex.calls) == 1
+
+
+def test_outages_are_retried_but_not_split():
+    convex = FakeConvex(error=StatusError(503))
+    writer = _writer(convex, retries=2)
+    with pytest.raises(StatusError):
+        writer.add_documents("t", [_doc(f"d{i}") for i in range(8)])
+    assert len(convex.calls) == 3 and writer.stats["splits"] == 0
+
+
+def test_attempts_per_batch_are_capped():
+    docs = [_doc(f"d{i}") for i in range(64)]
+    convex = FakeConvex(bad={d["title"] for d in docs}, error=StatusError(400))
+    with pytest.raises(StatusError):
+        _writer(convex, max_attempts=8).add_documents("t", docs)
+    assert len(convex.calls) <= 8
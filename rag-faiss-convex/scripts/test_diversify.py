@@ -0,0 +1,43 @@
+import numpy as np
+
+from api.diversify import MMR_LAMBDA, mmr
+
+
+def _pool():
+    """Ten chunks: 0-4 from one document (near-identical), 5-9 from five others, scores descending."""
+    rng = np.random.default_rng(0)
+    doc = rng.standard_normal(8)
+    vectors = np.stack(
+        [doc + 0.01 * rng.standard_normal(8) for _ in range(5)] + [rng.standard_normal(8) for _ in range(5)]
+    ).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = [0.9 - 0.01 * i for i in range(10)]
+    return scores, vectors
+
+
+def test_mmr_off_by_default():
+    scores, vectors = _pool()
+    assert MMR_LAMBDA == 1.0
+    assert mmr(scores, vectors, k=4) == [0, 1, 2, 3]
+
+
+def test_mmr_spreads_picks_over_documents():
+    scores, vectors = _pool()
+    picked = mmr(scores, vectors, k=4, lam=0.5)
+    assert picked[0] == 0
+    assert sum(1 for i in picked if i < 5) == 1
+
+
+def test_pick_returns_score_order(api, monkeypatch):
+    main, _, _ = api
+    scores, vectors = _pool()
+    hits = [(f"c{i}", s, "hr") for i, s in enumerate(scores)]
+    assert [h[0] for h in main._pick(hits, vectors)] == [f"c{i}" for i in range(8)]
+
+    monkeypatch.setattr(main, "MMR_LAMBDA", 0.5)
+    monkeypatch.setattr(main, "CHAT_CANDIDATES", 40)
+    picked = main._pick(hits, vectors)
+    assert len(picked) == 8
+    # Diversified, but packed best first
+    assert [h[1] for h in picked] == sorted((h[1] for h in picked), reverse=True)
+    assert picked != hits[:8]
@@ -0,0 +1,83 @@
+"""/documents/{id}: UTF-16 ranges, ETag revalidation and access checks."""
+
+import pytest
+
+TEXT = "Intro 🚀 line.\n\nSecond 😀 part of the text.\n\n" + "Filler sentence. " * 200
+
+
+def _js(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+@pytest.fixture
+def docs(api, monkeypatch):
+    main, convex, client = api
+    monkeypatch.setattr(main, "documents_cache", type(main.documents_cache)(64))
+    monkeypatch.setattr(main, "document_bodies", type(main.document_bodies)(64))
+    store = {
+        "d1": {"_id": "d1", "title": "Doc", "sourceKey": "hr", "rawText": TEXT, "ingestKey": "v1"},
+    }
+    second = TEXT.index("Second")
+    convex.handlers["documents:get"] = lambda args: store.get(args["id"])
+    convex.handlers["chunks:getRange"] = lambda args: [
+        {"start": 0, "end": _js(TEXT[:second])},
+        {"start": _js(TEXT[:second]), "end": _js(TEXT[:TEXT.index("Filler")])},
+    ][max(0, args["from"]):args["to"] + 1]
+    return main, convex, client, store
+
+
+def _get(client, path, user="alice", **headers):
+    return client.get(path, headers={"x-user-id": user, **headers})
+
+
+def test_utf16_ranges(docs):
+    _, _, client, _ = docs
+    second = TEXT.index("Second")
+    lo, hi = _js(TEXT[:second]), _js(TEXT[:second + 8])
+    body = _get(client, f"/documents/d1?start={lo}&end={hi}").json()
+    assert body["rawText"] == "Second 😀"
+    assert (body["start"], body["end"], body["length"]) == (lo, hi, _js(TEXT))
+
+    body = _get(client, "/documents/d1?chunk=1&window=0").json()
+    assert body["rawText"] == TEXT[second:TEXT.index("Filler")]
+    # An end past the text is clamped
+    body = _get(client, f"/documents/d1?start={lo}&end=999999").json()
+    assert body["rawText"] == TEXT[second:] and body["end"] == body["length"]
+    assert _get(client, "/documents/d1?start=5&end=2").status_code == 400
+    assert _get(client, "/documents/d1?chunk=0&start=0").status_code == 400
+
+
+def test_etag_revalidation(docs, monkeypatch):
+    main, _, client, store = docs
+    first = _get(client, "/documents/d1?start=0&end=10")
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    again = _get(client, "/documents/d1?start=0&end=10", **{"If-None-Match": etag})
+    assert again.status_code == 304 and again.headers["ETag"] == etag and not again.content
+    # Another range is another representation
+    other = _get(client, "/documents/d1?start=0&end=11", **{"If-None-Match": etag})
+    assert other.status_code == 200 and other.headers["ETag"] != etag
+
+    # A new content version changes the tag
+    store["d1"] = {**store["d1"], "rawText": "New text", "ingestKey": "v2"}
+    monkeypatch.setattr(main, "documents_cache", type(main.documents_cache)(64))
+    changed = _get(client, "/documents/d1?start=0&end=10", **{"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.json()["rawText"] == "New text"
+
+
+def test_access_is_checked_before_304(docs):
+    _, _, client, _ = docs
+    etag = _get(client, "/documents/d1").headers["ETag"]
+    assert _get(client, "/documents/d1", user="bob", **{"If-None-Match": etag}).status_code == 403
+    assert _get(client, "/documents/nope").status_code == 404
+
+
+def test_compressed_when_accepted(docs):
+    _, _, client, _ = docs
+    r = client.get("/documents/d1", headers={"x-user-id": "alice", "Accept-Encoding": "gzip"})
+    assert r.headers["Content-Encoding"] == "gzip"
+    # The test client decodes the body; it must match the uncompressed one
+    assert r.json()["rawText"] == TEXT
+    raw = client.get("/documents/d1", headers={"x-user-id": "alice", "Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in raw.headers and raw.json() == r.json()
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from api.embed_batcher import EmbeddingBatcher
+from api.embed_cache import EmbeddingCache
+
+
+class StatusError(Exception):
+    """An upstream error carrying an HTTP status, like openai's APIStatusError."""
+
+    def __init__(self, status_code: int, code=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.code = code
+
+
+class FakeEmbed:
+    """Embeds each text as [len, 1, 0, 0]; texts in `bad` fail the request with `error`."""
+
+    def __init__(self, bad=(), error=None):
+        self.calls = []
+        self.bad = set(bad)
+        self.error = error
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        if self.error is not None and (not self.bad or self.bad & set(texts)):
+            raise self.error
+        return np.array([[len(t), 1, 0, 0] for t in texts], dtype=np.float32)
+
+
+def _batcher(fn, **kw):
+    return EmbeddingBatcher(fn, backoff=0, **kw)
+
+
+def test_documents_are_coalesced_into_one_request():
+    fn = FakeEmbed()
+    out = _batcher(fn).embed_documents([["alpha", "be"], ["be", "gamma!"], []])
+    # One request, each distinct text once
+    assert fn.calls == [["alpha", "be", "gamma!"]]
+    assert [[v[0] for v in doc] for doc in out] == [[5, 2], [2, 6], []]
+
+
+def test_requests_stay_within_item_and_token_caps():
+    texts = [f"word{i} " * 10 for i in range(12)]
+    fn = FakeEmbed()
+    batcher = _batcher(fn, max_items=5, max_tokens=60)
+    counts = [20] * 12
+    assert batcher.pack(counts) == [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9, 10, 11]]
+    assert _batcher(fn, max_items=5).pack(counts) == [[0, 1, 2, 3, 4], [5, 6, 7, 8, 9], [10, 11]]
+    batcher.embed(texts)
+    assert sorted(t for call in fn.calls for t in call) == sorted(texts)
+    assert all(len(call) <= 5 for call in fn.calls) and len(fn.calls) > 1
+
+
+def test_cache_serves_hits_and_sends_misses(tmp_path):
+    fn = FakeEmbed()
+    batcher = _batcher(fn, cache=EmbeddingCache(str(tmp_path), "fake"))
+    batcher.embed(["one", "three"])
+    out = batcher.embed(["three", "five!", "one"])
+    assert fn.calls == [["one", "three"], ["five!"]]
+    assert [v[0] for v in out] == [5, 5, 3]
+    assert batcher.embed(["one", "five!"]) and len(fn.calls) == 2
+
+
+def test_rejected_input_is_isolated(tmp_path):
+    fn = FakeEmbed(bad={"bad"}, error=StatusError(400))
+    batcher = _batcher(fn, cache=EmbeddingCache(str(tmp_path), "fake"))
+    texts = [f"t{i}" for i in range(7)] + ["bad"]
+    with pytest.raises(StatusError):
+        batcher.embed(texts)
+    # Halved down to the bad text: a handful of calls, no retries of the same input
+    assert len(fn.calls) == 7 and batcher.stats["retries"] == 0
+    # Everything else was cached, so a re-run only sends the bad text
+    fn.calls.clear()
+    with pytest.raises(StatusError):
+        batcher.embed(texts)
+    assert fn.calls == [["bad"]]
+
+
+@pytest.mark.parametrize("error", [StatusError(401), StatusError(403), StatusError(429, "insufficient_quota")])
+def test_auth_and_quota_errors_fail_fast(error):
+    fn = FakeEmbed(error=error)
+    with pytest.raises(StatusError):
+        _batcher(fn).embed([f"t{i}" for i in range(64)])
+    assert len(fn.calls) == 1
+
+
+def test_outages_are_retried_but_not_split():
+    fn = FakeEmbed(error=StatusError(503))
+    batcher = _batcher(fn, retries=2)
+    with pytest.raises(StatusError):
+        batcher.embed([f"t{i}" for i in range(64)])
+    assert len(fn.calls) == 3 and batcher.stats["splits"] == 0
+
+
+def test_attempts_per_request_are_capped():
+    texts = [f"t{i}" for i in range(64)]
+    fn = FakeEmbed(bad=set(texts), error=StatusError(400))
+    with pytest.raises(StatusError):
+        _batcher(fn, max_attempts=8).embed(texts)
+    assert len(fn.calls) <= 8
@@ -0,0 +1,90 @@
+"""EmbeddingCache: persisted index, reopening and compaction shared between processes."""
+
+import numpy as np
+
+from api import embed_cache
+from api.embed_cache import EmbeddingCache
+
+
+def _vectors(n: int, dim: int = 8, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def test_round_trip_and_reopen(tmp_path):
+    texts = [f"chunk {i}" for i in range(10)]
+    vecs = _vectors(10)
+    cache = EmbeddingCache(str(tmp_path), "m")
+    cache.put_many(texts, vecs)
+
+    reopened = EmbeddingCache(str(tmp_path), "m")
+    assert reopened.dim == 8
+    found = reopened.get_many(texts + ["never cached"])
+    assert found[-1] is None
+    np.testing.assert_array_equal(np.stack(found[:-1]), vecs)
+    assert (reopened.hits, reopened.misses) == (10, 1)
+
+
+def test_index_is_persisted_and_tail_stays_small(tmp_path, monkeypatch):
+    monkeypatch.setattr(embed_cache, "INDEX_TAIL_RECORDS", 4)
+    texts = [f"chunk {i}" for i in range(50)]
+    vecs = _vectors(50)
+    cache = EmbeddingCache(str(tmp_path), "m")
+    for i in range(0, 50, 5):
+        cache.put_many(texts[i:i + 5], vecs[i:i + 5])
+
+    reopened = EmbeddingCache(str(tmp_path), "m")
+    # Opening maps the index instead of reading every record into a dict
+    assert reopened._keys is not None
+    assert len(reopened._tail) <= 4
+    np.testing.assert_array_equal(np.stack(reopened.get_many(texts)), vecs)
+
+
+def test_corrupt_or_stale_index_is_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.setattr(embed_cache, "INDEX_TAIL_RECORDS", 4)
+    texts = [f"chunk {i}" for i in range(20)]
+    vecs = _vectors(20)
+    cache = EmbeddingCache(str(tmp_path), "m")
+    cache.put_many(texts, vecs)
+    with open(cache.index_path, "r+b") as f:
+        f.seek(40)
+        f.write(b"\xff" * 64)
+
+    # Garbage entries point at records whose digests don't match: misses, not wrong vectors
+    found = EmbeddingCache(str(tmp_path), "m").get_many(texts)
+    for got, want in zip(found, vecs):
+        assert got is None or np.array_equal(got, want)
+
+    with open(cache.index_path, "wb") as f:
+        f.write(b"not an index")
+    np.testing.assert_array_equal(np.stack(EmbeddingCache(str(tmp_path), "m").get_many(texts)), vecs)
+
+
+def test_put_is_not_lost_when_another_instance_compacts(tmp_path):
+    dim = 8
+    record = embed_cache._record_dtype(dim).itemsize
+    a = EmbeddingCache(str(tmp_path), "m", dim=dim, max_bytes=record * 20)
+    b = EmbeddingCache(str(tmp_path), "m", dim=dim, max_bytes=record * 20)
+
+    a.put_many([f"a{i}" for i in range(25)], _vectors(25, seed=1))
+    assert a._count <= 20  # compacted: the data file was replaced
+
+    # b still maps the old file; its append must land in the new one
+    b_vecs = _vectors(3, seed=2)
+    b.put_many(["b0", "b1", "b2"], b_vecs)
+
+    fresh = EmbeddingCache(str(tmp_path), "m")
+    np.testing.assert_array_equal(np.stack(fresh.get_many(["b0", "b1", "b2"])), b_vecs)
+    assert fresh._count == a._count + 3
+
+
+def test_compaction_keeps_recently_used(tmp_path):
+    dim = 8
+    record = embed_cache._record_dtype(dim).itemsize
+    cache = EmbeddingCache(str(tmp_path), "m", dim=dim, max_bytes=record * 10)
+    cache.put_many([f"old{i}" for i in range(5)], _vectors(5, seed=3))
+    cache._mm["atime"][:] = 1  # long ago
+    cache.put_many([f"new{i}" for i in range(6)], _vectors(6, seed=4))
+
+    found = EmbeddingCache(str(tmp_path), "m").get_many([f"new{i}" for i in range(6)])
+    assert all(v is not None for v in found)
+    assert cache._count == 8
@@ -0,0 +1,70 @@
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+
+from api.embeddings import (
+    LocalModelProvider,
+    canonical_spec,
+    create_embeddings,
+    decode_embeddings,
+    get_provider,
+    parse_spec,
+)
+
+# Little-endian float32 [1, -2.5, 0, 0.25] and [0.5, 3, -1, 0.001], as the API sends them
+BASE64_ROWS = ["AACAPwAAIMAAAAAAAACAPg==", "AAAAPwAAQEAAAIC/bxKDOg=="]
+FLOAT_ROWS = [[1.0, -2.5, 0.0, 0.25], [0.5, 3.0, -1.0, 0.001]]
+
+
+def test_specs():
+    assert parse_spec("text-embedding-3-small") == ("openai", "text-embedding-3-small")
+    assert parse_spec("onnx:/models/minilm") == ("onnx", "/models/minilm")
+    # An unknown prefix is part of an API model's name
+    assert parse_spec("org:model") == ("openai", "org:model")
+    assert canonical_spec("openai:text-embedding-3-small") == "text-embedding-3-small"
+
+
+def test_hashing_provider_is_shared_and_deterministic():
+    provider = get_provider("hashing:16")
+    assert get_provider("hashing:16") is provider
+    a, b = provider.embed(["payroll policy", "payroll policy"])
+    assert a.shape == (16,) and np.array_equal(a, b)
+
+
+def test_local_provider_starts_on_first_embed():
+    threads = threading.active_count()
+    provider = LocalModelProvider("onnx:/nowhere", "onnx", "/nowhere", workers=1)
+    # No worker processes or dispatch thread until something is embedded
+    assert provider._pool is None and threading.active_count() == threads
+    assert provider.embed([]).shape == (0, 0) and provider._pool is None
+    provider.close()
+
+
+def test_decode_base64_embeddings():
+    decoded = decode_embeddings(BASE64_ROWS)
+    assert decoded.dtype == np.float32 and decoded.shape == (2, 4)
+    # Bit for bit what the float-list path gives
+    assert np.array_equal(decoded, decode_embeddings(FLOAT_ROWS))
+    assert np.array_equal(decoded, np.array(FLOAT_ROWS, dtype=np.float32))
+    # Writable, so the store can normalize it in place
+    decoded[0, 0] = 2.0
+    assert decode_embeddings([]).shape == (0, 0)
+
+
+def test_create_embeddings_asks_for_base64():
+    requests = []
+
+    class Client:
+        def __init__(self, rows):
+            self.embeddings = self
+            self.rows = rows
+
+        def create(self, **kwargs):
+            requests.append(kwargs)
+            return SimpleNamespace(data=[SimpleNamespace(embedding=row) for row in self.rows])
+
+    out = create_embeddings(Client(BASE64_ROWS), "m", ["a", "b"])
+    assert requests[0]["encoding_format"] == "base64"
+    # A server that ignores encoding_format and sends float lists decodes the same
+    assert np.array_equal(out, create_embeddings(Client(FLOAT_ROWS), "m", ["a", "b"]))
@@ -0,0 +1,143 @@
+import os
+
+import faiss
+import numpy as np
+
+from api.faiss_store import FaissPerSourceStore
+from api.source_summary import SourceSummary
+
+
+def _vec(*xs):
+    return np.array(xs, dtype=np.float32)
+
+
+def _duplicated_store(tmp_path):
+    """Source "a" holds three near-copies of one vector, "b" two distinct vectors below them."""
+    store = FaissPerSourceStore(str(tmp_path), dedupe_threshold=None)
+    store.add("t", "a", np.stack([_vec(1, 0.01 * i, 0, 0) for i in range(3)]), ["a1", "a2", "a3"])
+    store.add("t", "b", np.stack([_vec(1, 1, 0, 0), _vec(1, 0, 1, 0.5)]), ["b1", "b2"])
+    return store
+
+
+def test_collapse_before_limit(tmp_path):
+    store = _duplicated_store(tmp_path)
+    q = [1, 0, 0, 0]
+    hits = store.search("t", ["a", "b"], q, top_k_per_source=8, collapse=0.98, limit=3)
+    # The copies collapse to one hit and the page is still filled from "b"
+    assert [h[0] for h in hits] == ["a1", "b1", "b2"]
+
+    hits, vectors = store.search_with_vectors("t", ["a", "b"], q, top_k_per_source=8, collapse=0.98, limit=2)
+    assert [h[0] for h in hits] == ["a1", "b1"] and vectors.shape == (2, 4)
+
+    [batched] = store.search_batch("t", ["a", "b"], [q], top_k_per_source=8, collapse=0.98, limit=3)
+    assert [h[0] for h in batched] == ["a1", "b1", "b2"]
+
+
+def test_collapsed_pages_are_prefixes(tmp_path):
+    store = _duplicated_store(tmp_path)
+    q = [1, 0, 0, 0]
+    full = store.search("t", ["a", "b"], q, top_k_per_source=8, collapse=0.98)
+    for limit in range(1, len(full) + 2):
+        page = store.search("t", ["a", "b"], q, top_k_per_source=8, collapse=0.98, limit=limit)
+        assert page == full[:limit]
+
+
+def test_publish_writes_versions_and_prunes(tmp_path):
+    store = FaissPerSourceStore(str(tmp_path), dedupe_threshold=None)
+    for i in range(5):
+        store.add("t", "a", _vec(1, i, 0, 0)[None], [f"c{i}"])
+    d = store._dir("t")
+    with open(os.path.join(d, "a.current")) as f:
+        assert f.read() == "5"
+    kept = sorted(n for n in os.listdir(d) if n.endswith(".ids.json"))
+    assert kept == ["a.v3.ids.json", "a.v4.ids.json", "a.v5.ids.json"]
+
+    # Another process (a fresh store) loads the published version
+    reader = FaissPerSourceStore(str(tmp_path), dedupe_threshold=None)
+    assert reader.contains("t", "a", ["c0", "c4", "c9"]) == {"c0", "c4"}
+    store.remove("t", "a", ["c0"])
+    assert reader.contains("t", "a", ["c0", "c4"]) == {"c4"}
+
+
+def test_remove_promotes_alias_heir(tmp_path):
+    store = FaissPerSourceStore(str(tmp_path), dedupe_threshold=0.98)
+    assert store.add("t", "a", np.stack([_vec(1, 0, 0, 0)] * 3), ["x", "y", "z"]) == 2
+
+    assert store.remove("t", "a", ["x"]) == 1
+    # The vector stays, indexed under the first alias; the rest alias it
+    assert store.contains("t", "a", ["x", "y", "z"]) == {"y", "z"}
+    assert [h[0] for h in store.search("t", ["a"], [1, 0, 0, 0])] == ["y"]
+    assert set(store.reconstruct("t", "a", ["z"])) == {"z"}
+
+    # Survives a reload from disk
+    reader = FaissPerSourceStore(str(tmp_path), dedupe_threshold=0.98)
+    assert reader.contains("t", "a", ["x", "y", "z"]) == {"y", "z"}
+
+    assert store.remove("t", "a", ["y", "z"]) == 2
+    assert store.contains("t", "a", ["y", "z"]) == set()
+    assert store.search("t", ["a"], [1, 0, 0, 0]) == []
+
+
+def test_positions_follow_removals(tmp_path):
+    store = FaissPerSourceStore(str(tmp_path), dedupe_threshold=None)
+    vecs = np.eye(6, dtype=np.float32)
+    store.add("t", "a", vecs[:3], ["c0", "c1", "c2"])
+    store.add("t", "a", vecs[3:], ["c3", "c4", "c5"])
+    assert store.remove("t", "a", ["c1", "c3", "nope"]) == 2
+    # Later vectors moved down; each id still maps to its own vector
+    got = store.reconstruct("t", "a", ["c0", "c2", "c4", "c5", "c1"])
+    assert sorted(got) == ["c0", "c2", "c4", "c5"]
+    for cid, v in got.items():
+        assert np.argmax(v) == int(cid[1:])
+    store.add("t", "a", vecs[1:2], ["c6"])
+    assert np.argmax(store.reconstruct("t", "a", ["c6"])["c6"]) == 1
+    assert store.contains("t", "a", ["c0", "c1", "c6"]) == {"c0", "c6"}
+
+
+def _clustered(rng, n, dim, clusters):
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    xb = centers[rng.integers(0, clusters, size=n)] + 0.4 * rng.standard_normal((n, dim)).astype(np.float32)
+    return xb / np.linalg.norm(xb, axis=1, keepdims=True)
+
+
+def test_pruned_search_matches_exhaustive(tmp_path):
+    rng = np.random.default_rng(0)
+    store = FaissPerSourceStore(str(tmp_path), dedupe_threshold=None, pruning=True)
+    sources = [f"s{i}" for i in range(6)]
+    data = {}
+    for s in sources:
+        data[s] = _clustered(rng, 600, 32, 8)
+        # Added in two steps: the second goes through SourceSummary.update
+        store.add("t", s, data[s][:400], [f"{s}-{i}" for i in range(400)])
+        store.add("t", s, data[s][400:], [f"{s}-{i}" for i in range(400, 600)])
+    queries = [data[s][j] + 0.05 * rng.standard_normal(32) for s in sources for j in (0, 450)]
+    queries += [rng.standard_normal(32)]
+    for q in queries:
+        for limit in (1, 8, 40):
+            full = store.search("t", sources, q, top_k_per_source=64)[:limit]
+            assert store.search("t", sources, q, top_k_per_source=64, limit=limit) == full
+    assert store.search_stats["sources_skipped"] > 0
+
+    # With pruning off no summaries are kept and every source is searched
+    plain = FaissPerSourceStore(str(tmp_path), dedupe_threshold=None)
+    q = queries[0]
+    assert plain.search("t", sources, q, top_k_per_source=64, limit=8) == store.search("t", sources, q, top_k_per_source=64, limit=8)
+    assert plain.search_stats["sources_skipped"] == 0 and not any(plain._summaries.values())
+
+
+def test_summary_bounds_cover_every_member():
+    rng = np.random.default_rng(1)
+    xb = _clustered(rng, 2000, 16, 12)
+    index = faiss.IndexFlatIP(16)
+    index.add(xb[:1500])
+    summary = SourceSummary.fit(index, n_centroids=32, max_outliers=40)
+    assert len(summary.outliers) == 40 and summary.counts.sum() == 1460
+    summary.update(xb[1500:])
+    assert summary.counts.sum() + len(summary.outliers) == 2000
+    for q in rng.standard_normal((50, 16)).astype(np.float32):
+        q /= np.linalg.norm(q)
+        scores = xb @ q
+        bounds = summary.centroid_bounds(q)
+        assert bounds.max() >= scores.max()
+        for t in np.quantile(scores, [0.5, 0.9, 0.99]):
+            assert summary.count_above(bounds, t) >= (scores > t).sum()
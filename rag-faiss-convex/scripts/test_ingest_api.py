@@ -0,0 +1,78 @@
+"""/ingest: the per-tenant writer queue behind it, writer-lock conflicts and timeouts."""
+
+import threading
+import time
+
+from api.writer_lock import TenantWriterLock
+
+TOPICS = "payroll onboarding security travel benefits hiring laptops parking vacation training expenses badges".split()
+
+
+def _doc(i: int, source: str = "hr") -> dict:
+    return {"sourceKey": source, "title": f"doc {i}", "rawText": f"{TOPICS[i].capitalize()} policy {i}."}
+
+
+def _indexed(store) -> int:
+    return sum(len(store._load("t", source, 16)[1]) for source in ("hr", "public"))
+
+
+def test_ingest_requires_admin_and_known_sources(api):
+    _, _, client = api
+    assert client.post("/ingest", json=_doc(0), headers={"x-user-id": "alice"}).status_code == 403
+    r = client.post("/ingest", json=_doc(0, source="nope"), headers={"x-user-id": "admin"})
+    assert r.status_code == 400
+
+
+def test_concurrent_requests_share_one_write(api):
+    main, convex, client = api
+    results = []
+
+    def post(i):
+        r = client.post("/ingest", json=_doc(i, ["hr", "public"][i % 2]), headers={"x-user-id": "admin"})
+        results.append((r.status_code, r.json()))
+
+    threads = [threading.Thread(target=post, args=(i,)) for i in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(status == 200 and body["chunks"] == 1 for status, body in results)
+    # Batched by the tenant's writer: far fewer Convex writes than requests
+    assert convex.calls.count("ingest:addDocuments") < 12
+    assert _indexed(main.faiss_store) == 12
+
+
+def test_writer_lock_held_is_503(api, monkeypatch):
+    main, _, client = api
+    monkeypatch.setattr(main.ingest_queue, "lock_timeout", 0.1)
+    lock = TenantWriterLock(main.faiss_store.base_dir, "t")
+    lock.acquire()
+    try:
+        r = client.post("/ingest", json=_doc(0), headers={"x-user-id": "admin"})
+    finally:
+        lock.release()
+    assert r.status_code == 503
+    assert r.headers["retry-after"] == str(main.WRITER_BUSY_RETRY_AFTER)
+    assert client.post("/ingest", json=_doc(0), headers={"x-user-id": "admin"}).status_code == 200
+
+
+def test_timeout_leaves_the_batch_to_finish(api, monkeypatch):
+    main, _, client = api
+    monkeypatch.setattr(main, "INGEST_TIMEOUT", 0.2)
+    batcher = main._ingest_batcher(main.tenant_model("t", main.EMBED_MODEL))
+    embed = batcher.embed_fn
+
+    def slow(texts):
+        time.sleep(0.6)
+        return embed(texts)
+
+    monkeypatch.setattr(batcher, "embed_fn", slow)
+    assert client.post("/ingest", json=_doc(0), headers={"x-user-id": "admin"}).status_code == 504
+    deadline = time.monotonic() + 5
+    while _indexed(main.faiss_store) < 1 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert _indexed(main.faiss_store) == 1
+
+    # The tenant's writer survived the abandoned request
+    monkeypatch.setattr(batcher, "embed_fn", embed)
+    assert client.post("/ingest", json=_doc(1), headers={"x-user-id": "admin"}).status_code == 200
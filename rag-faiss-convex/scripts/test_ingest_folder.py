@@ -0,0 +1,132 @@
+"""ingest_folder.run_pipeline over a whole data dir and over just the changed paths."""
+
+import asyncio
+import itertools
+import os
+
+import pytest
+
+os.environ.setdefault("CONVEX_URL", "http://convex.invalid")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+from api.embed_batcher import EmbeddingBatcher
+from api.embeddings import HashingProvider
+from api.faiss_store import FaissPerSourceStore
+from scripts import ingest_folder
+
+MODEL = "hashing:16"
+
+
+class FakeConvex:
+    """The ingest mutations run_pipeline calls, in memory."""
+
+    def __init__(self):
+        self.ids = itertools.count()
+        self.docs = {}  # docId -> title
+        self.written = []  # titles, in write order
+
+    def mutation(self, path: str, args: dict):
+        if path == "ingest:addDocuments":
+            out = []
+            for doc in args["documents"]:
+                doc_id = f"d{next(self.ids)}"
+                self.docs[doc_id] = doc["title"]
+                self.written.append(doc["title"])
+                out.append({"docId": doc_id, "chunkIds": [f"c{next(self.ids)}" for _ in doc["chunks"]]})
+            return out
+        if path == "ingest:deleteDocument":
+            self.docs.pop(args["id"])
+            return 0
+        raise AssertionError(path)
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    convex = FakeConvex()
+    monkeypatch.setattr(ingest_folder, "convex_mutation", convex.mutation)
+    monkeypatch.setattr(ingest_folder, "faiss_store", FaissPerSourceStore(str(tmp_path / "faiss")))
+    data = tmp_path / "data"
+    batcher = EmbeddingBatcher(HashingProvider(MODEL, 16).embed)
+
+    def run(paths=None):
+        asyncio.run(ingest_folder.run_pipeline(
+            str(data), "t", parse_workers=1, embed_concurrency=1, convex_batch=8, queue_size=8,
+            batcher=batcher, model=MODEL, paths=paths,
+        ))
+
+    return data, convex, run
+
+
+def _write(path, text: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def test_iter_files_scoped_to_paths(tmp_path):
+    data = tmp_path / "data"
+    for rel in ("hr/a.md", "hr/sub/b.md", "hr/.hidden", "public/c.md", "top.md"):
+        _write(data / rel, "x")
+    everything = sorted(os.path.relpath(fp, data) for _, fp in ingest_folder.iter_files(str(data)))
+    assert everything == ["hr/a.md", "hr/sub/b.md", "public/c.md"]
+
+    scoped = ingest_folder.iter_files(str(data), [str(data / "hr/sub"), str(data / "public/c.md"),
+                                                  str(data / "gone.md"), str(data / "hr/.hidden")])
+    assert sorted((s, os.path.relpath(fp, data)) for s, fp in scoped) == [("hr", "hr/sub/b.md"), ("public", "public/c.md")]
+    # The data dir itself means everything
+    assert len(list(ingest_folder.iter_files(str(data), [str(data)]))) == 3
+
+
+def test_changed_paths_only(pipeline):
+    data, convex, run = pipeline
+    _write(data / "hr/a.md", "Alpha handbook.")
+    _write(data / "hr/b.md", "Beta handbook.")
+    _write(data / "hr/old/c.md", "Gamma handbook.")
+    run()
+    assert sorted(convex.written) == ["a", "b", "c"]
+
+    _write(data / "hr/a.md", "Alpha handbook, second edition.")
+    (data / "hr/old/c.md").unlink()
+    (data / "hr/old").rmdir()
+    _write(data / "public/new/d.md", "Delta notes.")
+    # Not among the changed paths: left for a later run
+    _write(data / "hr/e.md", "Epsilon handbook.")
+    convex.written.clear()
+    run([str(data / "hr/a.md"), str(data / "hr/old"), str(data / "public/new")])
+
+    assert sorted(convex.written) == ["a", "d"]
+    assert sorted(convex.docs.values()) == ["a", "b", "d"]
+    manifest = ingest_folder.IngestManifest.for_tenant(ingest_folder.faiss_store.base_dir, "t")
+    assert sorted(manifest.keys()) == ["hr/a.md", "hr/b.md", "public/new/d.md"]
+
+    convex.written.clear()
+    run([str(data)])
+    assert convex.written == ["e"]
+
+
+def _write_pdf(path, text: str):
+    canvas = pytest.importorskip("reportlab.pdfgen.canvas")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pdf = canvas.Canvas(str(path))
+    pdf.drawString(72, 720, text)
+    pdf.save()
+
+
+def test_parse_error_keeps_previous_version(pipeline):
+    pytest.importorskip("PyPDF2")
+    data, convex, run = pipeline
+    _write_pdf(data / "hr/p.pdf", "Policy handbook for everyone.")
+    _write(data / "hr/a.md", "Alpha handbook.")
+    run()
+    assert sorted(convex.docs.values()) == ["a", "p"]
+
+    # A half-written PDF fails to parse: the live version stays
+    (data / "hr/p.pdf").write_bytes((data / "hr/p.pdf").read_bytes()[:40])
+    run()
+    assert sorted(convex.docs.values()) == ["a", "p"]
+    manifest = ingest_folder.IngestManifest.for_tenant(ingest_folder.faiss_store.base_dir, "t")
+    assert sorted(manifest.keys()) == ["hr/a.md", "hr/p.pdf"]
+
+    # A file that parses to no text is retired
+    _write(data / "hr/a.md", "")
+    run()
+    assert sorted(convex.docs.values()) == ["p"]
@@ -0,0 +1,66 @@
+"""IngestJournal: replay after a crash, torn lines and compaction."""
+
+from api.ingest_journal import IngestJournal
+
+
+def test_replay_keeps_unfinished_versions(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = IngestJournal(path)
+    journal.record("a.md", "k1", "convex_pending", sourceKey="hr")
+    journal.record("a.md", "k1", "convex_done", sourceKey="hr", docId="d1", chunkIds=["c1", "c2"])
+    journal.record("b.md", "k2", "convex_pending", sourceKey="hr")
+    journal.record("c.md", "k3", "convex_done", sourceKey="hr", docId="d3", chunkIds=["c3"])
+    journal.record("c.md", "k3", "indexed")
+    journal.close()
+
+    replayed = IngestJournal(path)
+    assert replayed.resumable("a.md", "k1")["docId"] == "d1"
+    assert replayed.resumable("a.md", "k1")["chunkIds"] == ["c1", "c2"]
+    assert replayed.resumable("b.md", "k2")["stage"] == "convex_pending"
+    # Finished, and other versions of a file, are not resumable
+    assert replayed.resumable("c.md", "k3") == {}
+    assert replayed.resumable("a.md", "other") == {}
+    assert sorted(st["key"] for st in replayed.unfinished()) == ["a.md", "b.md"]
+
+
+def test_streamed_chunk_ids_accumulate(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = IngestJournal(path)
+    journal.record("big.pdf", "k", "convex_done", sourceKey="hr", docId="d", chunkIds=[])
+    journal.record("big.pdf", "k", "convex_done", appendChunkIds=["c1", "c2"])
+    journal.record("big.pdf", "k", "convex_done", appendChunkIds=["c3"])
+    journal.close()
+
+    assert IngestJournal(path).resumable("big.pdf", "k")["chunkIds"] == ["c1", "c2", "c3"]
+
+
+def test_torn_final_line_is_ignored(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = IngestJournal(path)
+    journal.record("a.md", "k1", "convex_done", sourceKey="hr", docId="d1", chunkIds=["c1"])
+    journal.close()
+    with open(path, "a") as f:
+        f.write('{"key": "a.md", "ingestKey": "k1", "stage": "inde')
+
+    replayed = IngestJournal(path)
+    assert replayed.resumable("a.md", "k1")["docId"] == "d1"
+    # Later records still append after the torn line
+    replayed.record("a.md", "k1", "indexed")
+    replayed.close()
+    assert IngestJournal(path).unfinished() == []
+
+
+def test_compact_rewrites_only_unfinished(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = IngestJournal(path)
+    for i in range(5):
+        journal.record(f"{i}.md", f"k{i}", "convex_pending", sourceKey="hr")
+    for i in range(4):
+        journal.record(f"{i}.md", f"k{i}", "discarded")
+    journal.compact()
+    journal.record("5.md", "k5", "convex_pending", sourceKey="hr")
+    journal.close()
+
+    with open(path) as f:
+        assert len(f.readlines()) == 2
+    assert sorted(st["key"] for st in IngestJournal(path).unfinished()) == ["4.md", "5.md"]
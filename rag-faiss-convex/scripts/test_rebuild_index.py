@@ -0,0 +1,107 @@
+"""scripts/rebuild_index.py, and switching the generation a store serves."""
+
+import os
+import threading
+
+import pytest
+
+from api.embed_batcher import EmbeddingBatcher
+from api.embeddings import HashingProvider, hashing_embed
+from api.faiss_store import FaissPerSourceStore
+from scripts import rebuild_index
+
+CHUNKS = [
+    {"_id": f"c{i}", "sourceKey": "hr" if i % 3 else "public", "text": f"chunk {i} about topic {i % 4}"}
+    for i in range(10)
+]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = FaissPerSourceStore(str(tmp_path), dedupe_threshold=None)
+    monkeypatch.setattr(rebuild_index, "faiss_store", store)
+
+    def query(path, args):
+        # Pages of 4, like ingest:listChunksPage
+        assert path == "ingest:listChunksPage" and args["tenantId"] == "t"
+        start = int(args["paginationOpts"]["cursor"] or 0)
+        end = start + args["paginationOpts"]["numItems"]
+        return {"page": CHUNKS[start:end], "isDone": end >= len(CHUNKS), "continueCursor": str(end)}
+
+    monkeypatch.setattr(rebuild_index, "convex_query", query)
+    # The served generation: two chunks indexed with the old model
+    store.require_model("t", "hashing:16")
+    store.add("t", "hr", hashing_embed(["old one", "old two"], 16), ["old1", "old2"])
+    return store
+
+
+def _rebuild(model="hashing:32", dim=32):
+    batcher = EmbeddingBatcher(HashingProvider(model, dim).embed)
+    return rebuild_index.rebuild("t", model, batcher, page_size=4)
+
+
+def test_rebuild_swaps_in_a_new_generation(store):
+    before = store.active_generation("t")
+    info = _rebuild()
+    assert info["model"] == "hashing:32" and info["dim"] == 32
+    assert store.active_generation("t") == info
+
+    q = hashing_embed(["chunk 4 about topic 0"], 32)[0]
+    hits = store.search("t", ["hr", "public"], q, top_k_per_source=10)
+    assert sorted(h[0] for h in hits) == sorted(c["_id"] for c in CHUNKS)
+    assert hits[0][0] == "c4"
+    # Writes with the old model are refused now
+    with pytest.raises(ValueError):
+        store.require_model("t", "hashing:16")
+
+    # A query pinned to the old generation still finishes against it
+    old = store.search("t", ["hr"], hashing_embed(["old one"], 16)[0], top_k_per_source=5, generation=before)
+    assert [h[0] for h in old][:1] == ["old1"]
+
+    assert store.prune_generations("t", keep=0) == [""]
+    assert not [n for n in os.listdir(store.tenant_dir("t")) if n.startswith("hr.")]
+
+
+def test_empty_tenant_is_not_swapped(store, monkeypatch):
+    monkeypatch.setattr(rebuild_index, "convex_query", lambda path, args: {"page": [], "isDone": True})
+    assert _rebuild() is None
+    assert store.active_generation("t")["model"] == "hashing:16"
+
+
+def test_generation_switch_is_seen_consistently(store):
+    # Two complete generations, each holding only its own ids
+    xb = hashing_embed(["x", "y"], 16)
+    for generation in ("ga", "gb"):
+        index = rebuild_index.faiss.IndexFlatIP(16)
+        index.add(xb)
+        store.write_generation_index("t", generation, "hr", index, [f"{generation}1", f"{generation}2"])
+
+    store.swap_generation("t", "ga", "hashing:16", 16)
+    errors, stop = [], threading.Event()
+
+    def swap():
+        for i in range(200):
+            store.swap_generation("t", ("ga", "gb")[i % 2], "hashing:16", 16)
+        stop.set()
+
+    def query():
+        try:
+            while not stop.is_set():
+                generation = store.active_generation("t")
+                hits = store.search("t", ["hr"], xb[0], top_k_per_source=2, generation=generation)
+                if hits and {h[0][:2] for h in hits} != {generation["generation"]}:
+                    errors.append((generation, hits))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=swap)] + [threading.Thread(target=query) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    # Queries pinned to a swapped-out generation may have reloaded it; the
+    # next swap evicts everything but the served generation
+    store.swap_generation("t", "ga", "hashing:16", 16)
+    served = store.generation_dir("t", store.active_generation("t")["generation"])
+    assert {k[1] for k in store._cache if k[0] == "t"} <= {served}
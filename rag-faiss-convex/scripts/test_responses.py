@@ -0,0 +1,130 @@
+"""Response shaping: `fields` modes, JSON encoding and content-coding negotiation."""
+
+import gzip
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from api import http_cache
+
+QUERY = np.eye(16, dtype=np.float32)[0]
+TEXT = "Expense reports are due monthly. " * 20
+
+
+class FakeChat:
+    def __init__(self):
+        self.completions = self
+
+    def create(self, model, messages):
+        message = SimpleNamespace(content="The answer – ünïcode")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+@pytest.fixture
+def chat(api, monkeypatch):
+    """/chat over six long chunks in hr."""
+    main, convex, client = api
+    rng = np.random.default_rng(0)
+    ids = [f"c{i}" for i in range(6)]
+    main.faiss_store.add("t", "hr", QUERY + 0.3 * rng.standard_normal((6, 16)).astype(np.float32), ids)
+    chunks = {
+        cid: {"_id": cid, "tenantId": "t", "sourceKey": "hr", "docId": f"d{cid}", "chunkIndex": 0, "text": TEXT}
+        for cid in ids
+    }
+    convex.handlers["chunks:getMany"] = lambda args: [chunks[i] for i in args["ids"]]
+    convex.handlers["documents:getMany"] = lambda args: [
+        {"_id": d, "title": f"Title {d}", "sourceUrl": f"https://x/{d}"} for d in args["ids"]
+    ]
+    convex.handlers["logs:add"] = lambda args: "log"
+    convex.handlers["logs:addMany"] = lambda args: [f"log{i}" for i in range(len(args["rows"]))]
+    monkeypatch.setattr(main, "_embed_queries", lambda tenant_id, texts, generation: [QUERY.tolist()] * len(texts))
+    monkeypatch.setattr(main.oa, "chat", FakeChat())
+    return client
+
+
+def _post(client, path, body, encoding="identity"):
+    r = client.post(path, json=body, headers={"x-user-id": "alice", "Accept-Encoding": encoding})
+    assert r.status_code == 200
+    return r
+
+
+def _varies(r) -> bool:
+    # Other middleware (CORS) may add to Vary
+    return "Accept-Encoding" in [v.strip() for v in r.headers["vary"].split(",")]
+
+
+@pytest.mark.parametrize("fields,omitted", [
+    ("all", set()),
+    ("text", {"snippet"}),
+    ("snippets", {"chunkText"}),
+    ("ids", {"snippet", "chunkText", "docTitle", "sourceUrl"}),
+])
+def test_fields_modes(chat, fields, omitted):
+    full = _post(chat, "/chat", {"message": "expenses"}).json()["retrieved"]
+    assert full and {"snippet", "chunkText", "docTitle", "sourceUrl"} <= set(full[0])
+    hits = _post(chat, "/chat", {"message": "expenses", "fields": fields}).json()["retrieved"]
+    assert [h["chunkId"] for h in hits] == [h["chunkId"] for h in full]
+    for hit, whole in zip(hits, full):
+        assert set(hit) == set(whole) - omitted
+        assert all(hit[k] == whole[k] for k in hit)
+    [result] = _post(chat, "/chat/batch", {"messages": ["expenses"], "fields": fields}).json()["results"]
+    assert all(set(h) == set(whole) - omitted for h in result["retrieved"])
+    r = chat.post("/chat", json={"message": "x", "fields": "nope"}, headers={"x-user-id": "alice"})
+    assert r.status_code == 422
+
+
+def test_json_encoding(api, monkeypatch):
+    _, _, client = api
+    content = {"name": "ünïcode – ok", "n": [1, 2, 3], "nested": {"a": None, "b": True}}
+    compact = json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if http_cache.HAS_ORJSON:
+        import orjson
+        assert http_cache.dumps(content) == orjson.dumps(content) == compact
+    monkeypatch.setattr(http_cache, "HAS_ORJSON", False)
+    assert http_cache.dumps(content) == compact
+    # The default response class encodes with dumps(): compact, UTF-8, not \u-escaped
+    r = client.get("/me", headers={"x-user-id": "alice"})
+    assert r.headers["content-type"] == "application/json"
+    assert r.content == http_cache.dumps(r.json())
+
+
+def test_gzip_negotiation(chat):
+    body = {"message": "expenses"}
+    plain = _post(chat, "/chat", body)
+    assert "content-encoding" not in plain.headers and _varies(plain)
+    for accept in ("gzip", "gzip, deflate", "br;q=0, gzip", "GZIP;q=0.5"):
+        r = _post(chat, "/chat", body, accept)
+        assert r.headers["content-encoding"] == "gzip" and _varies(r)
+        assert r.json() == plain.json()
+    assert "content-encoding" not in _post(chat, "/chat", body, "gzip;q=0").headers
+    # Small bodies are not worth compressing, but still vary by Accept-Encoding
+    small = _post(chat, "/chat", {"message": "expenses", "fields": "ids"}, "gzip")
+    assert len(small.content) < http_cache.MIN_COMPRESS_BYTES
+    assert "content-encoding" not in small.headers and _varies(small)
+
+
+def test_brotli_preferred_when_available(monkeypatch):
+    monkeypatch.setattr(http_cache, "HAS_BROTLI", False)
+    assert http_cache.negotiate_encoding("br, gzip") == "gzip"
+    assert http_cache.negotiate_encoding("br") is None
+
+    # With brotli installed (stubbed here), br wins over gzip
+    fake = SimpleNamespace(compress=lambda body, quality: b"br:" + body)
+    monkeypatch.setattr(http_cache, "brotli", fake, raising=False)
+    monkeypatch.setattr(http_cache, "HAS_BROTLI", True)
+    assert http_cache.negotiate_encoding("gzip, br") == "br"
+    assert http_cache.negotiate_encoding("gzip, br;q=0") == "gzip"
+    body = b"x" * http_cache.MIN_COMPRESS_BYTES
+    assert http_cache.encode_body(body, "br") == (b"br:" + body, "br")
+    assert http_cache.encode_body(body[:10], "br") == (body[:10], None)
+    packed, encoding = http_cache.encode_body(body, "gzip")
+    assert encoding == "gzip" and gzip.decompress(packed) == body
+
+
+def test_brotli_round_trip():
+    brotli = pytest.importorskip("brotli")
+    body = json.dumps({"text": TEXT}).encode()
+    packed, encoding = http_cache.encode_body(body, "br, gzip")
+    assert encoding == "br" and brotli.decompress(packed) == body
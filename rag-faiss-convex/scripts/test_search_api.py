@@ -0,0 +1,87 @@
+"""/search: cursor pagination over the ACL-filtered, collapsed candidates."""
+
+import numpy as np
+import pytest
+
+QUERY = np.eye(16, dtype=np.float32)[0]
+
+
+@pytest.fixture
+def indexed(api, monkeypatch):
+    """Twenty chunks each in hr and public; five of public's are copies of hr chunks."""
+    main, convex, client = api
+    rng = np.random.default_rng(0)
+    hr = QUERY + 0.8 * rng.standard_normal((20, 16)).astype(np.float32)
+    public = QUERY + 0.8 * rng.standard_normal((20, 16)).astype(np.float32)
+    # Copies of hr's first five chunks: collapsed at search time
+    public[:5] = hr[:5]
+    chunks = {}
+    for source, vectors in (("hr", hr), ("public", public)):
+        ids = [f"{source}{i}" for i in range(len(vectors))]
+        main.faiss_store.add("t", source, vectors, ids)
+        for cid in ids:
+            chunks[cid] = {"_id": cid, "tenantId": "t", "sourceKey": source, "docId": f"d-{cid}",
+                           "chunkIndex": 0, "text": f"chunk {cid}"}
+    convex.handlers["chunks:getMany"] = lambda args: [chunks[i] for i in args["ids"]]
+    convex.handlers["documents:getMany"] = lambda args: [{"_id": d, "title": d} for d in args["ids"]]
+    monkeypatch.setattr(main, "_embed_query", lambda tenant_id, text, generation: QUERY.tolist())
+    return main, client
+
+
+def _pages(client, user="alice", k=7, **body):
+    cursor, pages = None, []
+    while True:
+        r = client.post("/search", json={"query": "q", "k": k, "cursor": cursor, **body}, headers={"x-user-id": user})
+        assert r.status_code == 200
+        pages.append(r.json()["hits"])
+        cursor = r.json()["nextCursor"]
+        if cursor is None:
+            return pages
+
+
+def test_pages_cover_every_hit_once(indexed):
+    main, client = indexed
+    pages = _pages(client)
+    hits = [h for page in pages for h in page]
+    # 40 chunks, 5 of them copies collapsed into the better-scoring one
+    assert len(hits) == 35
+    assert all(len(page) == 7 for page in pages)
+    assert [h["rank"] for h in hits] == list(range(1, 36))
+    assert len({h["chunkId"] for h in hits}) == 35
+    assert [h["score"] for h in hits] == sorted((h["score"] for h in hits), reverse=True)
+    # The same as one big page
+    r = client.post("/search", json={"query": "q", "k": 50}, headers={"x-user-id": "alice"})
+    assert [h["chunkId"] for h in r.json()["hits"]] == [h["chunkId"] for h in hits]
+
+
+def test_pages_stop_at_search_depth(indexed, monkeypatch):
+    main, client = indexed
+    monkeypatch.setattr(main, "SEARCH_DEPTH", 10)
+    pages = _pages(client, k=4)
+    assert [len(page) for page in pages] == [4, 4, 2]
+
+
+def test_sources_narrow_but_never_widen(indexed):
+    _, client = indexed
+    hits = [h for page in _pages(client, sources=["public"]) for h in page]
+    assert {h["sourceKey"] for h in hits} == {"public"} and len(hits) == 20
+    # bob may only read public: asking for hr returns nothing
+    r = client.post("/search", json={"query": "q", "sources": ["hr"]}, headers={"x-user-id": "bob"})
+    assert r.json() == {"hits": [], "nextCursor": None}
+
+
+def test_cursor_is_bound_to_its_search(indexed):
+    _, client = indexed
+    r = client.post("/search", json={"query": "q", "k": 5}, headers={"x-user-id": "alice"})
+    cursor = r.json()["nextCursor"]
+    for user, body in (
+        ("alice", {"query": "other"}),
+        ("alice", {"query": "q", "sources": ["public"]}),
+        ("bob", {"query": "q"}),
+    ):
+        r = client.post("/search", json={**body, "cursor": cursor}, headers={"x-user-id": user})
+        assert r.status_code == 400
+    r = client.post("/search", json={"query": "q", "cursor": "not a cursor"}, headers={"x-user-id": "alice"})
+    assert r.status_code == 400 and r.json()["detail"] == "Invalid cursor"
+    r = client.post("/search", json={"query": "q", "k": 0}, headers={"x-user-id": "alice"})
+    assert r.status_code == 400
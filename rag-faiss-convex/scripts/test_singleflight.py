@@ -0,0 +1,102 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from api.singleflight import SingleFlight
+
+
+def _wait_for(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def _blocked(flights, key, n, fn):
+    """Start n calls of fn under key; fn blocks until the returned event is set."""
+    release = threading.Event()
+    entered = threading.Event()
+
+    def run():
+        entered.set()
+        release.wait(5)
+        return fn()
+
+    pool = ThreadPoolExecutor(n)
+    futures = [pool.submit(flights.do, key, run)]
+    entered.wait(5)
+    futures += [pool.submit(flights.do, key, run) for _ in range(n - 1)]
+    return pool, futures, release
+
+
+def test_followers_share_the_leaders_result():
+    flights, calls = SingleFlight(), []
+    pool, futures, release = _blocked(flights, "k", 4, lambda: calls.append(1) or "answer")
+    time.sleep(0.05)  # let the followers join
+    release.set()
+    results = [f.result(5) for f in futures]
+    pool.shutdown()
+    assert calls == [1]
+    assert results[0] == ("answer", False)
+    assert results[1:] == [("answer", True)] * 3
+    assert flights.in_flight() == 0
+
+
+def test_followers_get_the_leaders_exception():
+    flights = SingleFlight()
+
+    def fail():
+        raise ValueError("boom")
+
+    pool, futures, release = _blocked(flights, "k", 3, fail)
+    time.sleep(0.05)
+    release.set()
+    for f in futures:
+        with pytest.raises(ValueError, match="boom"):
+            f.result(5)
+    pool.shutdown()
+    assert flights.in_flight() == 0
+
+
+def test_nothing_is_cached_and_keys_are_separate():
+    flights, calls = SingleFlight(), []
+    assert flights.do("a", lambda: calls.append("a") or 1) == (1, False)
+    assert flights.do("a", lambda: calls.append("a") or 2) == (2, False)
+    assert flights.do("b", lambda: calls.append("b") or 3) == (3, False)
+    assert calls == ["a", "a", "b"]
+
+
+def test_chat_coalesces_identical_questions(api, monkeypatch):
+    main, convex, client = api
+    convex.handlers["logs:add"] = lambda args: f"log-{args['userId']}"
+    release, answered = threading.Event(), []
+
+    def answer(tenant_id, allowed_sources, message):
+        answered.append((tenant_id, tuple(allowed_sources), message))
+        release.wait(5)
+        return "yes", [], [], {"promptTokens": 7}
+
+    monkeypatch.setattr(main, "CHAT_COALESCE", True)
+    monkeypatch.setattr(main, "_answer", answer)
+
+    def ask(user, message):
+        return client.post("/chat", json={"message": message}, headers={"x-user-id": user})
+
+    with ThreadPoolExecutor(3) as pool:
+        first = pool.submit(ask, "alice", "Refund policy?")
+        _wait_for(lambda: answered)
+        # Same question (case and spacing aside) and sources: coalesced
+        second = pool.submit(ask, "alice", "refund   POLICY?")
+        _wait_for(lambda: convex.calls.count("users:get") == 2)
+        # Different sources: answered on its own
+        third = pool.submit(ask, "bob", "Refund policy?")
+        _wait_for(lambda: len(answered) == 2)
+        time.sleep(0.05)
+        release.set()
+        responses = [f.result(5).json() for f in (first, second, third)]
+
+    assert len(answered) == 2
+    assert [r["usage"]["coalesced"] for r in responses] == [False, True, False]
+    assert all(r["answer"] == "yes" for r in responses)